@@ -0,0 +1 @@
+"""Shared helpers for the genaiprompt example scripts."""
@@ -0,0 +1,5 @@
+import sys
+
+from genaiprompt.cli import main
+
+sys.exit(main())
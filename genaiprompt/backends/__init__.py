@@ -0,0 +1,28 @@
+"""
+Model backends behind one interface (see base.Backend).
+
+Backends are looked up by name and imported on first use, so selecting the
+Ollama backend never imports torch, transformers or llama_cpp.
+"""
+
+import importlib
+
+BACKENDS = {
+    "ollama": "genaiprompt.backends.ollama_backend:OllamaBackend",
+    "llama_cpp": "genaiprompt.backends.llama_cpp_backend:LlamaCppBackend",
+    "transformers": "genaiprompt.backends.transformers_backend:TransformersBackend",
+}
+
+
+def backend_class(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}' (have: {', '.join(BACKENDS)})")
+    module_name, class_name = BACKENDS[name].split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create_backend(preset, recorder=None):
+    """Instantiate the backend described by a model preset (see genaiprompt.config)."""
+    preset = dict(preset)
+    cls = backend_class(preset.pop("backend"))
+    return cls(recorder=recorder, **preset)
@@ -0,0 +1,89 @@
+"""Interface shared by the Ollama, llama.cpp and transformers backends."""
+
+import threading
+
+from genaiprompt.metrics import MetricsRecorder
+
+
+class Backend:
+    """A loaded model that can generate, stream and batch.
+
+    `params` are the backend-native generation parameters of the model
+    preset; keyword arguments passed to generate/stream/batch override them
+    per call. Every request records a GenerationMetrics in `recorder`; the
+    most recent one made on the calling thread is `last_metrics`. `last_note` carries an optional
+    one-line remark about the last request (e.g. KV-cache reuse).
+    """
+
+    name = None
+
+    def __init__(self, model, params=None, recorder=None):
+        self.model = model
+        self.params = dict(params or {})
+        self.recorder = recorder or MetricsRecorder()
+        self._local = threading.local()  # per-thread last_metrics, for concurrent requests (the server)
+        self.last_note = None
+        self.load_seconds = None
+        self._load_pending = True
+
+    @property
+    def supports_chat(self):
+        """True when requests build on a running conversation (and reset() applies)."""
+        return False
+
+    @property
+    def last_metrics(self):
+        return getattr(self._local, "metrics", None)
+
+    def load(self):
+        """Load the model; returns the load time in seconds."""
+        raise NotImplementedError
+
+    def stream(self, prompt, **params):
+        """Yield text chunks as they are generated."""
+        raise NotImplementedError
+
+    def generate(self, prompt, **params):
+        """Return the full response text."""
+        return "".join(self.stream(prompt, **params))
+
+    def batch(self, prompts, **params):
+        """Yield one dict per prompt with index, prompt, response (or error)."""
+        for index, prompt in enumerate(prompts):
+            try:
+                yield {"index": index, "prompt": prompt, "response": self.generate(prompt, **params)}
+            except Exception as e:
+                yield {"index": index, "prompt": prompt, "error": str(e)}
+
+    def cache_params(self, params=None):
+        """Parameters that identify a request's output, for the response cache."""
+        return self._merge(params or {})
+
+    def stats(self):
+        """All metrics recorded by this backend so far."""
+        return self.recorder.records
+
+    def reset(self):
+        """Forget any conversation state."""
+
+    def close(self):
+        """Release the model and any connections."""
+
+    def unload(self):
+        """Free the model's memory (e.g. on eviction); the backend is not used afterwards."""
+        self.close()
+
+    def memory_bytes(self):
+        """Memory held by the loaded model, or None if unknown."""
+        return None
+
+    def _merge(self, params):
+        return {**self.params, **params}
+
+    def _record(self, metrics):
+        # The first request after load carries the load time.
+        if self._load_pending:
+            metrics.load_seconds = self.load_seconds
+            self._load_pending = False
+        self._local.metrics = self.recorder.record(metrics)
+        return metrics
@@ -0,0 +1,147 @@
+"""llama.cpp backend; llama_cpp is imported only when the model is loaded."""
+
+import contextlib
+import os
+import time
+
+from genaiprompt import llama_cpp_tune, metrics, speculative
+from genaiprompt.backends.base import Backend
+from genaiprompt.llama_cpp_session import DEFAULT_SYSTEM_PROMPT, ChatSession
+from genaiprompt.streaming import TokenTimer, stream_llama_cpp
+from genaiprompt.templates import fit_context
+
+
+class LlamaCppBackend(Backend):
+    name = "llama_cpp"
+
+    def __init__(self, model, params=None, recorder=None, chat=False, system_prompt=DEFAULT_SYSTEM_PROMPT,
+                 truncation="drop_oldest", draft_model=None, draft_tokens=None, tuned=True, **llama_kwargs):
+        super().__init__(model, params, recorder)
+        self.chat = chat
+        self.system_prompt = system_prompt
+        self.truncation = truncation
+        # Speculative decoding: a GGUF draft model path or "prompt_lookup" (see genaiprompt.speculative).
+        self.draft_model = draft_model
+        self.draft_tokens = draft_tokens or 10
+        # Apply the profile saved by genaiprompt.llama_cpp_tune for this model file, if any.
+        self.tuned = tuned
+        self.llama_kwargs = llama_kwargs
+        self.llm = None
+        self.draft = None
+        self.session = None
+
+    @property
+    def supports_chat(self):
+        return self.session is not None
+
+    def load(self):
+        from llama_cpp import Llama
+
+        profile = llama_cpp_tune.load_profile(self.model) if self.tuned else None
+        if profile:
+            self.llama_kwargs = {**self.llama_kwargs, **llama_cpp_tune.llama_kwargs(profile["params"])}
+        notes = []
+        if profile:
+            notes.append(f"Tuned profile from {profile['tuned_at']}: {llama_cpp_tune.describe(profile['params'])}.")
+        start = time.time()
+        if self.draft_model:
+            # The draft shares the target's context size and GPU offload.
+            shared = {k: v for k, v in self.llama_kwargs.items() if k in ("n_ctx", "n_gpu_layers", "n_threads")}
+            self.draft = speculative.llama_cpp_draft(self.draft_model, self.draft_tokens, **shared)
+            self.llm = Llama(model_path=self.model, draft_model=self.draft, **self.llama_kwargs)
+            notes.append(f"Speculative decoding with {self.draft_model}.")
+        else:
+            self.llm = Llama(model_path=self.model, **self.llama_kwargs)
+        self.load_seconds = time.time() - start
+        if self.chat:
+            self.session = ChatSession(self.llm, self.model, self.system_prompt, self.truncation, **self.params)
+            restored = self.session.start()
+            notes.append("System prompt " + ("restored from snapshot." if restored else "evaluated and snapshotted."))
+        self.last_note = " ".join(notes) or None
+        return self.load_seconds
+
+    def _chat_note(self):
+        note = f"Reused {self.session.last_reused} cached prompt tokens, evaluated {self.session.last_evaluated} new."
+        if self.session.last_dropped:
+            note = f"Dropped {self.session.last_dropped} oldest turn(s) to fit the context window. " + note
+        self.last_note = note
+
+    def _count_passes(self):
+        """Context manager yielding a target pass counter for this request, or None without a draft."""
+        if self.draft is None:
+            return contextlib.nullcontext()
+        return speculative.count_llama_cpp_passes(self.llm)
+
+    def _finish_speculation(self, passes, proposed, generated, request_metrics):
+        if passes is None:
+            return
+        stats = speculative.SpeculationStats()
+        stats.target_passes = passes()
+        stats.proposed = self.draft.proposed - proposed
+        stats.generated = generated
+        request_metrics.draft_acceptance = stats.acceptance_rate
+        self.last_note = stats.summary() if not self.last_note else f"{self.last_note} {stats.summary()}"
+
+    def _fit(self, prompt, params):
+        """Merged params with max_tokens clamped to the context window; raises PromptTooLong if the prompt fills it."""
+        params = self._merge(params)
+        prompt_tokens = len(self.llm.tokenize(prompt.encode("utf-8")))
+        # max_tokens <= 0 or None already means "until the context is full" to llama.cpp.
+        max_tokens = fit_context(prompt_tokens, params.get("max_tokens") or None, self.llm.n_ctx())
+        if max_tokens is not None and max_tokens < params["max_tokens"]:
+            params["max_tokens"] = max_tokens
+            self.last_note = f"max_tokens lowered to {max_tokens} to fit the {self.llm.n_ctx()}-token context."
+        return params
+
+    def stream(self, prompt, **params):
+        metrics.reset_llama_cpp_perf(self.llm)
+        timer = TokenTimer()
+        proposed = self.draft.proposed if self.draft else 0
+        with self._count_passes() as passes:
+            if self.session:
+                yield from self.session.ask_stream(prompt, timer)
+                self._chat_note()
+            else:
+                self.last_note = None
+                yield from stream_llama_cpp(self.llm, prompt, timer, **self._fit(prompt, params))
+            request_metrics = metrics.from_llama_cpp(self.model, self.llm,
+                                                     total_seconds=time.perf_counter() - timer.start,
+                                                     ttft=timer.ttft, generated_tokens=timer.count)
+            self._finish_speculation(passes, proposed, timer.count, request_metrics)
+        self._record(request_metrics)
+
+    def generate(self, prompt, **params):
+        metrics.reset_llama_cpp_perf(self.llm)
+        start = time.time()
+        proposed = self.draft.proposed if self.draft else 0
+        with self._count_passes() as passes:
+            if self.session:
+                text, _ = self.session.ask(prompt)
+                output = self.session.last_output
+                self._chat_note()
+            else:
+                self.last_note = None
+                output = self.llm(prompt, **self._fit(prompt, params))
+                text = output["choices"][0]["text"]
+            request_metrics = metrics.from_llama_cpp(self.model, self.llm, output, total_seconds=time.time() - start)
+            self._finish_speculation(passes, proposed, output["usage"]["completion_tokens"], request_metrics)
+        self._record(request_metrics)
+        return text
+
+    def reset(self):
+        if self.session:
+            self.session.reset()
+
+    def memory_bytes(self):
+        # The weights are mmapped in full; the KV cache comes on top but is small next to them.
+        if self.llm is None:
+            return None
+        total = os.path.getsize(self.model)
+        if self.draft_model and self.draft_model != speculative.PROMPT_LOOKUP:
+            total += os.path.getsize(self.draft_model)
+        return total
+
+    def close(self):
+        if self.llm is not None and hasattr(self.llm, "close"):
+            self.llm.close()
+        self.llm = None
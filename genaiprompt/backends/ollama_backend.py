@@ -0,0 +1,61 @@
+"""Ollama backend on top of genaiprompt.ollama_client."""
+
+import time
+
+from genaiprompt.backends.base import Backend
+from genaiprompt.ollama_client import (
+    OLLAMA_DEFAULT_TEMPERATURE, OLLAMA_URL, OllamaClient, prepare_model, switch_when_pulled,
+)
+
+
+class OllamaBackend(Backend):
+    name = "ollama"
+
+    def __init__(self, model, params=None, recorder=None, url=OLLAMA_URL, keep_alive="30m", max_workers=4):
+        super().__init__(model, params, recorder)
+        self.url = url
+        self.keep_alive = keep_alive
+        self.max_workers = max_workers
+        self.client = None
+        self.pull_job = None
+
+    def load(self):
+        """Check/pull the model, warm it up and pin it with keep_alive."""
+        self.client = OllamaClient(self.model, self.url, max_workers=self.max_workers, keep_alive=self.keep_alive)
+        start = time.time()
+        self.pull_job = prepare_model(self.client)
+        self.load_seconds = time.time() - start
+        return self.load_seconds
+
+    def _options(self, params):
+        params = self._merge(params)
+        return {"options": params} if params else {}
+
+    def stream(self, prompt, **params):
+        self.pull_job = switch_when_pulled(self.client, self.pull_job, self.model)
+        result = {}
+        yield from self.client.stream(prompt, result, **self._options(params))
+        self._record(result["metrics"])
+
+    def batch(self, prompts, **params):
+        """Run prompts concurrently on the pooled client; results come back as they finish."""
+        for index, result in self.client.generate_many(prompts, **self._options(params)):
+            if "error" in result:
+                yield {"index": index, "prompt": result["prompt"], "error": result["error"]}
+                continue
+            self._record(result["metrics"])
+            yield {"index": index, "prompt": result["prompt"], "response": result["response"], "tokens": result["tokens"]}
+
+    def cache_params(self, params=None):
+        # Ollama samples at its default temperature unless told otherwise.
+        return {"temperature": OLLAMA_DEFAULT_TEMPERATURE, **self._merge(params or {})}
+
+    def unload(self):
+        # Without this the server keeps the model resident for keep_alive.
+        if self.client:
+            self.client.unload()
+        self.close()
+
+    def close(self):
+        if self.client:
+            self.client.close()
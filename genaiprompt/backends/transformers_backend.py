@@ -0,0 +1,217 @@
+"""transformers backend; torch and transformers are imported only when the model is loaded."""
+
+import os
+import time
+
+from genaiprompt import speculative
+from genaiprompt.backends.base import Backend
+from genaiprompt.continuous_batching import ContinuousBatcher
+from genaiprompt.cpu_inference import load_for_cpu
+from genaiprompt.fast_load import load_causal_lm
+from genaiprompt.metrics import GenerationMetrics
+from genaiprompt.streaming import TokenTimer, stream_transformers
+from genaiprompt.templates import DEFAULT_TEMPLATE, PromptTemplate, PromptTooLong
+from genaiprompt.transformers_batch import BatchRunner
+
+
+def resolve_hf_home(hf_home):
+    """Create and return the HF cache dir; "auto" means D:/HF_CACHE if D: exists, else C:/HF_CACHE."""
+    if hf_home == "auto":
+        cache_drive = "D" if os.path.exists("D:/") else "C"
+        hf_home = f"{cache_drive}:/HF_CACHE"
+    os.makedirs(hf_home, exist_ok=True)
+    return hf_home
+
+
+class TransformersBackend(Backend):
+    name = "transformers"
+
+    def __init__(self, model, params=None, recorder=None, torch_dtype="float16", device_map=None, max_memory=None,
+                 token=None, hf_home=None, template=DEFAULT_TEMPLATE, max_batch_size=16, fast_load=True,
+                 cpu_precision="auto", threads=None, compile_model=False, draft_model=None, draft_tokens=None,
+                 system_prompt=None, n_ctx=None, offload_folder=None):
+        super().__init__(model, params, recorder)
+        self.torch_dtype = torch_dtype
+        self.device_map = device_map
+        self.max_memory = max_memory
+        # Layers beyond the max_memory budgets go to disk here (see genaiprompt.offload_profile).
+        self.offload_folder = offload_folder
+        self.token = token
+        self.hf_home = hf_home
+        # A format string with {prompt}, or "chat" for the model's chat template (see genaiprompt.templates).
+        self.template = template
+        self.system_prompt = system_prompt
+        self.n_ctx = n_ctx
+        self.prompts = None
+        self.max_batch_size = max_batch_size
+        self.fast_load = fast_load
+        # Only used when the model runs on the CPU (see genaiprompt.cpu_inference).
+        self.cpu_precision = cpu_precision
+        self.threads = threads
+        self.compile_model = compile_model
+        self.precision = None
+        # Speculative decoding: a draft model id/path or "prompt_lookup" (see genaiprompt.speculative).
+        self.draft_model = draft_model
+        self.draft_tokens = draft_tokens
+        self.draft = None
+        self._assisted = {}
+        self.batcher = None
+        self.tokenizer = None
+        self.hf_model = None
+        self.device = None
+
+    def load(self):
+        if self.hf_home:
+            # Must be set before transformers is first imported.
+            os.environ["HF_HOME"] = resolve_hf_home(self.hf_home)
+        import torch
+
+        dtype = getattr(torch, self.torch_dtype) if isinstance(self.torch_dtype, str) and self.torch_dtype != "auto" else self.torch_dtype
+        # JSON config keys are strings; accelerate wants GPU indices as ints.
+        max_memory = {int(k) if str(k).isdigit() else k: v for k, v in (self.max_memory or {}).items()} or None
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        if device.type == "cpu" and not self.device_map:
+            # float16 is slow or unsupported in many CPU kernels; let the CPU mode pick.
+            self.hf_model, self.tokenizer, info = load_for_cpu(
+                self.model, self.cpu_precision, threads=self.threads, compile_model=self.compile_model,
+                token=self.token, fast=self.fast_load,
+            )
+        else:
+            self.hf_model, self.tokenizer, info = load_causal_lm(
+                self.model, dtype, device, device_map=self.device_map, max_memory=max_memory, token=self.token,
+                fast=self.fast_load, offload_folder=self.offload_folder,
+            )
+        if self.device_map:
+            # Always send input to the same device as the model's first layer
+            self.device = self.hf_model.hf_device_map.get("model.embed_tokens", "cuda:0" if torch.cuda.is_available() else "cpu")
+        else:
+            self.device = device
+        # Without an explicit n_ctx the budget is the model's own context length.
+        n_ctx = self.n_ctx or getattr(self.hf_model.config, "max_position_embeddings", None)
+        self.prompts = PromptTemplate(self.tokenizer, self.template, self.system_prompt, n_ctx)
+        if self.draft_model:
+            self._load_draft(info)
+        source = "local snapshot" if info["local"] else "the hub"
+        rss = f", peak RSS {info['peak_rss_mb']:.0f} MB" if info["peak_rss_mb"] else ""
+        cpu = f" CPU: {info['precision']}, {info['threads']} threads{', compiled' if info['compiled'] else ''}." if "precision" in info else ""
+        draft = f" Speculative decoding with {self.draft_model}." if self.draft_model else ""
+        self.last_note = f"Loaded from {source}{rss}.{cpu}{draft}"
+        self.precision = info.get("precision") or str(self.torch_dtype)
+        self.load_seconds = info["seconds"]
+        return self.load_seconds
+
+    def _load_draft(self, info):
+        draft_tokenizer = None
+        if self.draft_model != speculative.PROMPT_LOOKUP:
+            start = time.time()
+            self.draft, draft_tokenizer = speculative.load_transformers_draft(
+                self.draft_model, self.hf_model.dtype, self.device, token=self.token,
+            )
+            info["seconds"] += time.time() - start
+        self._assisted = speculative.assisted_kwargs(self.draft_model, self.tokenizer, self.draft, draft_tokenizer,
+                                                     self.draft_tokens)
+
+    def _speculate(self):
+        return speculative.ForwardCounter(speculative.SpeculationStats(), self.hf_model, self.draft)
+
+    def _finish_speculation(self, stats, metrics):
+        metrics.draft_acceptance = stats.acceptance_rate
+        self.last_note = stats.summary()
+
+    def _inputs(self, prompt, params):
+        """Model inputs and merged params, with max_new_tokens clamped to the context budget."""
+        import torch
+
+        ids = self.prompts.encode(prompt)
+        params = self._merge(params)
+        max_new_tokens = self.prompts.fit(len(ids), params.get("max_new_tokens"))
+        if max_new_tokens is not None and max_new_tokens < params["max_new_tokens"]:
+            params["max_new_tokens"] = max_new_tokens
+            # min_new_tokens above the new limit would make generate() complain.
+            params["min_new_tokens"] = min(params.get("min_new_tokens", 0), max_new_tokens)
+            self.last_note = f"max_new_tokens lowered to {max_new_tokens} to fit the {self.prompts.n_ctx}-token context."
+        input_ids = torch.tensor([ids], device=self.device)
+        return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}, params
+
+    def stream(self, prompt, **params):
+        self.last_note = None
+        inputs, params = self._inputs(prompt, params)
+        timer = TokenTimer()
+        with self._speculate() as stats:
+            yield from stream_transformers(self.hf_model, self.tokenizer, inputs, timer, **self._assisted, **params)
+        metrics = timer.to_metrics(self.name, self.model, prompt_tokens=inputs["input_ids"].shape[-1])
+        if self._assisted:
+            stats.generated = timer.count
+            self._finish_speculation(stats, metrics)
+        self._record(metrics)
+
+    def generate(self, prompt, **params):
+        self.last_note = None
+        inputs, params = self._inputs(prompt, params)
+        prompt_tokens = inputs["input_ids"].shape[-1]
+        start = time.time()
+        with self._speculate() as stats:
+            output_ids = self.hf_model.generate(**inputs, **self._assisted, **params)
+        elapsed = time.time() - start
+        new_ids = output_ids[0, prompt_tokens:]
+        metrics = GenerationMetrics(
+            backend=self.name, model=self.model, prompt_tokens=prompt_tokens,
+            eval_tokens=len(new_ids), generated_tokens=len(new_ids), eval_seconds=elapsed, total_seconds=elapsed,
+        )
+        if self._assisted:
+            stats.generated = len(new_ids)
+            self._finish_speculation(stats, metrics)
+        self._record(metrics)
+        return self.tokenizer.decode(new_ids, skip_special_tokens=True).strip()
+
+    def batch(self, prompts, **params):
+        """Padded, length-bucketed batches; results come back in input order.
+
+        Speculative decoding only works one sequence at a time, so batches run without it.
+        """
+        runner = BatchRunner(self.hf_model, self.tokenizer, self.model, max_batch_size=self.max_batch_size,
+                             template=self.prompts, recorder=self.recorder, **self._merge(params))
+        for index, prompt, text, tokens in runner.run(prompts):
+            if isinstance(text, PromptTooLong):
+                yield {"index": index, "prompt": prompt, "error": str(text)}
+            else:
+                yield {"index": index, "prompt": prompt, "response": text, "tokens": tokens}
+
+    def continuous_batcher(self):
+        """Shared ContinuousBatcher for concurrent requests, or None when it cannot be used.
+
+        Needs a transformers release with continuous batching; assisted
+        generation only works one sequence at a time, so not with a draft model.
+        """
+        if self.batcher is None and not self.draft_model and ContinuousBatcher.supported(self):
+            self.batcher = ContinuousBatcher(self)
+        return self.batcher
+
+    def cache_params(self, params=None):
+        # int8 or bfloat16 answers differ from float16 ones, and the template changes the prompt itself.
+        return {**super().cache_params(params), "precision": self.precision, "template": self.template,
+                "system_prompt": self.system_prompt}
+
+    def memory_bytes(self):
+        if self.hf_model is None:
+            return None
+        total = self.hf_model.get_memory_footprint()
+        if self.draft is not None:
+            total += self.draft.get_memory_footprint()
+        return total
+
+    def unload(self):
+        self.close()
+        import gc
+
+        import torch
+
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+        self.hf_model = self.tokenizer = self.draft = self.prompts = None
@@ -0,0 +1,259 @@
+"""
+Cross-backend benchmark: runs a fixed prompt set through model presets and
+records load time, TTFT, tokens/sec, p50/p95/p99 request latency and peak RSS.
+
+Two offline targets need neither a GPU nor a network:
+
+- stub-ollama: the Ollama backend against genaiprompt.stub_server, replaying
+  the captured llama4 answer at --token-rate tokens/s.
+- tiny-transformers: the transformers backend with a tiny randomly
+  initialised Llama built locally on first use (under the cache directory).
+
+Any preset from genaiprompt.config (or --config) can be benchmarked too, e.g.
+`--targets llama3-8b-gguf,llama4`. Every target runs in its own process so
+load time and peak RSS are not skewed by the other targets.
+
+    python -m genaiprompt.bench_backends --output bench.json
+    python -m genaiprompt.bench_backends --baseline bench.json --threshold 0.1
+
+With --baseline, metrics that got worse by more than --threshold (relative)
+are reported and the exit status is 1, so it can gate CI.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+
+from genaiprompt import config
+from genaiprompt.metrics import MetricsRecorder, peak_rss_bytes, percentile
+from genaiprompt.paths import cache_path
+
+BENCH_PROMPTS = [
+    "What is the capital of France?",
+    "Explain what a KV cache is in one paragraph.",
+    "Write a haiku about GPUs.",
+    "List three uses of a reverse proxy.",
+    "Please generate an ansible snippet to install an nginx podman container and expose port 443.",
+    "Summarise the difference between TCP and UDP.",
+    "Translate 'good morning' into German, French and Hungarian.",
+    "Why is the sky blue?",
+]
+DEFAULT_TARGETS = ("stub-ollama", "tiny-transformers")
+BENCH_TOKENS = 32
+
+# Metric -> True when higher is better; used by the baseline comparison.
+HIGHER_IS_BETTER = {
+    "load_seconds": False,
+    "ttft_p50": False,
+    "tokens_per_second": True,
+    "latency_p50": False,
+    "latency_p95": False,
+    "latency_p99": False,
+    "peak_rss_mb": False,
+}
+
+def build_tiny_model(path=None, prompts=BENCH_PROMPTS, layers=2):
+    """Create a tiny random Llama and word-level tokenizer at `path` (once); returns the path.
+
+    The default path is under the genaiprompt cache directory.
+    """
+    path = path or cache_path("bench", "tiny-llama-v1")
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    specials = ["<unk>", "<s>", "</s>", "<pad>"]
+    words = sorted({w.lower() for p in prompts for w in re.findall(r"\w+|[^\w\s]+", p)} | {"question", "answer", ":"})
+    vocab = {token: i for i, token in enumerate(specials + words)}
+    tok = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tok, unk_token="<unk>", bos_token="<s>", eos_token="</s>",
+                                        pad_token="<pad>")
+    torch.manual_seed(0)
+    model = LlamaForCausalLM(LlamaConfig(
+        vocab_size=len(vocab), hidden_size=64, intermediate_size=128, num_hidden_layers=layers, num_attention_heads=4,
+        num_key_value_heads=4, max_position_embeddings=512, bos_token_id=1, eos_token_id=2, pad_token_id=3,
+    ))
+    tmp = path + ".tmp"
+    tokenizer.save_pretrained(tmp)
+    model.save_pretrained(tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def target_preset(name, args, stub_url=None):
+    """The backend preset for a target name."""
+    if name == "stub-ollama":
+        return {"backend": "ollama", "model": "llama4", "url": stub_url}
+    if name == "tiny-transformers":
+        return {
+            "backend": "transformers", "model": build_tiny_model(), "torch_dtype": "float32",
+            # A fixed output length keeps tokens/sec comparable between runs.
+            "params": {"max_new_tokens": args.tokens, "min_new_tokens": args.tokens, "do_sample": False},
+        }
+    preset = dict(config.get_preset(name, args.config))
+    preset.pop("ask_token", None)
+    preset.setdefault("token", os.environ.get("HF_TOKEN") or None)
+    return preset
+
+
+def run_target(preset, prompts, warmup=1, repeat=1):
+    """Load one backend, stream every prompt through it and return the summary dict."""
+    from genaiprompt.backends import create_backend
+
+    backend = create_backend(dict(preset), recorder=MetricsRecorder())
+    try:
+        load_seconds = backend.load()
+        for prompt in prompts[:warmup]:
+            backend.generate(prompt)
+        latencies, ttfts, tokens, eval_seconds = [], [], 0, 0.0
+        for _ in range(repeat):
+            for prompt in prompts:
+                start = time.perf_counter()
+                for _ in backend.stream(prompt):
+                    pass
+                latencies.append(time.perf_counter() - start)
+                m = backend.last_metrics
+                ttfts.append(m.ttft)
+                tokens += m.eval_tokens or 0
+                eval_seconds += m.eval_seconds or 0.0
+    finally:
+        backend.close()
+    rss = peak_rss_bytes()
+    return {
+        "backend": backend.name,
+        "model": backend.model,
+        "requests": len(latencies),
+        "load_seconds": load_seconds,
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p95": percentile(ttfts, 95),
+        "tokens_per_second": tokens / eval_seconds if eval_seconds else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "peak_rss_mb": rss / 2**20 if rss else None,
+    }
+
+
+def run_isolated(preset, prompts, warmup, repeat):
+    """run_target() in a fresh interpreter so peak RSS and load time belong to this target alone."""
+    job = json.dumps({"preset": preset, "prompts": prompts, "warmup": warmup, "repeat": repeat})
+    proc = subprocess.run([sys.executable, "-m", "genaiprompt.bench_backends", "--child"], input=job,
+                          capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, threshold):
+    """Yield (target, metric, old, new, change, regressed) for metrics present in both runs."""
+    for target, new in results.items():
+        old = baseline.get(target)
+        if not old or "error" in old or "error" in new:
+            continue
+        for metric, higher_is_better in HIGHER_IS_BETTER.items():
+            if not old.get(metric) or new.get(metric) is None:
+                continue
+            change = (new[metric] - old[metric]) / old[metric]
+            worse = -change if higher_is_better else change
+            yield target, metric, old[metric], new[metric], change, worse > threshold
+
+
+def _fmt(value, spec=".3f"):
+    return "-" if value is None else format(value, spec)
+
+
+def print_table(results):
+    print(f"{'target':<20} {'load s':>7} {'ttft p50':>9} {'tok/s':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'RSS MB':>7}")
+    for target, r in results.items():
+        if "error" in r:
+            print(f"{target:<20} failed: {r['error']}")
+            continue
+        print(f"{target:<20} {_fmt(r['load_seconds'], '7.2f')} {_fmt(r['ttft_p50'], '9.3f')} "
+              f"{_fmt(r['tokens_per_second'], '8.1f')} {_fmt(r['latency_p50'], '7.3f')} {_fmt(r['latency_p95'], '7.3f')} "
+              f"{_fmt(r['latency_p99'], '7.3f')} {_fmt(r['peak_rss_mb'], '7.0f')}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark model backends on a fixed prompt set.")
+    parser.add_argument("--targets", default=",".join(DEFAULT_TARGETS),
+                        help="comma-separated targets: stub-ollama, tiny-transformers or model preset names")
+    parser.add_argument("--config", help="JSON file with extra model presets")
+    parser.add_argument("--prompts", help="prompt file (text or JSONL) instead of the built-in set")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the prompt set per target")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed prompts before measuring")
+    parser.add_argument("--tokens", type=int, default=BENCH_TOKENS, help="tokens per response for the offline targets")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="stub-ollama tokens per second")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        job = json.load(sys.stdin)
+        print(json.dumps(run_target(job["preset"], job["prompts"], job["warmup"], job["repeat"])))
+        return 0
+
+    if args.prompts:
+        from genaiprompt.transformers_batch import read_prompts
+        prompts = list(read_prompts(args.prompts))
+    else:
+        prompts = BENCH_PROMPTS
+    targets = [t for t in args.targets.split(",") if t]
+
+    server = None
+    stub_url = None
+    if "stub-ollama" in targets:
+        from genaiprompt.bench_ndjson import CAPTURE_FILE
+        from genaiprompt.stub_server import load_replay, start_stub_server
+        server = start_stub_server(tokens=args.tokens, token_delay=1 / args.token_rate, replay=load_replay(CAPTURE_FILE))
+        stub_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    results = {}
+    try:
+        for target in targets:
+            print(f"Running {target}...", file=sys.stderr)
+            try:
+                results[target] = run_isolated(target_preset(target, args, stub_url), prompts, args.warmup, args.repeat)
+            except Exception as e:
+                results[target] = {"error": str(e)}
+    finally:
+        if server:
+            server.shutdown()
+
+    print_table(results)
+    if args.output:
+        report = {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "prompts": len(prompts),
+            "repeat": args.repeat,
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = 0
+        print(f"\nCompared with {args.baseline} (regression threshold {args.threshold:.0%}):")
+        for target, metric, old, new, change, regressed in compare(results, baseline, args.threshold):
+            regressions += regressed
+            flag = "  REGRESSION" if regressed else ""
+            print(f"  {target:<20} {metric:<18} {old:10.3f} -> {new:10.3f} ({change:+.1%}){flag}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Micro-benchmark for NDJSON stream decoding.
+
+Replays a recorded /api/generate stream through the old per-line
+`json.loads(line.decode())` path and through genaiprompt.ndjson with each
+available JSON backend. Without --file a stream is synthesized from the
+captured answer in prompt-for-cli-prompt-ollama-llama4.py.txt.
+
+Record a real stream with:
+    curl -sN http://localhost:11434/api/generate -d '{"model": "llama4", "prompt": "hi"}' > stream.ndjson
+
+    python -m genaiprompt.bench_ndjson [--file stream.ndjson] [--repeat 200]
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+
+import requests
+
+from genaiprompt import ndjson
+
+CAPTURE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompt-for-cli-prompt-ollama-llama4.py.txt")
+
+
+def synthesize_stream(path=CAPTURE_FILE):
+    """Build an Ollama-style NDJSON stream (one line per token) from a captured answer."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    tokens = re.findall(r"\s*\S+", text)
+    lines = [
+        json.dumps({"model": "llama4", "created_at": "2025-04-06T12:00:00.000000Z", "response": token, "done": False})
+        for token in tokens
+    ]
+    lines.append(json.dumps({
+        "model": "llama4", "created_at": "2025-04-06T12:03:07.500000Z", "response": "", "done": True,
+        "done_reason": "stop", "context": list(range(len(tokens) + 40)),
+        "total_duration": 187500000000, "load_duration": 2673930000,
+        "prompt_eval_count": 40, "prompt_eval_duration": 2673540000,
+        "eval_count": len(tokens), "eval_duration": 182000000000,
+    }))
+    return ("\n".join(lines) + "\n").encode()
+
+
+class ReplayRaw:
+    """Stands in for urllib3's response, handing back the recorded chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def stream(self, chunk_size=None, decode_content=True):
+        return iter(self.chunks)
+
+
+def replay_response(chunks):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.raw = ReplayRaw(chunks)
+    return resp
+
+
+def old_path(chunks):
+    for line in replay_response(chunks).iter_lines():
+        if line:
+            try:
+                json.loads(line.decode()).get("response", "")
+            except Exception:
+                continue
+
+
+def new_path(chunks, backend):
+    for msg in ndjson.iter_response(replay_response(chunks), ndjson.GENERATE_FIELDS, backend):
+        msg.get("response")
+
+
+def bench(name, func, repeat, token_count):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = time.perf_counter() - start
+    per_token = elapsed / (repeat * token_count) * 1e6
+    print(f"{name:<28} {elapsed:7.3f}s  {per_token:6.2f} us/token")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark NDJSON stream decoding backends.")
+    parser.add_argument("--file", help="recorded NDJSON stream (default: synthesized from the llama4 capture)")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            data = f.read()
+    else:
+        data = synthesize_stream()
+    # One network chunk per line, which is how Ollama flushes tokens.
+    chunks = [line + b"\n" for line in data.split(b"\n") if line]
+    print(f"Replaying {len(chunks)} messages x {args.repeat}")
+
+    bench("iter_lines + json.loads", lambda: old_path(chunks), args.repeat, len(chunks))
+    for backend in ndjson.BACKENDS:
+        bench(f"ndjson ({backend})", lambda backend=backend: new_path(chunks, backend), args.repeat, len(chunks))
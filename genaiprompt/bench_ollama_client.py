@@ -0,0 +1,56 @@
+"""
+Benchmark the pooled Ollama client against one-shot requests.post calls.
+
+Runs against the local stub server, so no Ollama install is needed:
+
+    python -m genaiprompt.bench_ollama_client --prompts 200 --workers 8
+"""
+
+import argparse
+import json
+import time
+
+import requests
+
+from genaiprompt.ollama_client import OllamaClient
+from genaiprompt.stub_server import start_stub_server
+
+
+def run_unpooled(url, model, prompts):
+    """The old per-prompt path: a fresh connection and strictly serial."""
+    for prompt in prompts:
+        with requests.post(f"{url}/api/generate", json={"model": model, "prompt": prompt, "stream": True}, stream=True) as resp:
+            for line in resp.iter_lines():
+                if line:
+                    json.loads(line.decode())
+
+
+def run_pooled(url, model, prompts, workers):
+    with OllamaClient(model, url, max_workers=workers) as client:
+        for _ in client.generate_many(prompts):
+            pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pooled Ollama client.")
+    parser.add_argument("--prompts", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--tokens", type=int, default=50, help="tokens streamed per response")
+    parser.add_argument("--token-delay", type=float, default=0.001, help="seconds between tokens")
+    args = parser.parse_args()
+
+    server = start_stub_server(tokens=args.tokens, token_delay=args.token_delay)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    prompts = [f"prompt {i}" for i in range(args.prompts)]
+    try:
+        for name, run in (
+            ("unpooled serial", lambda: run_unpooled(url, "llama4", prompts)),
+            ("pooled, 1 worker", lambda: run_pooled(url, "llama4", prompts, 1)),
+            (f"pooled, {args.workers} workers", lambda: run_pooled(url, "llama4", prompts, args.workers)),
+        ):
+            start = time.time()
+            run()
+            elapsed = time.time() - start
+            print(f"{name:<22} {elapsed:7.2f}s  {len(prompts) / elapsed:8.1f} prompts/s")
+    finally:
+        server.shutdown()
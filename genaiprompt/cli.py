@@ -0,0 +1,161 @@
+"""
+Single entry point for every model preset.
+
+    python -m genaiprompt --model llama4
+    python -m genaiprompt --model llama3-8b-gguf --chat
+    python -m genaiprompt --model llama3-8b --batch prompts.txt > answers.jsonl
+    python -m genaiprompt --list
+
+The pytorch-*.py, llama_cpp-*.py and ollama-*.py scripts call main() with
+their preset name, so both ways of starting a model behave the same.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+from genaiprompt import config
+from genaiprompt.backends import create_backend
+from genaiprompt.cpu_inference import PRECISIONS
+from genaiprompt.fast_load import needs_token
+from genaiprompt.metrics import default_recorder
+from genaiprompt.response_cache import default_cache
+from genaiprompt.streaming import echo
+from genaiprompt.transformers_batch import read_prompts
+
+CALCULATING = "Calculating response..."
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m genaiprompt", description="Chat with a local LLM on any backend.")
+    parser.add_argument("--model", help="model preset name (see --list)")
+    parser.add_argument("--config", help="JSON file with extra or overriding model presets")
+    parser.add_argument("--list", action="store_true", help="list the model presets and exit")
+    parser.add_argument("--no-stream", action="store_true", help="print the answer only once it is complete")
+    parser.add_argument("--chat", action="store_true", help="keep the conversation across turns (llama.cpp)")
+    parser.add_argument("--batch", nargs="?", const="-", metavar="FILE",
+                        help="answer every prompt in FILE (or stdin) and write JSONL to stdout")
+    parser.add_argument("--draft", metavar="MODEL",
+                        help="speculative decoding with a small draft model (HF id or .gguf) or 'prompt_lookup'")
+    parser.add_argument("--draft-tokens", type=int, help="tokens the draft proposes per round")
+    cpu = parser.add_argument_group("CPU inference (transformers models without a GPU)")
+    cpu.add_argument("--cpu-precision", choices=PRECISIONS, help="default: auto (bfloat16 if supported, else float32)")
+    cpu.add_argument("--threads", type=int, help="intra-op threads (default: physical cores)")
+    cpu.add_argument("--compile", action="store_true", help="apply torch.compile to the forward pass")
+    args = parser.parse_args(argv)
+    if not args.list and not args.model:
+        parser.error("--model is required")
+    return args
+
+
+def build_backend(preset, batch_mode=False, chat=False, cpu_options=None, draft=None, recorder=None):
+    """Create the backend for a preset, applying the CLI-only preset options."""
+    preset = dict(preset)
+    if cpu_options:
+        if preset["backend"] != "transformers":
+            raise SystemExit(f"--cpu-precision/--threads/--compile need a transformers model, not {preset['backend']}")
+        preset.update(cpu_options)
+    # Models already in the local snapshot index load without the hub, so no token is needed.
+    if preset.pop("ask_token", False) and not preset.get("token") and needs_token(preset["model"]):
+        # Batch mode reads the token from HF_TOKEN; stdin may hold the prompts.
+        if batch_mode:
+            preset["token"] = os.environ.get("HF_TOKEN") or None
+        else:
+            preset["token"] = input("Enter your Hugging Face token (leave blank to use default login): ").strip() or None
+    if draft:
+        if preset["backend"] not in ("llama_cpp", "transformers"):
+            raise SystemExit(f"--draft needs a llama_cpp or transformers model, not {preset['backend']}")
+        preset.update(draft)
+    if chat:
+        if preset["backend"] != "llama_cpp":
+            raise SystemExit(f"--chat needs a llama_cpp model, not {preset['backend']}")
+        preset["chat"] = True
+    return create_backend(preset, recorder=recorder or default_recorder())
+
+
+def run_batch(backend, source, out=None):
+    out = out or sys.stdout
+    start = time.time()
+    count = 0
+    for record in backend.batch(read_prompts(source)):
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+        count += 1
+    print(f"Generated {count} responses in {time.time() - start:.1f}s.", file=sys.stderr)
+
+
+def interactive(backend, stream=True):
+    cache = default_cache()
+    while True:
+        prompt = input("\nEnter your prompt (or type 'exit' to quit):\n> ")
+        if prompt.strip().lower() == "exit":
+            if cache:
+                print(cache.summary())
+            break
+        if backend.supports_chat and prompt.strip().lower() == "reset":
+            backend.reset()
+            print("Conversation reset.")
+            continue
+
+        def run():
+            if stream:
+                return echo(backend.stream(prompt), clear=len(CALCULATING))
+            return backend.generate(prompt)
+
+        print(CALCULATING, end="", flush=True)
+        start = time.time()
+        try:
+            # Chat answers depend on the conversation so far, so they are never cached.
+            if cache and not backend.supports_chat:
+                text, hit = cache.get_or_generate(backend.name, backend.model, prompt, backend.cache_params(), run)
+            else:
+                text, hit = run(), False
+        except Exception as e:
+            print(f"\rError: {e}")
+            continue
+        elapsed = time.time() - start
+        if hit or not stream:
+            print(f"\rResponse ready in {elapsed:.1f} seconds{' (cached)' if hit else ''}.\n")
+            print(text.strip())
+        if not hit:
+            if backend.last_note:
+                print("\n" + backend.last_note)
+            print("\n" + backend.last_metrics.summary())
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.list:
+        for name, preset in sorted(config.load_models(args.config).items()):
+            print(f"{name:<18} {preset.get('backend', '?'):<13} {preset.get('model', '?')}")
+        return
+    preset = config.get_preset(args.model, args.config)
+    cpu_options = {
+        key: value for key, value in
+        (("cpu_precision", args.cpu_precision), ("threads", args.threads), ("compile_model", args.compile)) if value
+    }
+    draft = {"draft_model": args.draft, "draft_tokens": args.draft_tokens} if args.draft else None
+    backend = build_backend(preset, batch_mode=args.batch is not None, chat=args.chat, cpu_options=cpu_options,
+                            draft=draft)
+    log = sys.stderr if args.batch is not None else sys.stdout
+    try:
+        try:
+            # Keep stdout clean for the JSONL records in batch mode.
+            with contextlib.redirect_stdout(log):
+                load_seconds = backend.load()
+        except Exception as e:
+            print(f"Loading '{args.model}' failed: {e}", file=log)
+            return 1
+        print(f"Model '{args.model}' ({backend.name}) loaded in {load_seconds:.1f} seconds.", file=log)
+        if backend.last_note:
+            print(backend.last_note, file=log)
+        if args.batch is not None:
+            run_batch(backend, args.batch)
+        else:
+            print("Type your prompt and press Enter. Type 'exit' to quit.")
+            interactive(backend, stream=not args.no_stream)
+    finally:
+        backend.close()
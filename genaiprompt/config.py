@@ -0,0 +1,94 @@
+"""
+Model presets for `python -m genaiprompt`.
+
+Each preset names a backend, the model (Ollama name, GGUF path or HF repo
+id), backend-native generation `params` and any backend options. The
+built-in presets reproduce the seven original scripts; a JSON file passed
+with --config (or named by $GENAIPROMPT_MODELS) adds presets or overrides
+fields of existing ones:
+
+    {"llama3-8b-gguf": {"model": "/models/llama3.gguf"},
+     "phi3": {"backend": "ollama", "model": "phi3"}}
+"""
+
+import copy
+import json
+import os
+
+OLLAMA_PARAMS = {}
+LLAMA_CPP_PARAMS = {"max_tokens": 256, "temperature": 0.7, "top_p": 0.95}
+TRANSFORMERS_PARAMS = {"max_new_tokens": 150, "do_sample": True, "top_p": 0.8, "top_k": 10, "temperature": 0.7}
+
+MODELS = {
+    "llama4": {"backend": "ollama", "model": "llama4", "params": OLLAMA_PARAMS},
+    "mistral": {"backend": "ollama", "model": "mistral", "params": OLLAMA_PARAMS},
+    "llama3-8b-gguf": {
+        "backend": "llama_cpp",
+        "model": "./meta-llama-3-8b.Q4_K_M.gguf",
+        "params": LLAMA_CPP_PARAMS,
+        "n_ctx": 4096,
+        "n_gpu_layers": -1,  # Full GPU offload
+        "verbose": False,
+    },
+    "llama4-17b-gguf": {
+        "backend": "llama_cpp",
+        "model": "./Llama-4-Scout-17B-6E-Instruct.i1-Q4_K_S.gguf",
+        "params": LLAMA_CPP_PARAMS,
+        "n_ctx": 4096,
+        "n_gpu_layers": -1,
+        "verbose": False,
+    },
+    "llama2-7b": {
+        "backend": "transformers",
+        "model": "meta-llama/Llama-2-7b-chat-hf",
+        "params": TRANSFORMERS_PARAMS,
+        "template": "chat",
+        "torch_dtype": "float16",
+        "hf_home": "auto",
+        "ask_token": True,
+    },
+    "llama3-8b": {
+        "backend": "transformers",
+        "model": "meta-llama/Llama-3.1-8B-Instruct",
+        "params": TRANSFORMERS_PARAMS,
+        "template": "chat",  # the Instruct model's own chat template
+        "n_ctx": 4096,  # the model allows 128K; keep prompts and KV cache at the GGUF presets' size
+        "torch_dtype": "float16",
+        "hf_home": "auto",
+        "ask_token": True,
+    },
+    "llama2-70b": {
+        "backend": "transformers",
+        "model": "meta-llama/Llama-2-70b-chat-hf",
+        "params": TRANSFORMERS_PARAMS,
+        "template": "chat",
+        # float16 halves RAM and disk reads compared with float32; offloaded layers keep it.
+        "torch_dtype": "float16",
+        "device_map": "auto",
+        # Hybrid CPU/GPU offload: GPU 0 memory limit, CPU memory limit
+        "max_memory": {0: "24GiB", "cpu": "48GiB"},
+        "hf_home": "auto",
+        "ask_token": True,
+    },
+}
+
+
+def load_models(path=None):
+    """Return the built-in presets merged with those from a JSON config file."""
+    models = copy.deepcopy(MODELS)
+    path = path or os.environ.get("GENAIPROMPT_MODELS")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for name, preset in json.load(f).items():
+                models.setdefault(name, {}).update(preset)
+    return models
+
+
+def get_preset(name, path=None):
+    models = load_models(path)
+    if name not in models:
+        raise KeyError(f"Unknown model '{name}' (have: {', '.join(sorted(models))})")
+    preset = models[name]
+    if "backend" not in preset or "model" not in preset:
+        raise ValueError(f"Model preset '{name}' needs at least 'backend' and 'model'")
+    return preset
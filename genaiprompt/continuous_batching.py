@@ -0,0 +1,85 @@
+"""
+Continuous batching for a loaded transformers backend.
+
+Concurrent requests share every forward pass: requests join the running
+batch at the next decode step and leave it as soon as they finish or are
+cancelled, instead of waiting for a whole padded batch to complete. This
+uses the continuous-batching manager of recent transformers releases
+(`model.init_continuous_batching()`) and only pays off on a GPU: its paged
+attention runs as many small ops per step, which on the CPU costs more than
+the shared weight reads save. supported() is False there and with older
+releases, and the server falls back to one request at a time.
+
+Sampling settings come from the backend's preset params when the manager
+starts; per request only max_new_tokens can change.
+"""
+
+import threading
+
+from genaiprompt.streaming import TokenTimer
+
+
+class ContinuousBatcher:
+    def __init__(self, backend):
+        self.backend = backend
+        self.manager = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def supported(backend):
+        if getattr(backend, "hf_model", None) is None or not str(backend.device).startswith("cuda"):
+            return False
+        return hasattr(backend.hf_model, "init_continuous_batching")
+
+    def _ensure_started(self):
+        with self._lock:
+            if self.manager is None:
+                from transformers import GenerationConfig
+
+                tokenizer = self.backend.tokenizer
+                config = GenerationConfig(**self.backend.params, eos_token_id=tokenizer.eos_token_id,
+                                          pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id)
+                self.manager = self.backend.hf_model.init_continuous_batching(generation_config=config)
+                self.manager.start()
+        return self.manager
+
+    def stream(self, prompt, max_new_tokens=None, should_stop=None, result=None):
+        """Yield text deltas for one request; stops (and frees its batch slot) once should_stop() is true.
+
+        If given, `result` is filled with prompt_tokens and tokens (generated so
+        far). Finished requests are recorded in the backend's metrics.
+        """
+        manager = self._ensure_started()
+        tokenizer = self.backend.tokenizer
+        input_ids = self.backend.prompts.encode(prompt)
+        max_new_tokens = self.backend.prompts.fit(len(input_ids), max_new_tokens)
+        request_id = manager.add_request(input_ids, max_new_tokens=max_new_tokens, streaming=True)
+        result = result if result is not None else {}
+        result.update(prompt_tokens=len(input_ids), tokens=0)
+        timer = TokenTimer()
+        emitted = ""
+        finished = False
+        try:
+            for output in manager.request_id_iter(request_id):
+                if len(output.generated_tokens) > result["tokens"]:
+                    timer.tick(len(output.generated_tokens) - result["tokens"])
+                    result["tokens"] = len(output.generated_tokens)
+                text = tokenizer.decode(output.generated_tokens, skip_special_tokens=True)
+                # A trailing U+FFFD is a multi-byte character still being generated.
+                if len(text) > len(emitted) and not text.endswith("�"):
+                    yield text[len(emitted):]
+                    emitted = text
+                if should_stop and should_stop():
+                    return
+            finished = True
+            self.backend._record(timer.to_metrics(self.backend.name, self.backend.model,
+                                                  prompt_tokens=len(input_ids)))
+        finally:
+            if not finished:
+                manager.cancel_request(request_id)
+
+    def close(self):
+        with self._lock:
+            if self.manager is not None:
+                self.manager.stop(block=True)
+                self.manager = None
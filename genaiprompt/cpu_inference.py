@@ -0,0 +1,193 @@
+"""
+CPU inference mode for the transformers backend.
+
+float16 is slow or unsupported in many CPU kernels, so on a CPU-only node
+the backend picks a precision itself: bfloat16 when the CPU has native
+bf16 support (AVX512-BF16/AMX, checked through oneDNN), otherwise float32.
+"int8" applies dynamic int8 quantization to the linear layers; the
+quantized model is cached on disk (under the genaiprompt cache directory),
+so the quantization cost is only paid on the first run. Thread counts are
+set to the number of physical cores, and torch.compile can be applied to
+the forward pass.
+
+Compare precisions, each in a fresh process:
+
+    python -m genaiprompt.cpu_inference meta-llama/Llama-2-7b-chat-hf --precisions float32,bfloat16,int8
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from genaiprompt.fast_load import load_causal_lm, local_snapshot
+from genaiprompt.metrics import peak_rss_bytes
+from genaiprompt.paths import cache_path
+
+PRECISIONS = ("auto", "float32", "bfloat16", "int8")
+
+
+def physical_cores():
+    try:
+        import psutil
+
+        cores = psutil.cpu_count(logical=False)
+    except ImportError:
+        cores = None
+    return cores or os.cpu_count() or 1
+
+
+def configure_threads(threads=None):
+    """Use one intra-op thread per physical core; returns the thread count."""
+    import torch
+
+    threads = threads or physical_cores()
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(max(1, threads // 2))
+    except RuntimeError:
+        pass  # Can only be set once, before any inter-op work has started.
+    return threads
+
+
+def bf16_supported():
+    import torch
+
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def resolve_precision(precision="auto"):
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown CPU precision '{precision}' (have: {', '.join(PRECISIONS)})")
+    if precision == "auto":
+        return "bfloat16" if bf16_supported() else "float32"
+    return precision
+
+
+def quantized_path(model_id):
+    """Cache file for the int8 model, or None while the model is not downloaded (its revision is unknown)."""
+    import torch
+
+    if os.path.isdir(model_id):
+        revision = os.path.abspath(model_id)
+    else:
+        snapshot = local_snapshot(model_id)
+        if snapshot is None:
+            return None
+        # Hub snapshots live in .../snapshots/<commit hash>.
+        revision = os.path.basename(os.path.normpath(snapshot))
+    # A new revision or torch version invalidates the pickled model.
+    key = hashlib.sha1(f"{model_id}|{revision}|{torch.__version__}".encode()).hexdigest()[:16]
+    return cache_path("quantized", f"{key}-int8.pt")
+
+
+def quantize_int8(model):
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_int8(model_id, token=None, fast=True):
+    """Dynamic-int8 model and tokenizer, from the on-disk cache when available; returns (model, tokenizer, info)."""
+    import torch
+    from transformers import AutoTokenizer
+
+    path = quantized_path(model_id)
+    if path is None or not os.path.exists(path):
+        model, tokenizer, info = load_causal_lm(model_id, torch.float32, "cpu", token=token, fast=fast)
+        start = time.time()
+        model = quantize_int8(model)
+        # Resolved again: a first load has just downloaded the snapshot that names the revision.
+        path = path or quantized_path(model_id)
+        if path:
+            tmp = path + ".tmp"
+            torch.save(model, tmp)
+            os.replace(tmp, path)
+        info["quantize_seconds"] = time.time() - start
+        info["seconds"] += info["quantize_seconds"]
+        info["quantized_cache"] = "written" if path else "skipped"
+        return model, tokenizer, info
+    start = time.time()
+    snapshot = local_snapshot(model_id)
+    tokenizer = AutoTokenizer.from_pretrained(snapshot or model_id, token=token, local_files_only=bool(snapshot))
+    # Our own cache file: quantized modules are pickled whole, which needs weights_only=False.
+    model = torch.load(path, weights_only=False)
+    rss = peak_rss_bytes()
+    info = {
+        "source": path, "local": True, "seconds": time.time() - start,
+        "peak_rss_mb": rss / 2**20 if rss else None, "quantized_cache": "hit",
+    }
+    return model, tokenizer, info
+
+
+def load_for_cpu(model_id, precision="auto", threads=None, compile_model=False, token=None, fast=True):
+    """Load a model for CPU inference; returns (model, tokenizer, info) with the chosen precision and threads."""
+    import torch
+
+    threads = configure_threads(threads)
+    precision = resolve_precision(precision)
+    if precision == "int8":
+        model, tokenizer, info = load_int8(model_id, token=token, fast=fast)
+    else:
+        model, tokenizer, info = load_causal_lm(model_id, getattr(torch, precision), "cpu", token=token, fast=fast)
+    model.eval()
+    if compile_model:
+        model.forward = torch.compile(model.forward, dynamic=True)
+    info.update(precision=precision, threads=threads, compiled=compile_model)
+    return model, tokenizer, info
+
+
+def _child(args):
+    import torch
+
+    model, tokenizer, info = load_for_cpu(args.model, args.child, threads=args.threads, compile_model=args.compile,
+                                          token=os.environ.get("HF_TOKEN"))
+    inputs = tokenizer("Question: Why is the sky blue?\nAnswer:", return_tensors="pt")
+    gen = {"max_new_tokens": args.tokens, "min_new_tokens": args.tokens, "do_sample": False}
+    with torch.inference_mode():
+        model.generate(**inputs, **gen)  # warm-up; with --compile this also triggers compilation
+        start = time.time()
+        model.generate(**inputs, **gen)
+        elapsed = time.time() - start
+    rss = peak_rss_bytes()
+    info.update(tokens_per_second=args.tokens / elapsed, peak_rss_mb=rss / 2**20 if rss else None)
+    print(json.dumps(info))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare CPU inference precisions.")
+    parser.add_argument("model", help="HF repo id or local model directory")
+    parser.add_argument("--precisions", default="float32,bfloat16,int8")
+    parser.add_argument("--tokens", type=int, default=32, help="tokens generated per measurement")
+    parser.add_argument("--threads", type=int, help="intra-op threads (default: physical cores)")
+    parser.add_argument("--compile", action="store_true", help="apply torch.compile to the forward pass")
+    parser.add_argument("--child", choices=PRECISIONS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args)
+        sys.exit(0)
+
+    print(f"{'precision':<10} {'threads':>7} {'load s':>7} {'tok/s':>8} {'peak RSS MB':>12}  notes")
+    for precision in args.precisions.split(","):
+        cmd = [sys.executable, "-m", "genaiprompt.cpu_inference", args.model, "--child", precision,
+               "--tokens", str(args.tokens)]
+        if args.threads:
+            cmd += ["--threads", str(args.threads)]
+        if args.compile:
+            cmd.append("--compile")
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode:
+            print(f"{precision:<10} failed: {proc.stderr.strip().splitlines()[-1]}")
+            continue
+        info = json.loads(proc.stdout.strip().splitlines()[-1])
+        notes = f"quantized cache {info['quantized_cache']}" if "quantized_cache" in info else ""
+        rss = f"{info['peak_rss_mb']:.0f}" if info["peak_rss_mb"] else "-"
+        print(f"{info['precision']:<10} {info['threads']:>7} {info['seconds']:7.2f} {info['tokens_per_second']:8.1f} "
+              f"{rss:>12}  {notes}")
@@ -0,0 +1,174 @@
+"""
+Fast model loading for the transformers backend.
+
+- Models already in the Hugging Face cache are resolved to their local
+  snapshot directory and loaded with local_files_only, so startup makes no
+  hub round-trip. Resolved snapshots are remembered in an index under the
+  genaiprompt cache directory, which also lets the CLI skip the token prompt.
+- Weights are loaded with low_cpu_mem_usage from memory-mapped safetensors
+  straight into the target dtype and device (or device map), instead of
+  materializing a full CPU copy and then calling .to(device).
+
+Compare the default and fast paths, each in a fresh process (the first run
+of each is the cold one; later runs hit the OS page cache):
+
+    python -m genaiprompt.fast_load meta-llama/Llama-3.1-8B-Instruct --dtype float16 --runs 2
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+from genaiprompt.metrics import peak_rss_bytes
+from genaiprompt.paths import cache_path
+
+def _index_path():
+    # Resolved on use: cache_path() creates the cache directory, which importing should not.
+    return cache_path("hf-snapshots.json")
+
+
+def _read_index():
+    try:
+        with open(_index_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def remember_snapshot(model_id, path):
+    index = _read_index()
+    if index.get(model_id) != path:
+        index[model_id] = path
+        path = _index_path()
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp, path)
+
+
+def indexed_snapshot(model_id):
+    """The remembered local snapshot for a model id, if it still exists; never touches the hub library."""
+    if os.path.isdir(model_id):
+        return model_id
+    path = _read_index().get(model_id)
+    if path and os.path.exists(os.path.join(path, "config.json")):
+        return path
+    return None
+
+
+def local_snapshot(model_id):
+    """Local directory holding a complete copy of `model_id`, or None if it must be downloaded.
+
+    Checks the index first, then the Hugging Face cache (offline). HF_HOME must
+    be set before this is first called.
+    """
+    path = indexed_snapshot(model_id)
+    if path:
+        return path
+    try:
+        from huggingface_hub import snapshot_download
+
+        path = snapshot_download(model_id, local_files_only=True)
+    except Exception:
+        return None
+    if not os.path.exists(os.path.join(path, "config.json")):
+        return None
+    remember_snapshot(model_id, path)
+    return path
+
+
+def needs_token(model_id):
+    """True when loading `model_id` may need a hub token we do not have yet."""
+    return not (indexed_snapshot(model_id) or os.environ.get("HF_TOKEN"))
+
+
+def has_safetensors(path):
+    return bool(path) and bool(glob.glob(os.path.join(path, "*.safetensors")))
+
+
+def load_causal_lm(model_id, dtype, device, device_map=None, max_memory=None, token=None, fast=True,
+                   offload_folder=None):
+    """Load tokenizer and model; returns (model, tokenizer, info).
+
+    `device` is where the model goes when no `device_map` is given; with a
+    device map, `offload_folder` lets layers that fit neither the GPUs nor
+    the CPU budget be offloaded to disk. `info`
+    has the resolved source, whether it was a local snapshot, the load time
+    and the peak RSS after loading.
+    """
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    start = time.time()
+    path = local_snapshot(model_id) if fast else None
+    source = path or model_id
+    kwargs = {"token": token, "local_files_only": True} if path else {"token": token}
+    tokenizer = AutoTokenizer.from_pretrained(source, **kwargs)
+    kwargs["torch_dtype"] = dtype
+    if device_map and offload_folder:
+        kwargs["offload_folder"] = offload_folder
+    if fast:
+        if has_safetensors(path):
+            kwargs["use_safetensors"] = True
+        # Loads shard by shard onto the final device(s); no intermediate full CPU copy.
+        model = AutoModelForCausalLM.from_pretrained(
+            source, low_cpu_mem_usage=True, device_map=device_map or str(device), max_memory=max_memory, **kwargs,
+        )
+    else:
+        if device_map:
+            model = AutoModelForCausalLM.from_pretrained(source, device_map=device_map, max_memory=max_memory, **kwargs)
+        else:
+            model = AutoModelForCausalLM.from_pretrained(source, **kwargs).to(device)
+    if fast and not path:
+        # Downloaded just now; remember the snapshot for the next start.
+        local_snapshot(model_id)
+    rss = peak_rss_bytes()
+    info = {
+        "source": source,
+        "local": bool(path),
+        "seconds": time.time() - start,
+        "peak_rss_mb": rss / 2**20 if rss else None,
+    }
+    return model, tokenizer, info
+
+
+def _child(args):
+    import torch
+
+    dtype = getattr(torch, args.dtype) if args.dtype != "auto" else "auto"
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    _, _, info = load_causal_lm(args.model, dtype, device, device_map=args.device_map,
+                                token=os.environ.get("HF_TOKEN"), fast=args.path == "fast")
+    print(json.dumps(info))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare default and fast model loading.")
+    parser.add_argument("model", help="HF repo id or local model directory")
+    parser.add_argument("--dtype", default="float16")
+    parser.add_argument("--device-map", help="e.g. auto for multi-device/offload loading")
+    parser.add_argument("--runs", type=int, default=2, help="fresh-process loads per path")
+    parser.add_argument("--path", choices=("default", "fast"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.path:
+        _child(args)
+        sys.exit(0)
+
+    print(f"{'path':<8} {'run':>3} {'seconds':>8} {'peak RSS MB':>12}  source")
+    for path in ("default", "fast"):
+        for run in range(1, args.runs + 1):
+            cmd = [sys.executable, "-m", "genaiprompt.fast_load", args.model, "--dtype", args.dtype, "--path", path]
+            if args.device_map:
+                cmd += ["--device-map", args.device_map]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode:
+                print(f"{path:<8} {run:>3} failed: {proc.stderr.strip().splitlines()[-1]}")
+                break
+            info = json.loads(proc.stdout.strip().splitlines()[-1])
+            rss = f"{info['peak_rss_mb']:.0f}" if info["peak_rss_mb"] else "-"
+            label = "cold" if run == 1 else "warm"
+            print(f"{path:<8} {run:>3} {info['seconds']:8.2f} {rss:>12}  {info['source']} ({label})")
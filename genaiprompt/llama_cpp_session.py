@@ -0,0 +1,155 @@
+"""
+Conversational mode for the llama.cpp CLIs that reuses the KV cache across turns.
+
+llama-cpp-python keeps the tokens it has already evaluated and, on the next
+call, only evaluates the part of the prompt after the longest common prefix.
+ChatSession builds each turn as system prompt + earlier turns + new message,
+so everything but the new suffix is served from the KV cache.
+
+The system prompt is evaluated once per model file and its llama.cpp state is
+pickled to the cache directory; later runs (and "reset") restore that snapshot
+instead of recomputing it. When a turn would not fit in n_ctx the oldest
+turns are dropped, keeping the system prompt, before the request is sent.
+"""
+
+import hashlib
+import os
+import pickle
+
+from genaiprompt import paths
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant. Answer clearly and concisely."
+USER_TEMPLATE = "### Human: {message}\n### Assistant:"
+TURN_END = "\n"
+STOP = ["### Human:"]
+
+# What to do when a new turn does not fit in the context window.
+TRUNCATION_POLICIES = ("drop_oldest", "reset")
+
+
+class ContextOverflow(ValueError):
+    """Raised when a single message cannot fit the context window even on its own."""
+
+
+class ChatSession:
+    def __init__(self, llm, model_path, system_prompt=DEFAULT_SYSTEM_PROMPT, truncation="drop_oldest",
+                 use_snapshot=True, **params):
+        if truncation not in TRUNCATION_POLICIES:
+            raise ValueError(f"truncation must be one of {TRUNCATION_POLICIES}")
+        self.llm = llm
+        self.model_path = model_path
+        self.system_prompt = system_prompt
+        self.truncation = truncation
+        self.use_snapshot = use_snapshot
+        self.params = params
+        self.max_tokens = params.get("max_tokens", 256)
+        self.system_tokens = llm.tokenize(f"### System: {system_prompt}\n".encode("utf-8"), add_bos=True)
+        self.turns = []  # token lists of completed turns, user message and answer
+        self._state = None
+        self.last_output = None
+        self.last_dropped = self.last_reused = self.last_evaluated = 0
+
+    def _tokenize(self, text):
+        return self.llm.tokenize(text.encode("utf-8"), add_bos=False)
+
+    def _snapshot_path(self):
+        stat = os.stat(self.model_path)
+        key = hashlib.sha256(repr((os.path.abspath(self.model_path), stat.st_size, stat.st_mtime,
+                                   self.llm.n_ctx(), self.system_tokens)).encode()).hexdigest()[:16]
+        return paths.cache_path("kv", f"{key}.state")
+
+    def start(self):
+        """Evaluate the system prompt, or restore it from a saved snapshot.
+
+        Returns True when the snapshot was restored.
+        """
+        path = self._snapshot_path() if self.use_snapshot else None
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    self._state = pickle.load(f)
+                self.llm.load_state(self._state)
+                return True
+            except Exception:
+                self._state = None
+        self.llm.reset()
+        self.llm.eval(self.system_tokens)
+        self._state = self.llm.save_state()
+        if path:
+            with open(path, "wb") as f:
+                pickle.dump(self._state, f)
+        return False
+
+    def reset(self):
+        """Forget the conversation and go back to the system prompt snapshot."""
+        self.turns = []
+        if self._state is not None:
+            self.llm.load_state(self._state)
+
+    def _fit(self, message_tokens):
+        """Apply the truncation policy so the next turn fits in n_ctx."""
+        budget = self.llm.n_ctx() - self.max_tokens - len(self.system_tokens)
+        if len(message_tokens) > budget:
+            raise ContextOverflow(f"message is {len(message_tokens)} tokens; at most {budget} fit with the system prompt")
+        used = sum(len(t) for t in self.turns) + len(message_tokens)
+        if used <= budget:
+            return 0
+        if self.truncation == "reset":
+            dropped = len(self.turns)
+            self.turns = []
+            return dropped
+        dropped = 0
+        while self.turns and used > budget:
+            used -= len(self.turns.pop(0))
+            dropped += 1
+        return dropped
+
+    def _prepare(self, message):
+        message_tokens = self._tokenize(USER_TEMPLATE.format(message=message))
+        self.last_dropped = self._fit(message_tokens)
+        prompt_tokens = list(self.system_tokens)
+        for turn in self.turns:
+            prompt_tokens.extend(turn)
+        prompt_tokens.extend(message_tokens)
+        self.last_reused = _common_prefix(self.llm._input_ids.tolist(), prompt_tokens)
+        self.last_evaluated = len(prompt_tokens) - self.last_reused
+        return message_tokens, prompt_tokens
+
+    def ask(self, message):
+        """Answer one user message in the context of the conversation.
+
+        Returns (text, dropped_turns). last_reused / last_evaluated hold how
+        many prompt tokens came from the KV cache and how many were new.
+        """
+        message_tokens, prompt_tokens = self._prepare(message)
+        output = self.last_output = self.llm.create_completion(prompt_tokens, stop=STOP, **self.params)
+        text = output["choices"][0]["text"]
+        self.turns.append(message_tokens + self._tokenize(text.strip() + TURN_END))
+        return text, self.last_dropped
+
+    def ask_stream(self, message, timer=None):
+        """Like ask(), but yield the answer's text chunks as they are sampled.
+
+        The turn joins the history once the stream is exhausted; the number
+        of dropped turns is left in last_dropped.
+        """
+        message_tokens, prompt_tokens = self._prepare(message)
+        self.last_output = None
+        parts = []
+        for chunk in self.llm.create_completion(prompt_tokens, stop=STOP, stream=True, **self.params):
+            if timer:
+                timer.tick()
+            text = chunk["choices"][0]["text"]
+            if text:
+                parts.append(text)
+                yield text
+        self.turns.append(message_tokens + self._tokenize("".join(parts).strip() + TURN_END))
+
+
+def _common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
@@ -0,0 +1,311 @@
+"""
+Auto-tuning of llama.cpp load parameters on the local machine.
+
+The llama.cpp presets only set n_ctx and n_gpu_layers, which leaves thread
+counts, batch sizes, mmap/mlock, flash attention and the KV cache type at
+llama-cpp-python's defaults. Those defaults are often far off on CPU-only
+hosts. The tuner loads the model in a fresh process per trial, evaluates a
+fixed prompt and generates a fixed number of tokens, and records prompt-eval
+and eval tokens/sec and peak RSS. Parameters are swept one at a time, each
+keeping the best values found so far:
+
+    n_threads -> n_threads_batch -> n_batch -> flash_attn -> KV cache type -> use_mmap -> use_mlock
+
+A value replaces the current one if it is at least MIN_GAIN faster on the
+objective (by default the seconds the fixed request takes), or about as
+fast with RSS_GAIN less peak RSS (a quantized KV cache leaves room for a
+larger n_ctx), and stays within --max-rss. The winner is saved per model file (path, size and mtime)
+under the genaiprompt cache directory. LlamaCppBackend applies it on load,
+so the llama_cpp-*.py scripts and `python -m genaiprompt` pick it up
+without flags; `"tuned": false` in a preset turns that off.
+
+    python -m genaiprompt.llama_cpp_tune --model llama3-8b-gguf
+    python -m genaiprompt.llama_cpp_tune --gguf ./model.gguf --n-ctx 8192 --max-rss 12GiB
+    python -m genaiprompt.llama_cpp_tune --model llama3-8b-gguf --show
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import subprocess
+import sys
+import time
+
+from genaiprompt import config
+from genaiprompt.cpu_inference import physical_cores
+from genaiprompt.metrics import peak_rss_bytes
+from genaiprompt.paths import cache_path
+from genaiprompt.router import format_size, parse_size
+
+# ggml tensor types for type_k/type_v; profiles store the names.
+KV_TYPES = {"f16": 1, "q8_0": 8, "q4_0": 2}
+TUNED_KEYS = ("n_threads", "n_threads_batch", "n_batch", "n_ubatch", "flash_attn", "type_k", "type_v", "use_mmap",
+              "use_mlock", "n_ctx")
+OBJECTIVES = ("total", "eval", "prompt")
+MIN_GAIN = 0.03
+RSS_GAIN = 0.05
+TRIAL_TIMEOUT = 900
+FILLER = ("The history of astronomy spans thousands of years, from the first people who tracked the moon and the "
+          "seasons to modern observatories that measure light from galaxies billions of years old. ")
+
+
+def profile_key(model_path):
+    stat = os.stat(model_path)
+    return hashlib.sha256(repr((os.path.abspath(model_path), stat.st_size, stat.st_mtime)).encode()).hexdigest()[:16]
+
+
+def _profiles_path():
+    # Resolved on use: cache_path() creates the cache directory, which importing should not.
+    return cache_path("llama-cpp-profiles.json")
+
+
+def _read_profiles():
+    try:
+        with open(_profiles_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_profile(model_path, params, measured):
+    profiles = _read_profiles()
+    profiles[profile_key(model_path)] = {
+        "model": os.path.abspath(model_path), "params": params, "measured": measured,
+        "cpu_count": os.cpu_count(), "tuned_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    path = _profiles_path()
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=2)
+    os.replace(tmp, path)
+
+
+def load_profile(model_path):
+    """The saved profile for a model file on this machine, or None (also when the file changed since tuning)."""
+    try:
+        profile = _read_profiles().get(profile_key(model_path))
+    except OSError:
+        return None
+    # The cache directory may be shared between hosts with different CPUs.
+    if profile is None or profile.get("cpu_count") != os.cpu_count():
+        return None
+    return profile
+
+
+def llama_kwargs(params):
+    """Llama(...) keyword arguments from profile params (KV cache type names become ggml type ids)."""
+    kwargs = dict(params)
+    for key in ("type_k", "type_v"):
+        if key in kwargs:
+            kwargs[key] = KV_TYPES[kwargs[key]]
+    return kwargs
+
+
+def describe(params):
+    return ", ".join(f"{k}={v}" for k, v in params.items())
+
+
+def fixed_prompt(llm, prompt_tokens):
+    """Exactly prompt_tokens tokens of filler text (token ids, so every trial evaluates the same prompt)."""
+    text = FILLER * (prompt_tokens // 20 + 1)
+    return llm.tokenize(text.encode("utf-8"))[:prompt_tokens]
+
+
+def measure(model_path, params, prompt_tokens, tokens):
+    """Load the model with `params` and time one request; runs in the trial's own process."""
+    from llama_cpp import Llama
+
+    from genaiprompt.metrics import from_llama_cpp, reset_llama_cpp_perf
+
+    start = time.time()
+    llm = Llama(model_path=model_path, verbose=False, **llama_kwargs(params))
+    load_seconds = time.time() - start
+    llm(fixed_prompt(llm, 8), max_tokens=4, temperature=0.0)  # warm-up
+    llm.reset()  # no KV prefix reuse from the warm-up
+    reset_llama_cpp_perf(llm)
+    start = time.time()
+    output = llm(fixed_prompt(llm, prompt_tokens), max_tokens=tokens, temperature=0.0)
+    metrics = from_llama_cpp(model_path, llm, output, total_seconds=time.time() - start)
+    return {
+        "load_seconds": load_seconds, "prompt_tokens": metrics.prompt_tokens,
+        "prompt_eval_rate": metrics.prompt_eval_rate, "eval_rate": metrics.tokens_per_second,
+        "seconds": metrics.total_seconds, "peak_rss": peak_rss_bytes(),
+    }
+
+
+def supported_params():
+    """Keyword arguments the installed Llama() accepts, or None when it takes any."""
+    from llama_cpp import Llama
+
+    parameters = inspect.signature(Llama.__init__).parameters
+    if any(p.kind == p.VAR_KEYWORD for p in parameters.values()):
+        return None
+    return set(parameters)
+
+
+def trial(model_path, params, prompt_tokens, tokens):
+    """measure() in a fresh process, so peak RSS and mlock belong to this trial alone; {"error": ...} on failure."""
+    cmd = [sys.executable, "-m", "genaiprompt.llama_cpp_tune", "--gguf", model_path, "--child", json.dumps(params),
+           "--prompt-tokens", str(prompt_tokens), "--tokens", str(tokens)]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=TRIAL_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return {"error": f"timed out after {TRIAL_TIMEOUT}s"}
+    if proc.returncode:
+        lines = proc.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit status {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def score(result, objective):
+    """Higher is better."""
+    if objective == "prompt":
+        return result["prompt_eval_rate"] or 0.0
+    if objective == "eval":
+        return result["eval_rate"] or 0.0
+    return 1.0 / result["seconds"] if result["seconds"] else 0.0
+
+
+def sweep_steps(n_ctx, supported=None):
+    """(name, candidate param updates) in sweep order; the first candidate of each step is llama.cpp's default."""
+    cores, logical = physical_cores(), os.cpu_count() or 1
+    threads = sorted({max(1, logical // 2), cores, logical, max(1, cores - 1)})
+    batches = [b for b in (512, 128, 256, 1024, 2048) if b <= n_ctx]
+    steps = [
+        ("n_threads", [{"n_threads": n} for n in [max(1, logical // 2)] + threads]),
+        ("n_threads_batch", [{"n_threads_batch": n} for n in [logical] + threads]),
+        ("n_batch", [{"n_batch": b, "n_ubatch": b} for b in batches]),
+        ("flash_attn", [{"flash_attn": False}, {"flash_attn": True}]),
+        # A quantized V cache needs flash attention; tune() skips it otherwise.
+        ("kv_cache", [{"type_k": "f16", "type_v": "f16"}, {"type_k": "q8_0", "type_v": "q8_0"},
+                      {"type_k": "q8_0", "type_v": "f16"}]),
+        ("use_mmap", [{"use_mmap": True}, {"use_mmap": False}]),
+        ("use_mlock", [{"use_mlock": False}, {"use_mlock": True}]),
+    ]
+    out = []
+    for name, candidates in steps:
+        unique = []
+        for candidate in candidates:
+            if candidate not in unique and (supported is None or all(k in supported for k in candidate)):
+                unique.append(candidate)
+        if len(unique) > 1:
+            out.append((name, unique))
+    return out
+
+
+def tune(run, base, steps, objective="total", max_rss=None, log=print):
+    """Greedy one-parameter-at-a-time sweep; returns (best params, its result, all trials).
+
+    run(params) returns a trial result (or {"error": ...}); `base` holds the
+    fixed params such as n_ctx and n_gpu_layers.
+    """
+    best, best_result = dict(base), None
+    trials = []
+
+    def accept(params, result):
+        if "error" in result:
+            return False
+        if max_rss and result["peak_rss"] and result["peak_rss"] > max_rss:
+            return False
+        if best_result is None:
+            return True
+        gain = score(result, objective) / (score(best_result, objective) or 1e-9) - 1
+        if gain > MIN_GAIN:
+            return True
+        rss, best_rss = result["peak_rss"], best_result["peak_rss"]
+        return gain > -MIN_GAIN and bool(rss and best_rss and rss < best_rss * (1 - RSS_GAIN))
+
+    for name, candidates in steps:
+        for candidate in candidates:
+            params = {**best, **candidate}
+            if params.get("type_v", "f16") != "f16" and not params.get("flash_attn"):
+                continue
+            # Skip the value already in effect (the first candidate is the default when unset).
+            if best_result is not None and all(best.get(k, candidates[0][k]) == v for k, v in candidate.items()):
+                continue
+            result = run(params)
+            trials.append((params, result))
+            log(format_trial(name, candidate, result, objective))
+            if accept(params, result):
+                best, best_result = params, result
+        if best_result is None:
+            raise RuntimeError(f"Every {name} trial failed; see the errors above")
+    return best, best_result, trials
+
+
+def format_trial(name, candidate, result, objective):
+    label = f"{name:<16} {describe(candidate):<30}"
+    if "error" in result:
+        return f"{label} failed: {result['error']}"
+    prompt_rate = f"{result['prompt_eval_rate']:.1f}" if result["prompt_eval_rate"] else "-"
+    eval_rate = f"{result['eval_rate']:.1f}" if result["eval_rate"] else "-"
+    return (f"{label} prompt {prompt_rate:>8} tok/s  eval {eval_rate:>7} tok/s  {result['seconds']:6.2f}s  "
+            f"load {result['load_seconds']:5.1f}s  RSS {format_size(result['peak_rss'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune llama.cpp threads, batch sizes and memory options.")
+    parser.add_argument("--model", help="llama.cpp preset name")
+    parser.add_argument("--config", help="JSON file with extra or overriding model presets")
+    parser.add_argument("--gguf", help="GGUF file (instead of --model)")
+    parser.add_argument("--n-ctx", type=int, help="context size to tune for and save (default: the preset's, or 4096)")
+    parser.add_argument("--max-rss", help='reject settings above this peak RSS, e.g. "12GiB"')
+    parser.add_argument("--objective", choices=OBJECTIVES, default="total",
+                        help="total: seconds per request; eval / prompt: generation / prompt-eval tokens/sec")
+    parser.add_argument("--prompt-tokens", type=int, default=512, help="tokens in the fixed prompt")
+    parser.add_argument("--tokens", type=int, default=64, help="tokens generated per trial")
+    parser.add_argument("--show", action="store_true", help="print the saved profile and exit")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    preset = {}
+    if args.model:
+        preset = config.get_preset(args.model, args.config)
+        if preset["backend"] != "llama_cpp":
+            parser.error(f"{args.model} is not a llama_cpp preset ({preset['backend']})")
+    model_path = args.gguf or preset.get("model")
+    if not model_path:
+        parser.error("--model or --gguf is required")
+
+    if args.child:
+        print(json.dumps(measure(model_path, json.loads(args.child), args.prompt_tokens, args.tokens)))
+        return 0
+    if not os.path.exists(model_path):
+        print(f"Model file not found: {model_path}", file=sys.stderr)
+        return 1
+    if args.show:
+        profile = load_profile(model_path)
+        print(json.dumps(profile, indent=2) if profile else f"No profile for {model_path} on this machine.")
+        return 0
+
+    n_ctx = args.n_ctx or preset.get("n_ctx") or 4096
+    base = {"n_ctx": n_ctx}
+    if "n_gpu_layers" in preset:
+        base["n_gpu_layers"] = preset["n_gpu_layers"]
+    max_rss = parse_size(args.max_rss) if args.max_rss else None
+    try:
+        steps = sweep_steps(n_ctx, supported_params())
+    except ImportError:
+        print("llama-cpp-python is not installed (pip install llama-cpp-python).", file=sys.stderr)
+        return 1
+    print(f"Tuning {model_path} (n_ctx={n_ctx}, {args.prompt_tokens}-token prompt, {args.tokens} tokens, "
+          f"objective {args.objective}); {sum(len(c) for _, c in steps) - len(steps) + 1} trials at most.")
+    try:
+        best, result, _ = tune(lambda params: trial(model_path, params, args.prompt_tokens, args.tokens), base, steps,
+                               args.objective, max_rss)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    # n_gpu_layers stays the preset's; n_ctx is only pinned when asked for.
+    params = {k: v for k, v in best.items() if k in TUNED_KEYS and (k != "n_ctx" or args.n_ctx)}
+    save_profile(model_path, params, result)
+    print(f"\nBest: {describe(params)}")
+    print(format_trial("result", {}, result, args.objective))
+    print(f"Saved to {_profiles_path()}; the llama.cpp presets for this file load it automatically.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
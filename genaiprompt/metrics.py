@@ -0,0 +1,265 @@
+"""
+Per-request generation metrics shared by the Ollama, llama.cpp and
+transformers scripts.
+
+Ollama reports exact token counts and nanosecond durations in the final
+`done` message of a stream; llama.cpp keeps equivalent counters in its perf
+context; streamed transformers runs are timed per token on the client. All
+are normalized into GenerationMetrics, which a MetricsRecorder
+can append to a JSON lines file and export as Prometheus text.
+
+    python -m genaiprompt.metrics metrics.jsonl [--format prometheus|summary]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+
+NS_PER_SECOND = 1e9
+
+
+@dataclass
+class GenerationMetrics:
+    backend: str
+    model: str
+    ttft: float = None  # seconds until the first token reached the client
+    prompt_tokens: int = None
+    prompt_eval_seconds: float = None
+    eval_tokens: int = None
+    generated_tokens: int = None  # all tokens of the answer; eval_tokens may leave out the first (see TokenTimer)
+    eval_seconds: float = None
+    load_seconds: float = None
+    total_seconds: float = None
+    draft_acceptance: float = None  # speculative decoding: share of draft tokens accepted
+    timestamp: float = field(default_factory=time.time)
+
+    @property
+    def prompt_eval_rate(self):
+        """Prompt tokens evaluated per second."""
+        if self.prompt_tokens and self.prompt_eval_seconds:
+            return self.prompt_tokens / self.prompt_eval_seconds
+        return None
+
+    @property
+    def tokens_per_second(self):
+        """Generated tokens per second, excluding prompt evaluation."""
+        if self.eval_tokens and self.eval_seconds:
+            return self.eval_tokens / self.eval_seconds
+        return None
+
+    @property
+    def token_latency(self):
+        """Mean seconds per generated token."""
+        if self.eval_tokens and self.eval_seconds:
+            return self.eval_seconds / self.eval_tokens
+        return None
+
+    def to_dict(self):
+        data = asdict(self)
+        data["prompt_eval_rate"] = self.prompt_eval_rate
+        data["tokens_per_second"] = self.tokens_per_second
+        data["token_latency"] = self.token_latency
+        return data
+
+    def summary(self):
+        """One-line human readable summary for the CLIs."""
+        parts = []
+        if self.ttft is not None:
+            parts.append(f"TTFT: {self.ttft:.2f}s")
+        if self.prompt_eval_rate is not None:
+            parts.append(f"Prompt: {self.prompt_tokens} tok @ {self.prompt_eval_rate:.1f} tok/s")
+        if self.tokens_per_second is not None:
+            parts.append(f"Generated: {self.eval_tokens} tok @ {self.tokens_per_second:.1f} tok/s"
+                         f" ({self.token_latency * 1000:.0f} ms/tok)")
+        if self.draft_acceptance is not None:
+            parts.append(f"Draft acceptance: {self.draft_acceptance:.0%}")
+        if self.load_seconds:
+            parts.append(f"Load: {self.load_seconds:.2f}s")
+        if self.total_seconds is not None:
+            parts.append(f"Total: {self.total_seconds:.1f}s")
+        return " | ".join(parts)
+
+
+def _seconds(ns):
+    return ns / NS_PER_SECOND if ns is not None else None
+
+
+def from_ollama(model, done_msg, ttft=None, total_seconds=None):
+    """Build metrics from the final `done` message of an Ollama stream."""
+    return GenerationMetrics(
+        backend="ollama",
+        model=model,
+        ttft=ttft,
+        prompt_tokens=done_msg.get("prompt_eval_count"),
+        prompt_eval_seconds=_seconds(done_msg.get("prompt_eval_duration")),
+        eval_tokens=done_msg.get("eval_count"),
+        generated_tokens=done_msg.get("eval_count"),
+        eval_seconds=_seconds(done_msg.get("eval_duration")),
+        load_seconds=_seconds(done_msg.get("load_duration")),
+        total_seconds=total_seconds if total_seconds is not None else _seconds(done_msg.get("total_duration")),
+    )
+
+
+def _llama_cpp_perf_functions():
+    import llama_cpp
+
+    # llama_perf_context* replaced llama_get_timings/llama_reset_timings in newer releases.
+    read = getattr(llama_cpp, "llama_perf_context", None) or getattr(llama_cpp, "llama_get_timings", None)
+    reset = getattr(llama_cpp, "llama_perf_context_reset", None) or getattr(llama_cpp, "llama_reset_timings", None)
+    return read, reset
+
+
+def reset_llama_cpp_perf(llm):
+    """Zero llama.cpp's perf counters so the next call is measured on its own."""
+    try:
+        _, reset = _llama_cpp_perf_functions()
+        if reset:
+            reset(llm.ctx)
+    except Exception:
+        pass
+
+
+def from_llama_cpp(model, llm, output=None, total_seconds=None, load_seconds=None, ttft=None, generated_tokens=None):
+    """Build metrics from llama.cpp's perf context after a completion call.
+
+    Falls back to the token counts in the completion's `usage` block when
+    the perf context is not available in the installed llama-cpp-python.
+    Without a measured ttft it is estimated as prompt eval plus one token.
+    """
+    metrics = GenerationMetrics(backend="llama_cpp", model=model, ttft=ttft, load_seconds=load_seconds, total_seconds=total_seconds,
+                                generated_tokens=generated_tokens)
+    if generated_tokens is None and output is not None:
+        metrics.generated_tokens = output.get("usage", {}).get("completion_tokens")
+    try:
+        read, _ = _llama_cpp_perf_functions()
+        perf = read(llm.ctx) if read else None
+    except Exception:
+        perf = None
+    if perf is not None:
+        metrics.prompt_tokens = perf.n_p_eval
+        metrics.prompt_eval_seconds = perf.t_p_eval_ms / 1000
+        metrics.eval_tokens = perf.n_eval
+        metrics.eval_seconds = perf.t_eval_ms / 1000
+    elif output is not None:
+        usage = output.get("usage", {})
+        metrics.prompt_tokens = usage.get("prompt_tokens")
+        metrics.eval_tokens = usage.get("completion_tokens")
+    if metrics.ttft is None and metrics.prompt_eval_seconds is not None and metrics.eval_tokens:
+        metrics.ttft = metrics.prompt_eval_seconds + metrics.eval_seconds / metrics.eval_tokens
+    return metrics
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a list of numbers (pct in 0..100)."""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    rank = (len(values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+# Metric name -> (attribute, help text) for the Prometheus export.
+PROMETHEUS_SUMMARIES = {
+    "genaiprompt_ttft_seconds": ("ttft", "Time to first token."),
+    "genaiprompt_total_seconds": ("total_seconds", "End-to-end request latency."),
+    "genaiprompt_prompt_eval_tokens_per_second": ("prompt_eval_rate", "Prompt evaluation rate."),
+    "genaiprompt_generation_tokens_per_second": ("tokens_per_second", "Generation rate."),
+    "genaiprompt_token_latency_seconds": ("token_latency", "Mean latency per generated token."),
+    "genaiprompt_load_seconds": ("load_seconds", "Model load time."),
+    "genaiprompt_draft_acceptance_ratio": ("draft_acceptance", "Share of speculative draft tokens accepted."),
+}
+QUANTILES = (50, 90, 95, 99)
+
+
+class MetricsRecorder:
+    """Collect GenerationMetrics, optionally appending each one to a JSONL file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.records = []
+        self._lock = threading.Lock()
+
+    def record(self, metrics):
+        with self._lock:
+            self.records.append(metrics)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(metrics.to_dict()) + "\n")
+        return metrics
+
+    @classmethod
+    def load(cls, path):
+        """Read back a JSONL file written by record()."""
+        recorder = cls()
+        names = set(GenerationMetrics.__dataclass_fields__)
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    data = json.loads(line)
+                    recorder.records.append(GenerationMetrics(**{k: v for k, v in data.items() if k in names}))
+        return recorder
+
+    def to_jsonl(self):
+        return "".join(json.dumps(m.to_dict()) + "\n" for m in self.records)
+
+    def to_prometheus(self):
+        """Render summaries with latency/throughput quantiles, labelled by backend and model."""
+        groups = {}
+        for m in self.records:
+            groups.setdefault((m.backend, m.model), []).append(m)
+        lines = []
+        for name, (attr, help_text) in PROMETHEUS_SUMMARIES.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} summary")
+            for (backend, model), records in sorted(groups.items()):
+                values = [v for v in (getattr(m, attr) for m in records) if v is not None]
+                if not values:
+                    continue
+                labels = f'backend="{backend}",model="{model}"'
+                for q in QUANTILES:
+                    lines.append(f'{name}{{{labels},quantile="{q / 100}"}} {percentile(values, q):.6f}')
+                lines.append(f"{name}_sum{{{labels}}} {sum(values):.6f}")
+                lines.append(f"{name}_count{{{labels}}} {len(values)}")
+        return "\n".join(lines) + "\n"
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, or None if it cannot be read."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def default_recorder():
+    """Recorder used by the CLIs; appends to $GENAIPROMPT_METRICS when set."""
+    return MetricsRecorder(os.environ.get("GENAIPROMPT_METRICS") or None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export recorded generation metrics.")
+    parser.add_argument("path", help="JSONL file written via GENAIPROMPT_METRICS")
+    parser.add_argument("--format", choices=("prometheus", "summary"), default="summary")
+    args = parser.parse_args()
+    recorder = MetricsRecorder.load(args.path)
+    if args.format == "prometheus":
+        print(recorder.to_prometheus(), end="")
+    else:
+        print(f"{len(recorder.records)} requests")
+        for name, (attr, _) in PROMETHEUS_SUMMARIES.items():
+            values = [getattr(m, attr) for m in recorder.records]
+            if any(v is not None for v in values):
+                quantiles = "  ".join(f"p{q}={percentile(values, q):.3f}" for q in QUANTILES)
+                print(f"{attr:<20} {quantiles}")
@@ -0,0 +1,80 @@
+"""
+Streaming NDJSON reader for the Ollama endpoints.
+
+Lines are parsed straight from bytes (no .decode() copy) with orjson when it
+is installed. The stdlib json fallback still decodes first, because
+json.loads() on bytes sniffs the encoding and ends up slower than an explicit
+utf-8 decode. Only the requested fields are kept, which also drops the large
+`context` token array Ollama sends in its final message.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fields the generate and pull loops actually read.
+GENERATE_FIELDS = (
+    "response", "done", "eval_count", "eval_duration",
+    "prompt_eval_count", "prompt_eval_duration", "load_duration", "total_duration",
+)
+PULL_FIELDS = ("status", "digest", "total", "completed", "error")
+
+
+def _json_loads(line):
+    return json.loads(line.decode("utf-8"))
+
+
+BACKENDS = {"json": _json_loads}
+if orjson is not None:
+    BACKENDS["orjson"] = orjson.loads
+DEFAULT_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def get_loads(backend=None):
+    """Return the loads() function for a backend name (default: fastest available)."""
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"JSON backend '{backend}' is not available (have: {', '.join(BACKENDS)})")
+    return BACKENDS[backend]
+
+
+def iter_lines(chunks):
+    """Split an iterable of byte chunks into non-empty lines."""
+    pending = b""
+    for chunk in chunks:
+        if pending:
+            chunk = pending + chunk
+        lines = chunk.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line:
+                yield line
+    if pending:
+        yield pending
+
+
+def iter_messages(lines, fields=None, backend=None):
+    """Parse NDJSON byte lines into dicts, skipping malformed lines.
+
+    If `fields` is given, each dict only carries the keys from it that are
+    present in the message.
+    """
+    loads = get_loads(backend)
+    for line in lines:
+        try:
+            msg = loads(line)
+        except ValueError:
+            continue
+        if not isinstance(msg, dict):
+            continue
+        if fields is not None:
+            msg = {key: msg[key] for key in fields if key in msg}
+        yield msg
+
+
+def iter_response(resp, fields=None, backend=None):
+    """Yield parsed messages from a streamed requests.Response."""
+    return iter_messages(iter_lines(resp.iter_content(chunk_size=None)), fields, backend)
@@ -0,0 +1,474 @@
+"""
+Memory and offload profiler for models split across GPU, CPU and disk, such
+as the llama2-70b preset (device_map="auto", max_memory={0: "24GiB", "cpu": "48GiB"}).
+
+The model is loaded with a placement preset and generates a few tokens. The
+report covers:
+
+- where each block landed (the resolved hf_device_map) and the bytes per device;
+- peak CPU RSS, peak memory per GPU and the size of the disk offload;
+- forward time per block, with resident blocks compared against offloaded
+  ones, whose weights are copied in on every forward pass;
+- a proposed max_memory, printed as a --config preset snippet, with the
+  estimated effect on the time per token. Each GPU's budget is its memory
+  minus a reserve for its share of the KV cache (n_ctx tokens), the offload
+  staging buffer (the largest block) and 5% for activations. The CPU gets
+  the rest of the model, up to 80% of RAM; anything beyond that goes to disk.
+
+Placement presets: auto (fill the devices in order within max_memory),
+sequential, balanced and balanced_low_0 (spread over several GPUs; the
+latter keeps GPU 0 light for generate()), disk (GPUs plus disk, no CPU tier
+for low-RAM nodes) and cpu. Offloading to disk needs --offload-folder, or
+"offload_folder" in the preset.
+
+Without a GPU, --simulate gives the device capacities to plan for, e.g.
+"0=600KB,cpu=400KB". The split is planned as on a real GPU. Blocks planned
+for the GPU then run on the CPU as the resident ones, and every offloaded
+block is disk-backed, so each of its forward passes pays a real weight load,
+as a host-to-device copy would on a GPU. (balanced equals auto there.)
+
+    python -m genaiprompt.offload_profile --model llama2-70b --offload-folder D:/offload
+    python -m genaiprompt.offload_profile --tiny --simulate 0=600KB,cpu=400KB
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import warnings
+
+from genaiprompt import config
+from genaiprompt.fast_load import load_causal_lm, local_snapshot
+from genaiprompt.metrics import peak_rss_bytes
+from genaiprompt.paths import cache_path
+from genaiprompt.router import format_size, parse_budget, parse_size
+
+PLACEMENTS = ("auto", "sequential", "balanced", "balanced_low_0", "disk", "cpu")
+OFFLOADED = ("cpu", "disk")
+PROFILE_PROMPT = "Question: Why is the sky blue?\nAnswer:"
+ACTIVATION_SHARE = 0.05
+MAX_RESERVE_SHARE = 0.5  # reserves never take more than this share of a GPU from the weights
+RAM_SHARE = 0.8
+
+
+def _max_memory(budget):
+    """max_memory from {device: size}: sizes in bytes, GPU indices as ints (as accelerate wants)."""
+    return {int(d) if str(d).isdigit() else d: parse_size(size) for d, size in budget.items()}
+
+
+def empty_model(source, dtype, token=None):
+    """The model's structure on the meta device, for planning without loading weights."""
+    from accelerate import init_empty_weights
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    model_config = AutoConfig.from_pretrained(source, token=token)
+    with init_empty_weights():
+        return AutoModelForCausalLM.from_config(model_config, torch_dtype=dtype)
+
+
+def plan_device_map(model, placement, max_memory, dtype=None):
+    """The device map a placement preset gives for `model` within `max_memory`."""
+    from accelerate import infer_auto_device_map
+    from accelerate.utils import get_balanced_memory
+
+    if placement == "cpu":
+        return {"": "cpu"}
+    no_split = model._no_split_modules
+    if placement == "disk":
+        max_memory = {d: size for d, size in max_memory.items() if d != "cpu"}
+    elif placement in ("balanced", "balanced_low_0"):
+        max_memory = get_balanced_memory(model, max_memory, no_split_module_classes=no_split, dtype=dtype,
+                                         low_zero=placement == "balanced_low_0")
+    return dict(infer_auto_device_map(model, max_memory=max_memory, no_split_module_classes=no_split, dtype=dtype))
+
+
+def device_of(name, device_map):
+    """Device of a module: its own device map entry or its nearest listed ancestor's."""
+    while True:
+        if name in device_map:
+            return device_map[name]
+        if not name:
+            return None
+        name = name.rpartition(".")[0]
+
+
+def timed_blocks(model, device_map):
+    """Decoder layers plus the other device map entries (embeddings, norm, head), in model order."""
+    layer_classes = set(model._no_split_modules or ())
+    layers = [name for name, module in model.named_modules() if type(module).__name__ in layer_classes]
+    others = [name for name in device_map if name and not any(layer.startswith(name + ".") for layer in layers)]
+    order = {name: i for i, (name, _) in enumerate(model.named_modules())}
+    return sorted(set(layers + others), key=lambda name: order.get(name, len(order)))
+
+
+def is_layer(name):
+    return bool(re.search(r"\.\d+$", name))
+
+
+def tier(device, gpu=True):
+    """"resident", or "offloaded (cpu|disk)" for blocks that must be copied to a GPU to run."""
+    if device not in OFFLOADED or not gpu:
+        return "resident"
+    return f"offloaded ({device})"
+
+
+class BlockTimer:
+    """Wall time of every forward call per block, including the weight transfer of offloaded blocks."""
+
+    def __init__(self, model, blocks):
+        import torch
+
+        self.sync = torch.cuda.synchronize if torch.cuda.is_available() else (lambda: None)
+        self.calls = {name: [] for name in blocks}
+        self.handles = []
+        for name in blocks:
+            module = model.get_submodule(name)
+            self.handles.append(module.register_forward_pre_hook(self._start(name)))
+            self.handles.append(module.register_forward_hook(self._stop(name)))
+        self._started = {}
+
+    def _start(self, name):
+        def hook(module, inputs):
+            self.sync()
+            self._started[name] = time.perf_counter()
+        return hook
+
+    def _stop(self, name):
+        def hook(module, inputs, output):
+            self.sync()
+            self.calls[name].append(time.perf_counter() - self._started.pop(name))
+        return hook
+
+    def decode_ms(self, name):
+        """Mean milliseconds per decode step; the first call is the prefill."""
+        calls = self.calls[name][1:] or self.calls[name]
+        return 1000 * sum(calls) / len(calls) if calls else None
+
+    def remove(self):
+        for handle in self.handles:
+            handle.remove()
+
+
+def kv_cache_bytes(model_config, n_ctx, dtype_bytes):
+    layers = model_config.num_hidden_layers
+    heads = getattr(model_config, "num_key_value_heads", None) or model_config.num_attention_heads
+    head_dim = getattr(model_config, "head_dim", None) or model_config.hidden_size // model_config.num_attention_heads
+    return 2 * layers * heads * head_dim * n_ctx * dtype_bytes
+
+
+def device_capacities(simulate=None):
+    """Total memory per device: GPUs from torch, the CPU share of RAM from psutil; or the simulated ones."""
+    if simulate:
+        return _max_memory(parse_budget(simulate))
+    import torch
+
+    capacities = {i: torch.cuda.get_device_properties(i).total_memory for i in range(torch.cuda.device_count())}
+    try:
+        import psutil
+
+        capacities["cpu"] = int(psutil.virtual_memory().total * RAM_SHARE)
+    except ImportError:
+        pass
+    return capacities
+
+
+def propose_max_memory(sizes, capacities, kv_bytes, largest_block):
+    """A max_memory split that leaves each GPU room for its KV cache share, staging and activations.
+
+    The reserves are capped at MAX_RESERVE_SHARE of the GPU (the KV cache
+    share shrinks first, and the reserve is marked "capped"), so a long
+    context cannot push the weights off the GPU altogether.
+    """
+    gpus = {d: cap for d, cap in capacities.items() if d not in OFFLOADED}
+    total_gpu = sum(gpus.values())
+    proposal, reserves = {}, {}
+    for device, cap in gpus.items():
+        reserve = {
+            "kv_cache": int(kv_bytes * cap / total_gpu),
+            "staging": largest_block,
+            "activations": int(cap * ACTIVATION_SHARE),
+        }
+        excess = sum(reserve.values()) - int(cap * MAX_RESERVE_SHARE)
+        if excess > 0:
+            for key in ("kv_cache", "staging", "activations"):
+                cut = min(excess, reserve[key])
+                reserve[key] -= cut
+                excess -= cut
+            reserve["capped"] = True
+        reserves[device] = reserve
+        proposal[device] = cap - sum(v for k, v in reserve.items() if k != "capped")
+    rest = max(0, sizes[""] - sum(proposal.values()))
+    if rest:
+        # Room for one more block than strictly needed: accelerate places whole blocks.
+        cpu = rest + largest_block
+        proposal["cpu"] = min(cpu, capacities["cpu"]) if "cpu" in capacities else cpu
+    return proposal, reserves
+
+
+def estimate_step_ms(timer, blocks, current, planned, gpu=True):
+    """Decode time per token if blocks moved from `current` to `planned` devices, from the measured layer means.
+
+    None when a layer moves to a tier no layer was measured on.
+    """
+    means = {}
+    for name in blocks:
+        if is_layer(name) and timer.decode_ms(name) is not None:
+            means.setdefault(tier(device_of(name, current), gpu), []).append(timer.decode_ms(name))
+    means = {t: sum(v) / len(v) for t, v in means.items()}
+    total = 0.0
+    for name in blocks:
+        measured = timer.decode_ms(name) or 0.0
+        new_tier = tier(device_of(name, planned), gpu)
+        if is_layer(name) and new_tier != tier(device_of(name, current), gpu):
+            if new_tier not in means:
+                return None
+            total += means[new_tier]
+        else:
+            total += measured
+    return total
+
+
+TIER_ORDER = ("resident", "offloaded (cpu)", "offloaded (disk)")  # fastest first
+
+
+def faster_by_tier(blocks, current, planned, gpu=True):
+    """Whether `planned` is faster going by tier order alone: True if every moved layer goes to a faster
+    tier, False if every one goes to a slower tier (or none move), None when the moves go both ways."""
+    moves = set()
+    for name in blocks:
+        if is_layer(name):
+            before = TIER_ORDER.index(tier(device_of(name, current), gpu))
+            after = TIER_ORDER.index(tier(device_of(name, planned), gpu))
+            if before != after:
+                moves.add(after < before)
+    if len(moves) > 1:
+        return None
+    return moves == {True}
+
+
+def _ranges(names):
+    """Compact "model.layers.0-39" style list of block names."""
+    groups, out = {}, []
+    for name in names:
+        prefix, _, index = name.rpartition(".")
+        if index.isdigit():
+            groups.setdefault(prefix, []).append(int(index))
+        else:
+            out.append(name)
+    for prefix, indices in groups.items():
+        spans, start = [], indices[0]
+        for prev, cur in zip(indices, indices[1:] + [None]):
+            if cur != prev + 1:
+                spans.append(f"{start}-{prev}" if prev != start else str(start))
+                start = cur
+        out.append(f"{prefix}.{','.join(spans)}")
+    return ", ".join(out)
+
+
+def profile(model_id, placement="auto", max_memory=None, simulate=None, offload_folder=None, tokens=16,
+            n_ctx=None, dtype="float16", token=None):
+    """Load, plan, run and time the model; returns the report as a dict."""
+    import torch
+
+    torch_dtype = getattr(torch, dtype)
+    source = local_snapshot(model_id) or model_id
+    meta = empty_model(source, torch_dtype, token=token)
+    capacities = device_capacities(simulate)
+    # Without a GPU the CPU is where the model lives, not a tier blocks are copied from.
+    gpu = placement != "cpu" and any(d not in OFFLOADED for d in capacities)
+    if simulate:
+        # accelerate warns that the simulated GPU does not exist.
+        logging.getLogger("accelerate").setLevel(logging.ERROR)
+        warnings.filterwarnings("ignore", message=".*offload_buffers.*")
+    budget = _max_memory(max_memory) if max_memory else dict(capacities) if simulate else None
+    if budget is None:
+        from accelerate.utils import get_max_memory
+
+        budget = get_max_memory()
+    plan = plan_device_map(meta, placement, budget, torch_dtype)
+    if "disk" in plan.values() or simulate:
+        offload_folder = offload_folder or cache_path(
+            "offload", hashlib.sha1(f"{source}|{dtype}".encode()).hexdigest()[:16], "")
+    # Simulated: blocks planned for a GPU run on the CPU, offloaded blocks are disk-backed.
+    load_map = {name: ("cpu" if d not in OFFLOADED else "disk") for name, d in plan.items()} if simulate else plan
+
+    start = time.time()
+    model, tokenizer, _ = load_causal_lm(model_id, torch_dtype, "cpu", device_map=load_map, token=token,
+                                         offload_folder=offload_folder)
+    load_seconds = time.time() - start
+    model.eval()
+
+    from accelerate.utils import compute_module_sizes
+
+    sizes = compute_module_sizes(model)
+    blocks = timed_blocks(model, plan)
+    timer = BlockTimer(model, blocks)
+    on_gpu = torch.cuda.is_available() and not simulate and any(d not in OFFLOADED for d in plan.values())
+    inputs = tokenizer(PROFILE_PROMPT, return_tensors="pt").to("cuda:0" if on_gpu else "cpu")
+    if on_gpu:
+        for i in range(torch.cuda.device_count()):
+            torch.cuda.reset_peak_memory_stats(i)
+    with torch.inference_mode():
+        start = time.perf_counter()
+        model.generate(**inputs, max_new_tokens=tokens, min_new_tokens=tokens, do_sample=False)
+        elapsed = time.perf_counter() - start
+    timer.remove()
+
+    device_bytes = {}
+    for name, device in plan.items():
+        device_bytes[str(device)] = device_bytes.get(str(device), 0) + sizes[name]
+    layer_bytes = [sizes[name] for name in blocks if is_layer(name)]
+    n_ctx = n_ctx or min(getattr(model.config, "max_position_embeddings", 4096), 4096)
+    kv = kv_cache_bytes(model.config, n_ctx, torch_dtype.itemsize)
+    proposal, reserves = propose_max_memory(sizes, capacities, kv, max(layer_bytes or [0]))
+    proposed_plan = plan_device_map(meta, placement if placement != "cpu" else "auto", proposal, torch_dtype)
+    current_ms = estimate_step_ms(timer, blocks, plan, plan, gpu)
+    proposed_ms = estimate_step_ms(timer, blocks, plan, proposed_plan, gpu)
+    # Only a split estimated to be faster is worth recommending. Without a time for the new tier, fall
+    # back to the tier order; None means it cannot be told either way.
+    if proposed_ms is not None:
+        recommended = proposed_ms < current_ms
+    else:
+        recommended = faster_by_tier(blocks, plan, proposed_plan, gpu)
+    rss = peak_rss_bytes()
+
+    def resident_layers(device_map):
+        return sum(1 for name in blocks if is_layer(name) and tier(device_of(name, device_map), gpu) == "resident")
+
+    return {
+        "model": model_id,
+        "placement": placement,
+        "simulated": bool(simulate),
+        "capacities": {str(d): b for d, b in capacities.items()},
+        "max_memory": {str(d): b for d, b in budget.items()},
+        "device_map": {name: str(d) for name, d in plan.items()},
+        "device_bytes": device_bytes,
+        "peak_rss": rss,
+        "gpu_peak": {str(i): torch.cuda.max_memory_allocated(i) for i in range(torch.cuda.device_count())} if on_gpu else {},
+        "offload_folder": offload_folder if "disk" in load_map.values() else None,
+        "load_seconds": load_seconds,
+        "tokens_per_second": tokens / elapsed,
+        "blocks": [
+            {"name": name, "device": str(device_of(name, plan)), "tier": tier(device_of(name, plan), gpu),
+             "bytes": sizes[name], "calls": len(timer.calls[name]), "decode_ms": timer.decode_ms(name)}
+            for name in blocks
+        ],
+        "step_ms": current_ms,
+        "proposal": {
+            "max_memory": {str(d): b for d, b in proposal.items()},
+            "reserves": {str(d): r for d, r in reserves.items()},
+            "n_ctx": n_ctx,
+            "resident_layers": [resident_layers(plan), resident_layers(proposed_plan)],
+            "disk": "disk" in proposed_plan.values(),
+            "step_ms": proposed_ms,
+            "recommended": recommended,
+        },
+    }
+
+
+def print_report(report):
+    simulated = " (simulated GPU)" if report["simulated"] else ""
+    print(f"Model {report['model']}, placement {report['placement']}{simulated}, loaded in {report['load_seconds']:.1f}s")
+    print("max_memory: " + ", ".join(f"{d}={format_size(b)}" for d, b in report["max_memory"].items()))
+    print("\nDevice map:")
+    by_device = {}
+    for name, device in report["device_map"].items():
+        by_device.setdefault(device, []).append(name)
+    for device, names in by_device.items():
+        print(f"  {device:<5} {format_size(report['device_bytes'][device]):>9}  {_ranges(names) or '(whole model)'}")
+
+    memory = [f"peak CPU RSS {format_size(report['peak_rss'])}"]
+    memory += [f"GPU {i} peak {format_size(b)}" for i, b in report["gpu_peak"].items()]
+    if report["offload_folder"]:
+        memory.append(f"disk offload {format_size(report['device_bytes'].get('disk', 0))} in {report['offload_folder']}")
+    print("\nMemory: " + ", ".join(memory))
+
+    print(f"\nForward time per decode step ({report['tokens_per_second']:.2f} tok/s):")
+    print(f"  {'block':<28} {'device':<6} {'tier':<17} {'size':>9} {'ms':>8}")
+    tiers = {}
+    for block in report["blocks"]:
+        ms = block["decode_ms"]
+        print(f"  {block['name']:<28} {block['device']:<6} {block['tier']:<17} {format_size(block['bytes']):>9} "
+              f"{ms if ms is not None else float('nan'):8.3f}")
+        if is_layer(block["name"]) and ms is not None:
+            tiers.setdefault(block["tier"], []).append(ms)
+    total = report["step_ms"] or 1.0
+    for name, values in tiers.items():
+        print(f"  {name} layers: {len(values)}, mean {sum(values) / len(values):.3f} ms, "
+              f"{sum(values) / total:.0%} of the step")
+
+    proposal = report["proposal"]
+    split = {d: format_size(b) for d, b in proposal["max_memory"].items()}
+    print("\nProposed max_memory: " + ", ".join(f"{d}={s}" for d, s in split.items()))
+    for device, reserve in proposal["reserves"].items():
+        parts = ", ".join(f"{k.replace('_', ' ')} {format_size(v)}" for k, v in reserve.items() if k != "capped")
+        print(f"  GPU {device} reserve: {parts} (KV cache for n_ctx={proposal['n_ctx']})")
+        if reserve.get("capped"):
+            print(f"  GPU {device} cannot hold the full reserve next to any weights; consider a smaller --n-ctx.")
+    before, after = proposal["resident_layers"]
+    if proposal["step_ms"] is None:
+        print(f"  resident layers {before} -> {after}; step time not estimated (no layers measured on the new tier)")
+        if proposal["recommended"] is None:
+            print("  Unknown whether it is faster: layers move to both faster and slower tiers. "
+                  "Profile it with --max-memory before switching.")
+            return
+        if proposal["recommended"]:
+            print("  Recommended by tier order: every moved layer goes to a faster tier.")
+    else:
+        print(f"  resident layers {before} -> {after}; estimated step {report['step_ms']:.2f} ms -> "
+              f"{proposal['step_ms']:.2f} ms ({report['step_ms'] / proposal['step_ms']:.2f}x)")
+    if not proposal["recommended"]:
+        print("  Not recommended: it is not estimated to be faster. Keep the current max_memory.")
+        return
+    snippet = {"device_map": "auto", "max_memory": {int(d) if d.isdigit() else d: s for d, s in split.items()}}
+    if proposal["disk"]:
+        snippet["offload_folder"] = report["offload_folder"] or "PATH"
+        print("  Not everything fits in RAM: the remainder is offloaded to disk.")
+    print(f"  --config snippet: {json.dumps({report.get('preset') or 'MODEL': snippet})}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile memory and offloading of a model split over devices.")
+    parser.add_argument("--model", help="preset name (e.g. llama2-70b), HF repo id or model directory")
+    parser.add_argument("--config", help="JSON file with extra or overriding model presets")
+    parser.add_argument("--tiny", action="store_true", help="use an 8-layer tiny random model (offline, CPU)")
+    parser.add_argument("--placement", choices=PLACEMENTS, default="auto")
+    parser.add_argument("--max-memory", help='budget to profile, e.g. "0=24GiB,cpu=48GiB" (default: the preset\'s)')
+    parser.add_argument("--simulate", help='device capacities to simulate without a GPU, e.g. "0=600KB,cpu=400KB"')
+    parser.add_argument("--offload-folder", help="directory for layers offloaded to disk")
+    parser.add_argument("--tokens", type=int, default=16, help="tokens generated while timing")
+    parser.add_argument("--n-ctx", type=int, help="context length the KV cache reserve is sized for")
+    parser.add_argument("--dtype", default=None, help="float16, bfloat16 or float32 (default: the preset's)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    preset = {}
+    if args.tiny:
+        from genaiprompt.bench_backends import build_tiny_model
+
+        model_id = build_tiny_model(cache_path("bench", "tiny-llama-8l-v1"), layers=8)
+        dtype = args.dtype or "float32"
+    elif args.model:
+        models = config.load_models(args.config)
+        preset = models.get(args.model, {})
+        model_id = preset.get("model", args.model)
+        dtype = args.dtype or preset.get("torch_dtype") or "float16"
+    else:
+        parser.error("--model or --tiny is required")
+    if preset.get("hf_home"):
+        from genaiprompt.backends.transformers_backend import resolve_hf_home
+
+        os.environ["HF_HOME"] = resolve_hf_home(preset["hf_home"])
+
+    max_memory = parse_budget(args.max_memory) if args.max_memory else preset.get("max_memory")
+    report = profile(model_id, args.placement, max_memory, args.simulate,
+                     args.offload_folder or preset.get("offload_folder"), args.tokens, args.n_ctx, dtype,
+                     token=os.environ.get("HF_TOKEN") or None)
+    report["preset"] = args.model if preset else None
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
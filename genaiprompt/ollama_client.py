@@ -0,0 +1,324 @@
+"""
+Shared Ollama client used by the ollama-*.py scripts.
+
+One pooled keep-alive requests.Session is reused for every call, so a batch
+of prompts pays TCP/HTTP setup once per pooled connection instead of once per
+prompt. generate_many() keeps up to max_workers prompts in flight and yields
+results as they finish.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from genaiprompt import metrics, ndjson, paths
+
+OLLAMA_URL = "http://localhost:11434"
+OLLAMA_DEFAULT_TEMPERATURE = 0.8
+
+
+class OllamaError(RuntimeError):
+    """Raised when the Ollama API answers with a non-200 status."""
+
+
+def _same_model(name, model):
+    """Match "llama4:latest" against "llama4" as well as exact tags."""
+    return name == model or name.split(":")[0] == model
+
+
+class OllamaClient:
+    def __init__(self, model, base_url=OLLAMA_URL, max_workers=4, timeout=None, recorder=None,
+                 keep_alive=None, tags_ttl=300):
+        self.model = model
+        self.recorder = recorder
+        self.keep_alive = keep_alive
+        self.tags_ttl = tags_ttl
+        self.base_url = base_url.rstrip("/")
+        url_key = hashlib.sha1(self.base_url.encode()).hexdigest()[:12]
+        self.tags_cache = paths.cache_path(f"ollama-tags-{url_key}.json")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def list_models(self, refresh=False):
+        """Return the /api/tags model list, cached on disk for tags_ttl seconds."""
+        if not refresh and self.tags_ttl:
+            try:
+                with open(self.tags_cache, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+                if time.time() - cached["time"] < self.tags_ttl:
+                    return cached["models"]
+            except (OSError, ValueError, KeyError):
+                pass
+        resp = self.session.get(f"{self.base_url}/api/tags", timeout=10)
+        if resp.status_code != 200:
+            raise OllamaError(f"Ollama API {resp.status_code}\n{resp.text}")
+        models = resp.json().get("models", [])
+        if self.tags_ttl:
+            with open(self.tags_cache, "w", encoding="utf-8") as f:
+                json.dump({"time": time.time(), "models": models}, f)
+        return models
+
+    def forget_models(self):
+        """Drop the cached tags so the next lookup asks the server."""
+        try:
+            os.remove(self.tags_cache)
+        except OSError:
+            pass
+
+    def has_model(self, model=None, refresh=False):
+        model = model or self.model
+        return any(_same_model(m.get("name", ""), model) for m in self.list_models(refresh))
+
+    def pick_fallback(self, exclude=None):
+        """Return the smallest locally present model other than `exclude`, or None."""
+        models = [m for m in self.list_models() if not _same_model(m.get("name", ""), exclude or "")]
+        if not models:
+            return None
+        return min(models, key=lambda m: m.get("size") or 0)["name"]
+
+    def start_pull(self, model=None, retries=5, show_progress=False):
+        """Pull a model on a background thread and return the PullJob."""
+        job = PullJob(self, model or self.model, retries=retries, show_progress=show_progress)
+        job.start()
+        return job
+
+    def warm_up(self, model=None):
+        """Load the model with an empty request and pin it for keep_alive.
+
+        Returns GenerationMetrics with load_seconds set from the server's
+        load_duration (near zero when the model was already resident).
+        """
+        model = model or self.model
+        data = {"model": model, "prompt": "", "stream": False}
+        if self.keep_alive is not None:
+            data["keep_alive"] = self.keep_alive
+        start = time.monotonic()
+        resp = self.session.post(f"{self.base_url}/api/generate", json=data, timeout=self.timeout)
+        if resp.status_code != 200:
+            if resp.status_code == 404:
+                self.forget_models()
+            raise OllamaError(f"Ollama API {resp.status_code}\n{resp.text}")
+        return metrics.from_ollama(model, resp.json(), total_seconds=time.monotonic() - start)
+
+    def unload(self, model=None):
+        """Ask the server to drop the model from memory now (keep_alive 0)."""
+        resp = self.session.post(f"{self.base_url}/api/generate", json={"model": model or self.model, "keep_alive": 0},
+                                 timeout=self.timeout)
+        if resp.status_code != 200:
+            raise OllamaError(f"Ollama API {resp.status_code}\n{resp.text}")
+
+    def iter_messages(self, prompt, **options):
+        """Yield the decoded NDJSON messages streamed by /api/generate.
+
+        Messages only carry ndjson.GENERATE_FIELDS.
+        """
+        data = {"model": self.model, "prompt": prompt, "stream": True, **options}
+        if self.keep_alive is not None:
+            data.setdefault("keep_alive", self.keep_alive)
+        with self.session.post(f"{self.base_url}/api/generate", json=data, stream=True, timeout=self.timeout) as resp:
+            if resp.status_code != 200:
+                raise OllamaError(f"Ollama API {resp.status_code}\n{resp.text}")
+            yield from ndjson.iter_response(resp, ndjson.GENERATE_FIELDS)
+
+    def stream(self, prompt, result=None, **options):
+        """Yield response tokens as they arrive.
+
+        If a `result` dict is passed it is filled in once the stream ends,
+        with the same keys generate() returns. Tokens are collected in a
+        list and joined once at the end.
+        """
+        parts = []
+        done_msg = {}
+        ttft = None
+        start = time.monotonic()
+        for msg in self.iter_messages(prompt, **options):
+            token = msg.get("response")
+            if token:
+                if ttft is None:
+                    ttft = time.monotonic() - start
+                parts.append(token)
+                yield token
+            if msg.get("done"):
+                done_msg = msg
+        elapsed = time.monotonic() - start
+        result_metrics = metrics.from_ollama(self.model, done_msg, ttft=ttft, total_seconds=elapsed)
+        if self.recorder:
+            self.recorder.record(result_metrics)
+        if result is not None:
+            result.update({
+                "prompt": prompt,
+                "response": "".join(parts),
+                "tokens": result_metrics.eval_tokens or len(parts),
+                "elapsed": elapsed,
+                "metrics": result_metrics,
+            })
+
+    def generate(self, prompt, on_token=None, **options):
+        """Stream one completion and return a result dict.
+
+        on_token(token, token_count) is called for every streamed token. Extra
+        keyword arguments are passed through to /api/generate. The result's
+        "metrics" come from the server-reported counters in the final
+        message, plus the client-side time to first token.
+        """
+        result = {}
+        for token_count, token in enumerate(self.stream(prompt, result, **options), 1):
+            if on_token:
+                on_token(token, token_count)
+        return result
+
+    def generate_many(self, prompts, max_workers=None, **options):
+        """Run prompts concurrently and yield (index, result) as each one finishes.
+
+        prompts may be any iterable, including a lazy iterator; at most
+        max_workers prompts are pulled from it and in flight at a time. A
+        failed prompt yields a result with an "error" key instead of raising.
+        """
+        max_workers = max_workers or self.max_workers
+        prompts = iter(enumerate(prompts))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = {}
+
+            def submit_next():
+                for index, prompt in prompts:
+                    pending[pool.submit(self.generate, prompt, **options)] = (index, prompt)
+                    return True
+                return False
+
+            for _ in range(max_workers):
+                if not submit_next():
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, prompt = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"prompt": prompt, "error": str(e)}
+                    yield index, result
+                    submit_next()
+
+
+class PullJob(threading.Thread):
+    """Pull a model, retrying interrupted downloads.
+
+    Ollama keeps partially downloaded blobs, so re-issuing /api/pull after a
+    dropped connection resumes where it stopped instead of starting over.
+    status/completed/total track the latest progress message.
+    """
+
+    def __init__(self, client, model, retries=5, backoff=2.0, show_progress=False):
+        super().__init__(daemon=True)
+        self.client = client
+        self.model = model
+        self.retries = retries
+        self.backoff = backoff
+        self.show_progress = show_progress
+        self.status = "queued"
+        self.completed = self.total = None
+        self.succeeded = False
+        self.error = None
+
+    def progress(self):
+        if self.total and self.completed is not None:
+            return f"{self.status} {self.completed / self.total:.0%}"
+        return self.status
+
+    def run(self):
+        for attempt in range(self.retries + 1):
+            try:
+                self._pull_once()
+                if self.succeeded:
+                    self.client.forget_models()
+                    return
+            except (OllamaError, requests.RequestException) as e:
+                self.error = e
+            if attempt < self.retries:
+                self.status = f"retrying ({attempt + 1}/{self.retries})"
+                time.sleep(self.backoff * (attempt + 1))
+
+    def _pull_once(self):
+        url = f"{self.client.base_url}/api/pull"
+        with self.client.session.post(url, json={"name": self.model}, stream=True) as resp:
+            if resp.status_code != 200:
+                raise OllamaError(f"Ollama API {resp.status_code}\n{resp.text}")
+            for msg in ndjson.iter_response(resp, ndjson.PULL_FIELDS):
+                if msg.get("error"):
+                    raise OllamaError(msg["error"])
+                self.status = msg.get("status") or msg.get("digest") or self.status
+                self.completed, self.total = msg.get("completed"), msg.get("total")
+                if self.show_progress:
+                    print(f"\r{self.progress()}", end="", flush=True)
+                if self.status == "success":
+                    self.succeeded = True
+
+
+def prepare_model(client):
+    """Make client.model ready for the CLIs and print a startup report.
+
+    If the model is missing it is pulled in the background while the CLI
+    starts on the smallest model already present; returns that PullJob
+    (None if no pull was needed). Raises OllamaError if nothing can be served.
+    """
+    wanted, job = client.model, None
+    if not client.has_model(wanted):
+        print(f"Model '{wanted}' not found locally; pulling it in the background.")
+        job = client.start_pull(wanted)
+        fallback = client.pick_fallback(exclude=wanted)
+        if fallback is None:
+            print("No other local model to start on; waiting for the pull...")
+            job.show_progress = True
+            job.join()
+            print()
+            if not job.succeeded:
+                raise OllamaError(f"Model pull failed: {job.error}")
+            job = None
+        else:
+            print(f"Starting on '{fallback}' until the pull completes.")
+            client.model = fallback
+    report_warm_up(client)
+    return job
+
+
+def switch_when_pulled(client, job, model):
+    """Switch to `model` once its background pull has finished; returns the job still pending, if any."""
+    if job is None or job.is_alive():
+        return job
+    if job.succeeded:
+        print(f"Model '{model}' pull complete; switching from '{client.model}'.")
+        client.model = model
+        report_warm_up(client)
+    else:
+        print(f"Model '{model}' pull failed ({job.error}); staying on '{client.model}'.")
+    return None
+
+
+def report_warm_up(client):
+    """Warm up client.model and print how long loading took, apart from any prompt."""
+    print(f"Warming up '{client.model}'...", end="", flush=True)
+    warm = client.warm_up()
+    keep = f", kept loaded for {client.keep_alive}" if client.keep_alive is not None else ""
+    print(f"\rModel '{client.model}' ready: load {warm.load_seconds or 0:.2f}s "
+          f"(warm-up request {warm.total_seconds:.2f}s){keep}.")
+    return warm
+
@@ -0,0 +1,12 @@
+"""Locations of the on-disk caches written by genaiprompt."""
+
+import os
+
+CACHE_DIR = os.environ.get("GENAIPROMPT_CACHE") or os.path.join(os.path.expanduser("~"), ".cache", "genaiprompt")
+
+
+def cache_path(*parts):
+    """Return a path under CACHE_DIR, creating its parent directory."""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
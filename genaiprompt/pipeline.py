@@ -0,0 +1,355 @@
+"""
+Non-interactive pipeline: push a corpus of prompts through any preset.
+
+Prompts are streamed from a JSONL, CSV or text file (or stdin), answered
+with bounded parallelism and appended to a JSONL file as they finish, one
+record per prompt with its latency and token counts:
+
+    python -m genaiprompt.pipeline --model llama4 --input prompts.jsonl --output answers.jsonl --jobs 8
+    cat questions.csv | python -m genaiprompt.pipeline --model llama3-8b-gguf --format csv --output answers.jsonl
+
+Records carry the prompt's input position as "index" (and its "id" field
+when the input has one), since they are written in completion order.
+Ollama presets run --jobs requests at once (the server schedules them);
+llama.cpp and transformers models answer one prompt at a time.
+
+A checkpoint next to the output (answers.jsonl.checkpoint) records which
+input positions are done and how much of the output is valid. Running the
+same command again after a crash or Ctrl-C truncates the output to the
+checkpoint and carries on with the remaining prompts; --restart starts
+over. Memory use does not grow with the input: prompts are read lazily, at
+most --jobs are in flight, and the checkpoint only lists the finished
+positions above the first unfinished one.
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from genaiprompt import config
+from genaiprompt.metrics import MetricsRecorder, percentile
+
+FORMATS = ("auto", "jsonl", "csv", "text")
+CHECKPOINT_VERSION = 1
+CHECKPOINT_INTERVAL = 1.0  # seconds between checkpoint writes (output lines past it are redone on resume)
+
+
+class ItemRecorder(MetricsRecorder):
+    """Recorder for long runs: appends to the metrics file but keeps no history.
+
+    Each worker thread picks up the metrics of its own last request with take().
+    """
+
+    def __init__(self, path=None):
+        super().__init__(path)
+        self._local = threading.local()
+
+    def record(self, metrics):
+        if self.path:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(metrics.to_dict()) + "\n")
+        self._local.last = metrics
+        return metrics
+
+    def take(self):
+        metrics, self._local.last = getattr(self._local, "last", None), None
+        return metrics
+
+
+class LatencySample:
+    """Latencies for the run summary, kept as a fixed-size uniform reservoir so memory stays flat."""
+
+    def __init__(self, size=10000, seed=0):
+        self.size = size
+        self.count = 0
+        self.values = []
+        self._random = random.Random(seed)
+
+    def add(self, latency):
+        self.count += 1
+        if len(self.values) < self.size:
+            self.values.append(latency)
+        else:
+            slot = self._random.randrange(self.count)
+            if slot < self.size:
+                self.values[slot] = latency
+
+    def percentile(self, pct):
+        return percentile(self.values, pct)
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".json", ".ndjson"):
+        return "jsonl"
+    if extension in (".csv", ".tsv"):
+        return "csv"
+    return "text"
+
+
+def read_items(path="-", fmt="auto", prompt_field="prompt", id_field="id"):
+    """Yield {"index", "prompt"[, "id"]} for every record of the input, lazily.
+
+    JSONL records are objects with `prompt_field` (or bare JSON strings), CSV
+    rows need a `prompt_field` column, text input is one prompt per line
+    (lines that are JSON objects are read as JSONL). Blank lines are
+    skipped; a record without a prompt gets an "error" instead.
+    """
+    if fmt == "auto":
+        fmt = detect_format(path) if path != "-" else "text"
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8", newline="")
+    try:
+        if fmt == "csv":
+            dialect = "excel-tab" if path.lower().endswith(".tsv") else "excel"
+            records = csv.DictReader(f, dialect=dialect)
+        else:
+            records = (line.rstrip("\r\n") for line in f if line.strip())
+        for index, record in enumerate(records):
+            if isinstance(record, str) and (fmt == "jsonl" or record.lstrip().startswith("{")):
+                try:
+                    record = json.loads(record)
+                except ValueError:
+                    if fmt == "jsonl":
+                        yield {"index": index, "error": "invalid JSON"}
+                        continue
+            item = {"index": index}
+            if isinstance(record, dict):
+                if record.get(id_field) not in (None, ""):
+                    item["id"] = record[id_field]
+                record = record.get(prompt_field)
+            if not isinstance(record, str) or not record.strip():
+                item["error"] = f"no '{prompt_field}' in the record"
+            else:
+                item["prompt"] = record
+            yield item
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+class Checkpoint:
+    """Which input positions are in the output, and how many output bytes are valid.
+
+    A position is done when it is below `next` or listed in `done`; `done`
+    only holds the positions finished ahead of the first unfinished one, so
+    it stays as small as the number of requests in flight.
+    """
+
+    def __init__(self, path, input_name, output):
+        self.path = path
+        self.input = input_name
+        self.output = output
+        self.next = 0
+        self.done = set()
+        self.offset = 0
+        self.answered = 0
+        self.failed = 0
+        self.finished = False
+        self._saved = 0.0
+
+    @classmethod
+    def load(cls, path, input_name, output):
+        """The checkpoint at `path`, or None when there is none; raises ValueError if it is for another run."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        if data.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"{path} was written by another version; use --restart")
+        if data["input"] != input_name or data["output"] != output:
+            raise ValueError(f"{path} belongs to a run of {data['input']} -> {data['output']}; use --restart")
+        checkpoint = cls(path, input_name, output)
+        checkpoint.next = data["next"]
+        checkpoint.done = set(data["done"])
+        checkpoint.offset = data["offset"]
+        checkpoint.answered = data["answered"]
+        checkpoint.failed = data["failed"]
+        checkpoint.finished = data["finished"]
+        return checkpoint
+
+    def is_done(self, index):
+        return index < self.next or index in self.done
+
+    def mark(self, index, offset, failed=False):
+        """Record that `index` is written and the output is valid up to `offset` bytes."""
+        self.done.add(index)
+        while self.next in self.done:
+            self.done.remove(self.next)
+            self.next += 1
+        self.offset = offset
+        if failed:
+            self.failed += 1
+        else:
+            self.answered += 1
+
+    def save(self, force=True):
+        """Write the checkpoint atomically; without force, at most every CHECKPOINT_INTERVAL seconds."""
+        now = time.monotonic()
+        if not force and now - self._saved < CHECKPOINT_INTERVAL:
+            return
+        data = {
+            "version": CHECKPOINT_VERSION, "input": self.input, "output": self.output, "next": self.next,
+            "done": sorted(self.done), "offset": self.offset, "answered": self.answered, "failed": self.failed,
+            "finished": self.finished,
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+        self._saved = now
+
+
+def answer(backend, item, lock, params):
+    """Generate the output record for one input item."""
+    record = {key: item[key] for key in ("index", "id") if key in item}
+    if "error" in item:
+        return {**record, "error": item["error"]}
+    record["prompt"] = item["prompt"]
+    start = time.perf_counter()
+    try:
+        with lock:
+            backend.recorder.take()
+            response = backend.generate(item["prompt"], **params)
+            metrics = backend.recorder.take()
+    except Exception as e:
+        return {**record, "error": str(e), "latency": round(time.perf_counter() - start, 4)}
+    record.update(response=response.strip(), latency=round(time.perf_counter() - start, 4))
+    if metrics is not None:
+        record.update(prompt_tokens=metrics.prompt_tokens, tokens=metrics.eval_tokens,
+                      ttft=round(metrics.ttft, 4) if metrics.ttft is not None else None,
+                      tokens_per_second=round(metrics.tokens_per_second, 2) if metrics.tokens_per_second else None)
+    return record
+
+
+def run_pipeline(backend, items, out, checkpoint, jobs=1, params=None, log=sys.stderr):
+    """Answer every item not yet in the checkpoint, appending records to `out` as they finish.
+
+    `out` is the output file opened for appending at checkpoint.offset. At
+    most `jobs` items are in flight; backends other than Ollama run one at a
+    time whatever `jobs` is. Returns a LatencySample of this run's answers.
+    """
+    params = params or {}
+    # The Ollama server schedules concurrent requests itself; local models are not thread-safe.
+    lock = contextlib.nullcontext() if backend.name == "ollama" else threading.Lock()
+    jobs = jobs if backend.name == "ollama" else 1
+    items = (item for item in items if not checkpoint.is_done(item["index"]))
+    latencies = LatencySample()
+    start = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    pending = set()
+
+    def submit_next():
+        for item in items:
+            pending.add(pool.submit(answer, backend, item, lock, params))
+            return True
+        return False
+
+    try:
+        for _ in range(jobs):
+            if not submit_next():
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                checkpoint.mark(record["index"], out.tell(), failed="error" in record)
+                checkpoint.save(force=False)
+                if "error" not in record:
+                    latencies.add(record["latency"])
+                if log and latencies.count and latencies.count % 100 == 0 and "error" not in record:
+                    rate = latencies.count / (time.monotonic() - start)
+                    print(f"{latencies.count} answered this run, {rate:.2f} prompts/s", file=log)
+                submit_next()
+        checkpoint.finished = True
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        checkpoint.save()
+    return latencies
+
+
+def open_output(path, checkpoint):
+    """Open the output for appending, dropping anything written after the checkpoint."""
+    with open(path, "ab") as f:
+        f.truncate(checkpoint.offset)
+    return open(path, "a", encoding="utf-8")
+
+
+def main(argv=None):
+    from genaiprompt.cli import build_backend
+
+    parser = argparse.ArgumentParser(description="Answer a file of prompts with any preset, resumably.")
+    parser.add_argument("--model", required=True, help="model preset name (see python -m genaiprompt --list)")
+    parser.add_argument("--config", help="JSON file with extra or overriding model presets")
+    parser.add_argument("--input", default="-", help="JSONL, CSV or text file of prompts, '-' for stdin")
+    parser.add_argument("--output", required=True, help="JSONL file the answers are appended to")
+    parser.add_argument("--format", choices=FORMATS, default="auto", help="input format (default: by extension)")
+    parser.add_argument("--prompt-field", default="prompt", help="JSON field / CSV column with the prompt")
+    parser.add_argument("--id-field", default="id", help="JSON field / CSV column copied to the output as 'id'")
+    parser.add_argument("--jobs", type=int, default=4, help="requests in flight (Ollama presets)")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: OUTPUT.checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and overwrite the output")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output)
+    input_name = os.path.abspath(args.input) if args.input != "-" else "-"
+    checkpoint_path = args.checkpoint or output + ".checkpoint"
+    try:
+        checkpoint = None if args.restart else Checkpoint.load(checkpoint_path, input_name, output)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if checkpoint is None:
+        if os.path.exists(output) and os.path.getsize(output) and not args.restart:
+            print(f"{args.output} exists without a checkpoint; use --restart to overwrite it.", file=sys.stderr)
+            return 2
+        checkpoint = Checkpoint(checkpoint_path, input_name, output)
+    elif checkpoint.offset > (os.path.getsize(output) if os.path.exists(output) else 0):
+        print(f"{args.output} is shorter than its checkpoint; use --restart.", file=sys.stderr)
+        return 2
+    elif checkpoint.finished:
+        print(f"{args.output} is complete ({checkpoint.answered} answered, {checkpoint.failed} failed).",
+              file=sys.stderr)
+        return 0
+    else:
+        print(f"Resuming: {checkpoint.answered + checkpoint.failed} prompts already done.", file=sys.stderr)
+
+    preset = config.get_preset(args.model, args.config)
+    if preset["backend"] == "ollama":
+        # One pooled connection per request in flight.
+        preset = {**preset, "max_workers": max(args.jobs, preset.get("max_workers", 1))}
+    backend = build_backend(preset, batch_mode=True, recorder=ItemRecorder(os.environ.get("GENAIPROMPT_METRICS")))
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            load_seconds = backend.load()
+        print(f"Model '{args.model}' ({backend.name}) loaded in {load_seconds:.1f} seconds.", file=sys.stderr)
+        items = read_items(args.input, args.format, args.prompt_field, args.id_field)
+        start = time.time()
+        with open_output(output, checkpoint) as out:
+            try:
+                latencies = run_pipeline(backend, items, out, checkpoint, jobs=args.jobs)
+            except KeyboardInterrupt:
+                print("\nInterrupted; run the same command to resume.", file=sys.stderr)
+                return 130
+    finally:
+        backend.close()
+    elapsed = time.time() - start
+    summary = f"Answered {latencies.count} prompts in {elapsed:.1f}s"
+    if latencies.count:
+        summary += f" (latency p50 {latencies.percentile(50):.2f}s, p95 {latencies.percentile(95):.2f}s)"
+    print(f"{summary}; {checkpoint.failed} failed in total.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+Prompt/response cache shared by the Ollama, llama.cpp and transformers scripts.
+
+Entries are keyed on backend, model, prompt and generation parameters. Lookups
+hit an in-memory LRU first, then an SQLite file on disk whose entries are
+evicted by age and by total size. Sampled runs (temperature > 0 or
+do_sample=True) bypass the cache unless cache_sampled is set, since their
+output is not expected to repeat.
+
+Environment:
+    GENAIPROMPT_RESPONSE_CACHE=0    disable the cache in the CLIs
+    GENAIPROMPT_CACHE_SAMPLED=1     also cache sampled runs
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from genaiprompt import paths
+
+
+def is_sampled(params):
+    """True when the parameters ask for non-deterministic sampling."""
+    if params.get("do_sample"):
+        return True
+    temperature = params.get("temperature")
+    return temperature is not None and temperature > 0
+
+
+def cache_key(backend, model, prompt, params):
+    payload = json.dumps([backend, model, prompt, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=None, memory_entries=256, max_bytes=256 * 1024 * 1024,
+                 max_age=7 * 24 * 3600, cache_sampled=False):
+        self.path = path or paths.cache_path("responses.sqlite3")
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.cache_sampled = cache_sampled
+        self.hits = self.disk_hits = self.misses = self.bypassed = 0
+        self.saved_seconds = 0.0
+        self._memory = OrderedDict()  # key -> (created, entry)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.commit()
+        self.evict()
+
+    def close(self):
+        self._db.close()
+
+    def get(self, key):
+        """Return the cached entry dict for key, or None."""
+        oldest = time.time() - self.max_age
+        with self._lock:
+            created, entry = self._memory.get(key, (None, None))
+            if entry is not None and created < oldest:
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += entry.get("elapsed") or 0
+                return entry
+            row = self._db.execute(
+                "SELECT value, created FROM responses WHERE key = ? AND created >= ?",
+                (key, oldest),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            entry = json.loads(row[0])
+            self._remember(key, entry, row[1])
+            self.hits += 1
+            self.disk_hits += 1
+            self.saved_seconds += entry.get("elapsed") or 0
+            return entry
+
+    def put(self, key, entry):
+        value = json.dumps(entry)
+        now = time.time()
+        with self._lock:
+            self._remember(key, entry, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._db.commit()
+        self.evict()
+
+    def evict(self):
+        """Drop entries older than max_age, then least recently used ones until under max_bytes."""
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+                doomed = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((key,))
+                    total -= size
+                self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self._db.commit()
+
+    def _remember(self, key, entry, created):
+        self._memory[key] = (created, entry)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_or_generate(self, backend, model, prompt, params, generate):
+        """Return (response_text, hit) for the request, calling generate() on a miss.
+
+        generate() must return the response text. Sampled requests are passed
+        straight through (and counted as bypassed) unless cache_sampled is set.
+        """
+        if is_sampled(params) and not self.cache_sampled:
+            self.bypassed += 1
+            return generate(), False
+        key = cache_key(backend, model, prompt, params)
+        entry = self.get(key)
+        if entry is not None:
+            return entry["response"], True
+        start = time.time()
+        response = generate()
+        self.put(key, {"response": response, "elapsed": time.time() - start})
+        return response, False
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "saved_seconds": self.saved_seconds,
+        }
+
+    def summary(self):
+        return (f"Cache: {self.hits} hits ({self.disk_hits} from disk), {self.misses} misses, "
+                f"{self.bypassed} bypassed, {self.saved_seconds:.1f}s saved")
+
+
+def default_cache():
+    """Cache used by the CLIs, or None when GENAIPROMPT_RESPONSE_CACHE=0."""
+    if os.environ.get("GENAIPROMPT_RESPONSE_CACHE", "1") == "0":
+        return None
+    return ResponseCache(cache_sampled=os.environ.get("GENAIPROMPT_CACHE_SAMPLED") == "1")
@@ -0,0 +1,413 @@
+"""
+Serve several model presets from one long-running process.
+
+ModelRouter routes each request to a backend by preset name and keeps a
+residency table of loaded models. Models stay loaded after use; when a new
+model does not fit the memory budget (or --max-models), the least recently
+used idle models are unloaded first. The budget uses the same format as the
+70B preset's max_memory, one limit per device:
+
+    {0: "24GiB", "cpu": "48GiB", "ollama": "24GiB"}
+
+A model is charged to the GPU (0) when it is offloaded there, otherwise to
+"cpu"; Ollama models live in the Ollama server and are charged to "ollama".
+Presets with their own max_memory are split across devices the way
+device_map="auto" fills them. Devices missing from the budget are not
+limited. A preset's "memory" field overrides the size estimate.
+
+    python -m genaiprompt.router --budget 0=24GiB,cpu=48GiB --max-models 3
+    > @mistral what is a reverse proxy?
+    > @llama3-8b-gguf and in one sentence?
+    > :models
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from genaiprompt import config
+from genaiprompt.backends import create_backend
+from genaiprompt.metrics import MetricsRecorder
+
+SIZE_UNITS = {"": 1, "B": 1, "KB": 10**3, "MB": 10**6, "GB": 10**9, "TB": 10**12,
+              "KIB": 2**10, "MIB": 2**20, "GIB": 2**30, "TIB": 2**40}
+DTYPE_BYTES = {"float32": 4, "float16": 2, "bfloat16": 2, "int8": 1}
+# Preset fields read by the router (or the interactive CLI) rather than the backends.
+ROUTER_FIELDS = ("memory", "device", "ask_token")
+
+
+class RouterError(RuntimeError):
+    pass
+
+
+def parse_size(value):
+    """Bytes from an int or a string such as "24GiB" or "500MB"."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([A-Za-z]*)\s*", str(value))
+    if not match or match.group(2).upper() not in SIZE_UNITS:
+        raise ValueError(f"Invalid size '{value}'")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def format_size(n):
+    if n is None:
+        return "?"
+    if n >= 2**30:
+        return f"{n / 2**30:.1f}GiB"
+    return f"{n / 2**20:.0f}MiB" if n >= 2**20 else f"{n / 2**10:.0f}KiB"
+
+
+def parse_budget(text):
+    """Budget from JSON or "0=24GiB,cpu=48GiB"; returns {device: bytes} with string device keys."""
+    if not text:
+        return {}
+    if text.lstrip().startswith("{"):
+        items = json.loads(text).items()
+    else:
+        items = (part.split("=", 1) for part in text.split(",") if part)
+    return {str(device).strip(): parse_size(size) for device, size in items}
+
+
+def _transformers_bytes(preset):
+    from genaiprompt.fast_load import indexed_snapshot
+
+    path = indexed_snapshot(preset["model"])
+    if not path:
+        return None
+    weights = [f for f in os.listdir(path) if f.endswith((".safetensors", ".bin"))]
+    size = sum(os.path.getsize(os.path.join(path, f)) for f in weights)
+    try:
+        with open(os.path.join(path, "config.json"), "r", encoding="utf-8") as f:
+            model_config = json.load(f)
+        stored = model_config.get("torch_dtype") or model_config.get("dtype") or "float32"
+    except (OSError, ValueError):
+        stored = "float32"
+    target = preset.get("torch_dtype", "float16")
+    if target not in DTYPE_BYTES or stored not in DTYPE_BYTES:
+        return size
+    return size * DTYPE_BYTES[target] // DTYPE_BYTES[stored]
+
+
+def _ollama_bytes(preset):
+    from genaiprompt.ollama_client import OLLAMA_URL, OllamaClient, _same_model
+
+    with OllamaClient(preset["model"], preset.get("url", OLLAMA_URL)) as client:
+        try:
+            models = client.list_models()
+        except Exception:
+            return None
+    return next((m.get("size") for m in models if _same_model(m.get("name", ""), preset["model"])), None)
+
+
+def estimate_bytes(preset):
+    """Rough memory a preset needs before it is loaded, or None if unknown."""
+    if "memory" in preset:
+        return parse_size(preset["memory"])
+    backend = preset["backend"]
+    if backend == "llama_cpp":
+        return os.path.getsize(preset["model"]) if os.path.exists(preset["model"]) else None
+    if backend == "transformers":
+        return _transformers_bytes(preset)
+    if backend == "ollama":
+        return _ollama_bytes(preset)
+    return None
+
+
+def default_device(preset):
+    if "device" in preset:
+        return str(preset["device"])
+    backend = preset["backend"]
+    if backend == "ollama":
+        return "ollama"
+    if backend == "llama_cpp":
+        return "0" if preset.get("n_gpu_layers") else "cpu"
+    import torch
+
+    return "0" if torch.cuda.is_available() else "cpu"
+
+
+def placement(preset, size):
+    """{device: bytes} for a model of `size` bytes, filling the preset's max_memory caps in order."""
+    if not size:
+        return {}
+    caps = preset.get("max_memory")
+    if not caps:
+        return {default_device(preset): size}
+    split, remaining = {}, size
+    for device, cap in caps.items():
+        take = min(remaining, parse_size(cap))
+        if take:
+            split[str(device)] = take
+        remaining -= take
+        if not remaining:
+            break
+    if remaining:
+        last = str(list(caps)[-1])
+        split[last] = split.get(last, 0) + remaining
+    return split
+
+
+class Resident:
+    """One loaded model in the residency table."""
+
+    def __init__(self, name, backend, memory, load_seconds):
+        self.name = name
+        self.backend = backend
+        self.memory = memory
+        self.load_seconds = load_seconds
+        self.last_used = time.time()
+        self.requests = 0
+        self.users = 0
+
+    def to_dict(self):
+        return {
+            "model": self.name,
+            "backend": self.backend.name,
+            "memory": {device: size for device, size in self.memory.items()},
+            "load_seconds": self.load_seconds,
+            "idle_seconds": 0.0 if self.users else time.time() - self.last_used,
+            "requests": self.requests,
+            "in_use": self.users,
+        }
+
+
+class ModelRouter:
+    """Route requests to presets by name, keeping hot models loaded within a memory budget."""
+
+    def __init__(self, presets=None, budget=None, max_models=None, idle_timeout=None, recorder=None, wait_timeout=600):
+        self.presets = presets if presets is not None else config.load_models()
+        self.budget = {str(device): parse_size(size) for device, size in (budget or {}).items()}
+        self.max_models = max_models
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.recorder = recorder or MetricsRecorder()
+        self.resident = OrderedDict()  # least recently used first
+        self._loading = {}  # name -> memory reserved while it loads
+        self._cond = threading.Condition()
+
+    def _used(self, without=()):
+        used = {}
+        kept = [r.memory for r in self.resident.values() if r not in without]
+        for memory in kept + list(self._loading.values()):
+            for device, size in memory.items():
+                used[device] = used.get(device, 0) + size
+        return used
+
+    def _overflow(self, need, without=()):
+        """Devices that would exceed the budget, plus "count" when max_models would be exceeded.
+
+        Residents in `without` are counted as already evicted.
+        """
+        used = self._used(without)
+        over = {d for d, size in need.items() if d in self.budget and used.get(d, 0) + size > self.budget[d]}
+        if self.max_models and len(self.resident) - len(without) + len(self._loading) >= self.max_models:
+            over.add("count")
+        return over
+
+    def _make_room(self, name, need):
+        """Pick LRU idle victims until `need` fits; called with the lock held. Returns the victims.
+
+        Victims are only removed from `resident` once `need` is known to fit, so a
+        RouterError leaves every model loaded.
+        """
+        while True:
+            victims = []
+            over = self._overflow(need)
+            while over:
+                candidates = [r for r in self.resident.values() if r not in victims
+                              and r.users == 0 and ("count" in over or over & set(r.memory))]
+                if not candidates:
+                    break
+                victims.append(candidates[0])
+                over = self._overflow(need, victims)
+            if not over:
+                for victim in victims:
+                    del self.resident[victim.name]
+                return victims
+            if any(r.users for r in self.resident.values()) or self._loading:
+                # Busy models may become evictable once their requests finish.
+                if not self._cond.wait(self.wait_timeout):
+                    raise RouterError(f"Timed out waiting for busy models to free memory for '{name}'")
+                continue
+            budget = ", ".join(f"{d}={format_size(b)}" for d, b in self.budget.items())
+            wanted = ", ".join(f"{d}={format_size(b)}" for d, b in need.items())
+            raise RouterError(f"'{name}' needs {wanted or 'a slot'} but the budget is {budget or f'{self.max_models} models'}")
+
+    def _evict_idle(self):
+        if not self.idle_timeout:
+            return []
+        now = time.time()
+        victims = [r for r in self.resident.values() if r.users == 0 and now - r.last_used > self.idle_timeout]
+        for victim in victims:
+            del self.resident[victim.name]
+        return victims
+
+    def _unload(self, victims):
+        for victim in victims:
+            victim.backend.unload()
+
+    def acquire(self, name):
+        """Return the Resident for `name`, loading it (and evicting others) if needed; pair with release()."""
+        if name not in self.presets:
+            raise RouterError(f"Unknown model '{name}' (have: {', '.join(sorted(self.presets))})")
+        preset = dict(self.presets[name])
+        need = None
+        victims = []
+        try:
+            while True:
+                with self._cond:
+                    victims += self._evict_idle()
+                    while name in self._loading:
+                        self._cond.wait()
+                    resident = self.resident.get(name)
+                    if resident:
+                        resident.users += 1
+                        self.resident.move_to_end(name)
+                        break
+                    if need is not None:
+                        victims += self._make_room(name, need)
+                        self._loading[name] = need
+                        break
+                # Estimating can query a server, so it runs without the lock held.
+                need = placement(preset, estimate_bytes(preset))
+        finally:
+            # Idle models already taken out of `resident` are unloaded even if no room was found.
+            self._unload(victims)
+        if resident:
+            return resident
+        try:
+            for key in ROUTER_FIELDS:
+                preset.pop(key, None)
+            if preset["backend"] == "transformers":
+                preset.setdefault("token", os.environ.get("HF_TOKEN") or None)
+            backend = create_backend(preset, recorder=self.recorder)
+            load_seconds = backend.load()
+            measured = backend.memory_bytes()
+            memory = placement(preset, measured) if measured else need
+        except BaseException:
+            with self._cond:
+                del self._loading[name]
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            del self._loading[name]
+            resident = self.resident[name] = Resident(name, backend, memory, load_seconds)
+            resident.users = 1
+            self._cond.notify_all()
+        return resident
+
+    def release(self, resident):
+        with self._cond:
+            resident.users -= 1
+            resident.requests += 1
+            resident.last_used = time.time()
+            self._cond.notify_all()
+
+    @contextmanager
+    def use(self, name):
+        """Context manager yielding the loaded backend for `name`."""
+        resident = self.acquire(name)
+        try:
+            yield resident.backend
+        finally:
+            self.release(resident)
+
+    def generate(self, name, prompt, **params):
+        with self.use(name) as backend:
+            return backend.generate(prompt, **params)
+
+    def stream(self, name, prompt, **params):
+        with self.use(name) as backend:
+            yield from backend.stream(prompt, **params)
+
+    def unload(self, name):
+        """Unload an idle model now; returns False if it is not resident or in use."""
+        with self._cond:
+            resident = self.resident.get(name)
+            if not resident or resident.users:
+                return False
+            del self.resident[name]
+        resident.backend.unload()
+        return True
+
+    def table(self):
+        """Residency table, least recently used first."""
+        with self._cond:
+            return [r.to_dict() for r in self.resident.values()]
+
+    def close(self):
+        with self._cond:
+            residents = list(self.resident.values())
+            self.resident.clear()
+        for resident in residents:
+            resident.backend.close()
+
+
+def print_table(router):
+    rows = router.table()
+    if not rows:
+        print("No models loaded.")
+        return
+    print(f"{'model':<18} {'backend':<13} {'memory':<22} {'load s':>7} {'idle s':>7} {'requests':>8}")
+    for row in rows:
+        memory = ", ".join(f"{d}={format_size(s)}" for d, s in row["memory"].items()) or "?"
+        print(f"{row['model']:<18} {row['backend']:<13} {memory:<22} {row['load_seconds']:7.1f} "
+              f"{row['idle_seconds']:7.0f} {row['requests']:>8}")
+
+
+if __name__ == "__main__":
+    from genaiprompt.metrics import default_recorder
+    from genaiprompt.streaming import echo
+
+    parser = argparse.ArgumentParser(description="Chat with several models from one process.")
+    parser.add_argument("--config", help="JSON file with extra or overriding model presets")
+    parser.add_argument("--budget", help='per-device memory limits, e.g. "0=24GiB,cpu=48GiB" or JSON')
+    parser.add_argument("--max-models", type=int, help="most models kept loaded at once")
+    parser.add_argument("--idle-timeout", type=float, help="unload models idle for this many seconds")
+    parser.add_argument("--model", help="model used for prompts without an @name prefix")
+    parser.add_argument("--preload", default="", help="comma-separated models to load at start")
+    args = parser.parse_args()
+
+    router = ModelRouter(config.load_models(args.config), parse_budget(args.budget), args.max_models,
+                         args.idle_timeout, recorder=default_recorder())
+    current = args.model
+    for name in filter(None, args.preload.split(",")):
+        print(f"Loading {name}...")
+        router.release(router.acquire(name))
+    print("Prefix a prompt with @model to switch models. Commands: :models, :unload NAME, exit.")
+    try:
+        while True:
+            line = input(f"\n[{current or 'no model'}]> ").strip()
+            if line.lower() == "exit":
+                break
+            if line == ":models":
+                print_table(router)
+                continue
+            if line.startswith(":unload "):
+                name = line.split(None, 1)[1]
+                print("Unloaded." if router.unload(name) else f"'{name}' is not loaded or is busy.")
+                continue
+            if line.startswith("@"):
+                current, _, line = line[1:].partition(" ")
+                line = line.strip()
+            if not line:
+                continue
+            if not current:
+                print("Pick a model first: @name prompt")
+                continue
+            start = time.time()
+            try:
+                with router.use(current) as backend:
+                    print(f"({current}, ready in {time.time() - start:.1f}s)")
+                    echo(backend.stream(line))
+                    print("\n" + backend.last_metrics.summary())
+            except Exception as e:
+                print(f"Error: {e}")
+    finally:
+        router.close()
@@ -0,0 +1,423 @@
+"""
+OpenAI-compatible HTTP server over the model presets.
+
+Routes: GET /v1/models, POST /v1/completions, POST /v1/chat/completions
+(with "stream": true for server-sent events), GET /health and GET /metrics
+(Prometheus). Models are loaded on first use and kept within a memory
+budget by genaiprompt.router.ModelRouter; the "model" field of a request
+is a preset name.
+
+- Requests go through a bounded queue: at most --concurrency generate at
+  once and at most --queue-size more wait for a slot. Beyond that the
+  server answers 429 with Retry-After instead of piling up threads.
+- Concurrent requests to a transformers model share forward passes through
+  continuous batching (genaiprompt.continuous_batching) when the model is
+  on a GPU and the installed transformers release supports it; otherwise
+  they run one at a time, as llama.cpp requests always do. A request that
+  sets temperature or top_p differently from the preset also runs on its
+  own, as the batch samples with the preset's settings. Ollama requests run
+  concurrently on the Ollama server.
+- Every request has a deadline (--timeout, or "timeout" in the request
+  body): 503 when no slot frees up in time, 504 when generation overruns.
+  A streamed request that overruns ends with an error event.
+- When a client disconnects, or a stop string is hit, generation stops and
+  the request's batch slot is freed.
+
+    python -m genaiprompt.server --budget 0=24GiB,cpu=48GiB --port 8000
+    curl -N localhost:8000/v1/chat/completions -H "Content-Type: application/json" \\
+        -d '{"model": "mistral", "messages": [{"role": "user", "content": "Hi"}], "stream": true}'
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import math
+import threading
+import time
+import uuid
+import weakref
+
+from genaiprompt import config
+from genaiprompt.metrics import default_recorder
+from genaiprompt.router import ModelRouter, RouterError, parse_budget
+from genaiprompt.templates import PromptTooLong
+
+# Backend-native name of the completion length limit.
+MAX_TOKENS_PARAM = {"ollama": "num_predict", "llama_cpp": "max_tokens", "transformers": "max_new_tokens"}
+CHAT_ROLES = {"system": "System", "user": "User", "assistant": "Assistant"}
+
+
+class GenerationTimeout(Exception):
+    pass
+
+
+class Ticket:
+    """A request admitted to the RequestQueue; start() waits for a running slot, finish() leaves the queue."""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.running = False
+        self.done = False
+
+    def start(self, timeout):
+        self.running = self.queue._slots.acquire(timeout=max(0.0, timeout))
+        return self.running
+
+    def finish(self):
+        with self.queue._lock:
+            if self.done:
+                return
+            self.done = True
+            self.queue._admitted -= 1
+        if self.running:
+            self.queue._slots.release()
+
+
+class RequestQueue:
+    """Bounded admission: `concurrency` requests run, up to `capacity` more wait."""
+
+    def __init__(self, capacity=32, concurrency=8):
+        self.capacity = capacity
+        self.concurrency = concurrency
+        self._admitted = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def admit(self):
+        """A Ticket, or None when the queue is full."""
+        with self._lock:
+            if self._admitted >= self.capacity + self.concurrency:
+                return None
+            self._admitted += 1
+        return Ticket(self)
+
+    @property
+    def depth(self):
+        """Admitted requests (running and waiting)."""
+        return self._admitted
+
+
+def backend_params(backend, max_tokens=None, temperature=None, top_p=None):
+    """Map OpenAI sampling fields to the backend's native generation parameters."""
+    params = {}
+    if max_tokens is not None:
+        params[MAX_TOKENS_PARAM[backend]] = max_tokens
+    if temperature is not None:
+        if backend == "transformers":
+            # transformers samples only with do_sample; temperature 0 means greedy.
+            params["do_sample"] = temperature > 0
+            if temperature > 0:
+                params["temperature"] = temperature
+        else:
+            params["temperature"] = temperature
+    if top_p is not None:
+        params["top_p"] = top_p
+    return params
+
+
+def number(value, kind, name):
+    """A numeric request field as int or float (None stays None); raises ValueError for anything else."""
+    if value is None:
+        return None
+    # bool is an int subclass, and int("12") would accept a string.
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"'{name}' must be a number")
+    # JSON allows Infinity and NaN, which would fail every comparison below or overflow int().
+    if not math.isfinite(value):
+        raise ValueError(f"'{name}' must be a finite number")
+    if kind is int and value != int(value):
+        raise ValueError(f"'{name}' must be an integer")
+    if value < 0 or (kind is int and value == 0):
+        raise ValueError(f"'{name}' must be positive")
+    return kind(value)
+
+
+def stop_strings(value):
+    """The "stop" field as a list of strings; raises ValueError unless it is a string or a list of them."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list) or not all(isinstance(s, str) for s in value):
+        raise ValueError("'stop' must be a string or a list of strings")
+    # An empty stop string would match at once.
+    return [s for s in value if s]
+
+
+def chat_prompt(messages):
+    """Render chat messages as a plain transcript; a lone user message is passed through as is."""
+    if len(messages) == 1 and messages[0].get("role") == "user":
+        return messages[0].get("content") or ""
+    lines = [f"{CHAT_ROLES.get(m.get('role'), 'User')}: {m.get('content') or ''}" for m in messages]
+    return "\n".join(lines + ["Assistant:"])
+
+
+def until_stop(chunks, stop):
+    """Yield text up to the first stop string, holding back text that may be the start of one."""
+    if not stop:
+        yield from chunks
+        return
+    keep = max(len(s) for s in stop) - 1
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        hits = [i for i in (pending.find(s) for s in stop) if i >= 0]
+        if hits:
+            if min(hits):
+                yield pending[:min(hits)]
+            return
+        if len(pending) > keep:
+            yield pending[:len(pending) - keep]
+            pending = pending[len(pending) - keep:]
+    if pending:
+        yield pending
+
+
+class Engine:
+    """Run requests on router-managed backends with deadlines and cancellation."""
+
+    def __init__(self, router):
+        self.router = router
+        self._locks = weakref.WeakKeyDictionary()  # backend -> lock serializing its requests
+        self._lock = threading.Lock()
+
+    def _serial(self, backend):
+        with self._lock:
+            return self._locks.setdefault(backend, threading.Lock())
+
+    def _batcher(self, backend):
+        if backend.name != "transformers":
+            return None
+        with self._lock:
+            return backend.continuous_batcher()
+
+    def stream(self, name, prompt, params, deadline, result):
+        """Yield text chunks; `result` gets prompt_tokens and tokens. Closing the generator cancels generation."""
+        resident = self.router.acquire(name)
+        cancel = threading.Event()
+        try:
+            chunks = self._chunks(resident.backend, prompt, params, deadline, cancel, result)
+            try:
+                for chunk in chunks:
+                    if time.monotonic() > deadline:
+                        break
+                    yield chunk
+                if time.monotonic() > deadline:
+                    raise GenerationTimeout(f"Generation exceeded the request timeout ({result['tokens']} tokens)")
+            finally:
+                cancel.set()
+                chunks.close()
+        finally:
+            self.router.release(resident)
+
+    def _chunks(self, backend, prompt, params, deadline, cancel, result):
+        # max_tokens is the limit in effect, the preset's default when the request has none.
+        limit = MAX_TOKENS_PARAM[backend.name]
+        result.update(prompt_tokens=0, tokens=0, max_tokens=params.get(limit, backend.params.get(limit)))
+        # The batcher samples with the preset's settings, so requests that change them run on their own.
+        batcher = self._batcher(backend) if all(backend.params.get(k) == v for k, v in params.items()
+                                                if k != "max_new_tokens") else None
+        if batcher is not None:
+            max_new_tokens = result["max_tokens"]
+            yield from batcher.stream(prompt, max_new_tokens, should_stop=lambda: time.monotonic() > deadline,
+                                      result=result)
+            return
+        if backend.name == "transformers":
+            params = {**params, "stopping_criteria": _cancel_criteria(cancel, deadline)}
+        # The Ollama server schedules concurrent requests itself.
+        with self._serial(backend) if backend.name != "ollama" else contextlib.nullcontext():
+            # Chunks only approximate tokens (the timeout message uses them); a finished
+            # stream has recorded the exact counts on this thread.
+            for chunk in backend.stream(prompt, **params):
+                result["tokens"] += 1
+                yield chunk
+            metrics = backend.last_metrics
+            result["prompt_tokens"] = metrics.prompt_tokens or 0
+            generated = metrics.generated_tokens if metrics.generated_tokens is not None else metrics.eval_tokens
+            result["tokens"] = generated if generated is not None else result["tokens"]
+
+
+def _cancel_criteria(cancel, deadline):
+    """Stop transformers generate() (running on its own thread) once cancelled or past the deadline."""
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class Cancelled(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return cancel.is_set() or time.monotonic() > deadline
+
+    return StoppingCriteriaList([Cancelled()])
+
+
+def create_app(router, queue=None, timeout=120.0):
+    from flask import Flask, Response, jsonify, request
+
+    app = Flask("genaiprompt")
+    engine = Engine(router)
+    queue = queue or RequestQueue()
+
+    def error(status, message, kind="invalid_request_error", headers=None):
+        response = jsonify({"error": {"message": message, "type": kind, "code": status}})
+        response.status_code = status
+        response.headers.update(headers or {})
+        return response
+
+    def usage(result):
+        return {"prompt_tokens": result["prompt_tokens"], "completion_tokens": result["tokens"],
+                "total_tokens": result["prompt_tokens"] + result["tokens"]}
+
+    def finish_reason(result):
+        return "length" if result["max_tokens"] and result["tokens"] >= result["max_tokens"] else "stop"
+
+    def run(body, prompt, chat):
+        """Shared handling of /v1/completions and /v1/chat/completions."""
+        name = body.get("model")
+        if name not in router.presets:
+            return error(404, f"Unknown model '{name}' (have: {', '.join(sorted(router.presets))})",
+                         "not_found_error")
+        try:
+            max_tokens = number(body.get("max_completion_tokens", body.get("max_tokens")), int, "max_tokens")
+            params = backend_params(router.presets[name]["backend"], max_tokens,
+                                    number(body.get("temperature"), float, "temperature"),
+                                    number(body.get("top_p"), float, "top_p"))
+            deadline = time.monotonic() + float(body.get("timeout") or timeout)
+            stop = stop_strings(body.get("stop"))
+        except (TypeError, ValueError) as e:
+            return error(400, f"Invalid parameter: {e}")
+
+        ticket = queue.admit()
+        if ticket is None:
+            return error(429, "Too many requests queued; retry later", "rate_limit_error", {"Retry-After": "1"})
+        if not ticket.start(deadline - time.monotonic()):
+            ticket.finish()
+            return error(503, "Timed out waiting for a free generation slot", "server_error")
+
+        rid = f"{'chatcmpl' if chat else 'cmpl'}-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        result = {}
+        chunks = engine.stream(name, prompt, params, deadline, result)
+
+        def choice(text, reason=None, first=False):
+            if not chat:
+                return {"index": 0, "text": text, "logprobs": None, "finish_reason": reason}
+            if body.get("stream"):
+                delta = {"role": "assistant", "content": text} if first else ({"content": text} if text else {})
+                return {"index": 0, "delta": delta, "finish_reason": reason}
+            return {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": reason}
+
+        def payload(choices, **extra):
+            kind = ("chat.completion.chunk" if body.get("stream") else "chat.completion") if chat else "text_completion"
+            return {"id": rid, "object": kind, "created": created, "model": name, "choices": choices, **extra}
+
+        def failed(e):
+            if isinstance(e, GenerationTimeout):
+                return error(504, str(e), "timeout_error")
+            if isinstance(e, PromptTooLong):
+                return error(400, str(e))
+            return error(503, str(e), "server_error")
+
+        if not body.get("stream"):
+            try:
+                text = "".join(until_stop(chunks, stop))
+            except (GenerationTimeout, PromptTooLong, RouterError) as e:
+                return failed(e)
+            finally:
+                chunks.close()
+                ticket.finish()
+            return jsonify(payload([choice(text, finish_reason(result))], usage=usage(result)))
+
+        # Take the first chunk before the 200 goes out: a prompt that does not fit the
+        # context, or a model that cannot be loaded, still gets its own status code.
+        try:
+            head = [next(chunks)]
+        except StopIteration:
+            head = []
+        except (GenerationTimeout, PromptTooLong, RouterError) as e:
+            chunks.close()
+            ticket.finish()
+            return failed(e)
+
+        def events():
+            # Werkzeug closes this generator when the client disconnects; closing
+            # `chunks` then cancels the generation and frees its slot.
+            first = True
+            try:
+                for text in until_stop(itertools.chain(head, chunks), stop):
+                    yield f"data: {json.dumps(payload([choice(text, first=first)]))}\n\n"
+                    first = False
+                yield f"data: {json.dumps(payload([choice('', finish_reason(result), first)], usage=usage(result)))}\n\n"
+            except (GenerationTimeout, RouterError) as e:
+                kind = "timeout_error" if isinstance(e, GenerationTimeout) else "server_error"
+                yield f"data: {json.dumps({'error': {'message': str(e), 'type': kind}})}\n\n"
+            except Exception as e:
+                yield f"data: {json.dumps({'error': {'message': str(e), 'type': 'server_error'}})}\n\n"
+            finally:
+                chunks.close()
+                ticket.finish()
+            yield "data: [DONE]\n\n"
+
+        response = Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+        # Also frees the slot when the response is dropped before streaming starts.
+        response.call_on_close(ticket.finish)
+        return response
+
+    def json_body():
+        body = request.get_json(silent=True)
+        return body if isinstance(body, dict) else None
+
+    @app.get("/v1/models")
+    def models():
+        loaded = {row["model"] for row in router.table()}
+        data = [{"id": name, "object": "model", "owned_by": preset["backend"], "loaded": name in loaded}
+                for name, preset in sorted(router.presets.items())]
+        return jsonify({"object": "list", "data": data})
+
+    @app.post("/v1/completions")
+    def completions():
+        body = json_body()
+        if body is None or not isinstance(body.get("prompt"), str):
+            return error(400, "Expected a JSON body with a string 'prompt'")
+        return run(body, body["prompt"], chat=False)
+
+    @app.post("/v1/chat/completions")
+    def chat_completions():
+        body = json_body()
+        if body is None or not isinstance(body.get("messages"), list) or not body["messages"]:
+            return error(400, "Expected a JSON body with a non-empty 'messages' list")
+        return run(body, chat_prompt(body["messages"]), chat=True)
+
+    @app.get("/health")
+    def health():
+        return jsonify({"status": "ok", "queued": queue.depth, "models": router.table()})
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(router.recorder.to_prometheus(), mimetype="text/plain; version=0.0.4")
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the model presets over an OpenAI-compatible HTTP API.")
+    parser.add_argument("--config", help="JSON file with extra or overriding model presets")
+    parser.add_argument("--budget", help='per-device memory limits, e.g. "0=24GiB,cpu=48GiB" or JSON')
+    parser.add_argument("--max-models", type=int, help="most models kept loaded at once")
+    parser.add_argument("--idle-timeout", type=float, help="unload models idle for this many seconds")
+    parser.add_argument("--preload", default="", help="comma-separated models to load at start")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--concurrency", type=int, default=8, help="requests generating at once")
+    parser.add_argument("--queue-size", type=int, default=32, help="requests waiting for a slot before 429")
+    parser.add_argument("--timeout", type=float, default=120.0, help="default per-request deadline in seconds")
+    args = parser.parse_args()
+
+    router = ModelRouter(config.load_models(args.config), parse_budget(args.budget), args.max_models,
+                         args.idle_timeout, recorder=default_recorder())
+    for name in filter(None, args.preload.split(",")):
+        print(f"Loading {name}...")
+        router.release(router.acquire(name))
+    app = create_app(router, RequestQueue(args.queue_size, args.concurrency), args.timeout)
+    try:
+        app.run(args.host, args.port, threaded=True)
+    finally:
+        router.close()
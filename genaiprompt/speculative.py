@@ -0,0 +1,250 @@
+"""
+Speculative decoding: a cheap proposer guesses several tokens ahead and the
+target model checks them all in one forward pass, keeping the longest
+agreeing prefix plus one token of its own. Greedy output is unchanged; the
+win depends on how often the guesses are accepted.
+
+- transformers: assisted generation (`assistant_model=` a small draft model
+  sharing the tokenizer) or prompt lookup (`prompt_lookup_num_tokens`, no
+  draft model; guesses come from n-grams already in the prompt/output).
+- llama.cpp: `draft_model=` either LlamaPromptLookupDecoding or a small GGUF
+  model with the same vocabulary (GGUFDraftModel).
+
+Neither library reports acceptance, so it is derived from call counts: every
+target forward pass yields its accepted draft tokens plus one, hence
+accepted = generated - target passes, and acceptance = accepted / proposed.
+
+Compare plain and speculative decoding on the same prompts:
+
+    python -m genaiprompt.speculative --target meta-llama/Llama-3.1-8B-Instruct --draft meta-llama/Llama-3.2-1B-Instruct
+    python -m genaiprompt.speculative --target ./meta-llama-3-8b.Q4_K_M.gguf --draft prompt_lookup
+    python -m genaiprompt.speculative --tiny    # two tiny CPU models, offline
+"""
+
+import argparse
+import os
+from contextlib import contextmanager
+
+PROMPT_LOOKUP = "prompt_lookup"
+
+
+class SpeculationStats:
+    """Counts for one speculative request; `proposed` stays 0 when the proposer cannot be counted."""
+
+    def __init__(self):
+        self.target_passes = 0
+        self.proposed = 0
+        self.generated = 0
+
+    @property
+    def accepted(self):
+        return max(0, self.generated - self.target_passes)
+
+    @property
+    def acceptance_rate(self):
+        if self.proposed:
+            return min(1.0, self.accepted / self.proposed)
+        return None
+
+    @property
+    def tokens_per_pass(self):
+        """Generated tokens per target forward pass (1.0 without speculation)."""
+        if self.target_passes:
+            return self.generated / self.target_passes
+        return None
+
+    def summary(self):
+        parts = [f"Speculative: {self.tokens_per_pass or 0:.2f} tok/target pass"]
+        if self.acceptance_rate is not None:
+            parts.append(f"{self.accepted}/{self.proposed} draft tokens accepted ({self.acceptance_rate:.0%})")
+        return ", ".join(parts)
+
+
+class ForwardCounter:
+    """Count forward calls of torch modules while the context is active."""
+
+    def __init__(self, stats, target, draft=None):
+        self.stats = stats
+        self.modules = [(target, "target_passes")] + ([(draft, "proposed")] if draft is not None else [])
+        self.handles = []
+
+    def _hook(self, attr):
+        def count(module, inputs, output):
+            setattr(self.stats, attr, getattr(self.stats, attr) + 1)
+        return count
+
+    def __enter__(self):
+        self.handles = [module.register_forward_hook(self._hook(attr)) for module, attr in self.modules]
+        return self.stats
+
+    def __exit__(self, *exc):
+        for handle in self.handles:
+            handle.remove()
+
+
+def load_transformers_draft(draft, dtype, device, token=None):
+    """Load a draft model for assisted generation; returns (model, tokenizer)."""
+    from genaiprompt.fast_load import load_causal_lm
+
+    model, tokenizer, _ = load_causal_lm(draft, dtype, device, token=token)
+    return model, tokenizer
+
+
+def assisted_kwargs(draft, tokenizer, draft_model=None, draft_tokenizer=None, num_tokens=None):
+    """generate() kwargs for a draft model or for prompt lookup (draft == PROMPT_LOOKUP)."""
+    if draft == PROMPT_LOOKUP:
+        return {"prompt_lookup_num_tokens": num_tokens or 10}
+    kwargs = {"assistant_model": draft_model}
+    if num_tokens:
+        draft_model.generation_config.num_assistant_tokens = num_tokens
+    if draft_tokenizer is not None and draft_tokenizer.get_vocab() != tokenizer.get_vocab():
+        # Different vocabularies: universal assisted decoding re-tokenizes between the two.
+        kwargs.update(tokenizer=tokenizer, assistant_tokenizer=draft_tokenizer)
+    return kwargs
+
+
+def llama_cpp_draft(draft, num_tokens=10, **llama_kwargs):
+    """A llama-cpp-python draft model: prompt lookup or a small GGUF model."""
+    from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+    if draft == PROMPT_LOOKUP:
+        inner = LlamaPromptLookupDecoding(num_pred_tokens=num_tokens)
+    else:
+        inner = GGUFDraftModel(draft, num_tokens, **llama_kwargs)
+
+    class CountingDraft(LlamaDraftModel):
+        """Counts proposed tokens for SpeculationStats."""
+
+        def __init__(self):
+            self.proposed = 0
+
+        def __call__(self, input_ids, **kwargs):
+            tokens = inner(input_ids, **kwargs)
+            self.proposed += len(tokens)
+            return tokens
+
+    return CountingDraft()
+
+
+class GGUFDraftModel:
+    """Greedy proposals from a small GGUF model; must share the target's vocabulary.
+
+    Its KV cache is reused across calls for the common prefix (Llama.generate
+    does this when the new tokens extend what it evaluated before).
+    """
+
+    def __init__(self, model_path, num_pred_tokens=10, **llama_kwargs):
+        from llama_cpp import Llama
+
+        llama_kwargs.setdefault("verbose", False)
+        self.llm = Llama(model_path=model_path, **llama_kwargs)
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids, **kwargs):
+        import numpy as np
+
+        tokens = []
+        for token in self.llm.generate(input_ids.tolist(), top_k=1, temp=0.0):
+            tokens.append(token)
+            if len(tokens) >= self.num_pred_tokens or token == self.llm.token_eos():
+                break
+        return np.array(tokens, dtype=np.intc)
+
+
+@contextmanager
+def count_llama_cpp_passes(llm):
+    """Count every llm.eval batch as one target pass while the block runs; yields a getter for the count.
+
+    llama.cpp's perf counters count tokens, not batches, so llm.eval is
+    wrapped instead, and restored on exit.
+    """
+    shadowed = vars(llm).get("eval")
+    original = llm.eval
+    passes = [0]
+
+    def eval(tokens):
+        passes[0] += 1
+        return original(tokens)
+
+    llm.eval = eval
+    try:
+        yield lambda: passes[0]
+    finally:
+        if shadowed is None:
+            del llm.eval
+        else:
+            llm.eval = shadowed
+
+
+def build_tiny_draft(target_path):
+    """A draft for the tiny bench model: its first layer only, sharing embeddings and head."""
+    path = target_path + "-draft"
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    model = AutoModelForCausalLM.from_pretrained(target_path)
+    model.model.layers = model.model.layers[:1]
+    model.config.num_hidden_layers = 1
+    tmp = path + ".tmp"
+    model.save_pretrained(tmp)
+    AutoTokenizer.from_pretrained(target_path).save_pretrained(tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def _run(backend, prompts):
+    """Stream every prompt; returns (decode tokens/sec, per-request acceptance rates)."""
+    tokens, seconds, acceptance = 0, 0.0, []
+    for prompt in prompts:
+        for _ in backend.stream(prompt):
+            pass
+        tokens += backend.last_metrics.eval_tokens or 0
+        seconds += backend.last_metrics.eval_seconds or 0.0
+        acceptance.append(backend.last_metrics.draft_acceptance)
+    return (tokens / seconds if seconds else None), acceptance
+
+
+if __name__ == "__main__":
+    from genaiprompt.backends import create_backend
+    from genaiprompt.bench_backends import BENCH_PROMPTS, build_tiny_model
+
+    parser = argparse.ArgumentParser(description="Compare plain and speculative decoding.")
+    parser.add_argument("--target", help="HF repo id, model directory or .gguf file")
+    parser.add_argument("--draft", help=f"draft model (same kind as the target) or '{PROMPT_LOOKUP}'")
+    parser.add_argument("--tiny", action="store_true", help="use the tiny bench model and a one-layer draft of it")
+    parser.add_argument("--draft-tokens", type=int, help="tokens proposed per round")
+    parser.add_argument("--tokens", type=int, default=64, help="tokens generated per prompt")
+    args = parser.parse_args()
+
+    if args.tiny:
+        args.target = build_tiny_model()
+        args.draft = args.draft or build_tiny_draft(args.target)
+    if not args.target or not args.draft:
+        parser.error("--target and --draft are required (or --tiny)")
+
+    if args.target.endswith(".gguf"):
+        preset = {"backend": "llama_cpp", "model": args.target, "n_ctx": 4096, "verbose": False,
+                  "params": {"max_tokens": args.tokens, "temperature": 0.0}}
+    else:
+        preset = {"backend": "transformers", "model": args.target, "token": os.environ.get("HF_TOKEN"),
+                  "params": {"max_new_tokens": args.tokens, "min_new_tokens": args.tokens, "do_sample": False}}
+
+    print(f"{'mode':<12} {'tok/s':>8} {'speedup':>8} {'acceptance':>11}")
+    baseline = None
+    for mode, extra in (("plain", {}), ("speculative", {"draft_model": args.draft, "draft_tokens": args.draft_tokens})):
+        backend = create_backend({**preset, **extra})
+        backend.load()
+        try:
+            backend.generate(BENCH_PROMPTS[0])  # warm-up
+            rate, acceptance = _run(backend, BENCH_PROMPTS)
+        finally:
+            backend.close()
+        if mode == "plain":
+            baseline = rate
+        rates = [a for a in acceptance if a is not None]
+        accepted = f"{sum(rates) / len(rates):.0%}" if rates else "-"
+        speedup = f"{(rate or 0) / baseline:7.2f}x" if baseline else f"{'-':>8}"
+        print(f"{mode:<12} {rate or 0:8.1f} {speedup} {accepted:>11}")
+        if backend.last_note:
+            print(f"  last request: {backend.last_note}")
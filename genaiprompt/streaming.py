@@ -0,0 +1,153 @@
+"""
+Token streaming for the llama.cpp and transformers scripts.
+
+stream_llama_cpp() wraps llm(..., stream=True); stream_transformers() runs
+model.generate() on a background thread feeding a TextIteratorStreamer.
+Both tick a TokenTimer once per generated token, so time to first token and
+per-token latency are measured the same way for either backend and end up
+in the usual GenerationMetrics.
+"""
+
+import sys
+import threading
+import time
+
+from genaiprompt.metrics import GenerationMetrics
+
+
+class ThrottledProgress:
+    """Render a "Tokens | Elapsed" status line on a time or token budget.
+
+    The line is redrawn at most every `interval` seconds or every
+    `every_tokens` tokens, whichever comes first; the clock is only read
+    every `check_every` tokens so per-token cost stays a counter bump.
+    With status=False nothing is drawn and the budget only paces flushes
+    of `out`, for callers that write the tokens themselves.
+    """
+
+    def __init__(self, interval=0.2, every_tokens=64, check_every=4, out=None, status=True):
+        self.interval = interval
+        self.every_tokens = every_tokens
+        self.check_every = check_every
+        self.out = out or sys.stdout
+        self.status = status
+        self.start = time.monotonic()
+        self._last_time = self.start
+        self._last_count = 0
+
+    def update(self, token_count):
+        if token_count - self._last_count >= self.every_tokens:
+            self.render(token_count)
+        elif token_count % self.check_every == 0:
+            now = time.monotonic()
+            if now - self._last_time >= self.interval:
+                self.render(token_count, now)
+
+    def render(self, token_count, now=None):
+        now = now or time.monotonic()
+        self._last_time, self._last_count = now, token_count
+        if self.status:
+            self.out.write(f"\rTokens: {token_count} | Elapsed: {now - self.start:.1f}s")
+        self.out.flush()
+
+
+class TokenTimer:
+    """Timestamps the first and last generated token of one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first = self.last = None
+        self.count = 0
+
+    def tick(self, n=1):
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        self.last = now
+        self.count += n
+
+    @property
+    def ttft(self):
+        return self.first - self.start if self.first is not None else None
+
+    def to_metrics(self, backend, model, prompt_tokens=None, load_seconds=None):
+        """Metrics for a streamed request.
+
+        The decode rate is measured between the first and last token, so
+        eval_tokens counts the tokens generated after the first one.
+        """
+        metrics = GenerationMetrics(backend=backend, model=model, ttft=self.ttft, prompt_tokens=prompt_tokens,
+                                    generated_tokens=self.count, load_seconds=load_seconds,
+                                    total_seconds=time.perf_counter() - self.start)
+        if self.count > 1:
+            metrics.eval_tokens = self.count - 1
+            metrics.eval_seconds = self.last - self.first
+        return metrics
+
+
+def stream_llama_cpp(llm, prompt, timer=None, **params):
+    """Yield completion text chunks from llama.cpp as they are sampled."""
+    for chunk in llm(prompt, stream=True, **params):
+        if timer:
+            timer.tick()
+        text = chunk["choices"][0]["text"]
+        if text:
+            yield text
+
+
+def stream_transformers(model, tokenizer, inputs, timer=None, /, **generate_kwargs):
+    """Yield decoded text from model.generate() as tokens are produced.
+
+    generate() runs on a background thread; any exception it raises is
+    re-raised here once the stream ends. The leading arguments are
+    positional-only so generate_kwargs may carry its own `tokenizer`
+    (universal assisted decoding).
+    """
+    from transformers import TextIteratorStreamer
+
+    class TimedStreamer(TextIteratorStreamer):
+        def put(self, value):
+            if timer and not self.next_tokens_are_prompt:
+                timer.tick(value.numel())
+            super().put(value)
+
+    streamer = TimedStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    errors = []
+
+    def run():
+        try:
+            model.generate(**inputs, **generate_kwargs, streamer=streamer)
+        except Exception as e:
+            errors.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    for text in streamer:
+        if text:
+            yield text
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def echo(chunks, out=None, clear=0):
+    """Write text chunks to `out` as they arrive and collect them.
+
+    Flushes are paced by ThrottledProgress rather than done per token. When
+    `clear` is set, that many characters of the current line (e.g. a
+    "Calculating response..." notice) are blanked before the first chunk.
+    Returns the joined text.
+    """
+    out = out or sys.stdout
+    pacer = ThrottledProgress(out=out, status=False)
+    parts = []
+    for chunk in chunks:
+        if not parts and clear:
+            out.write("\r" + " " * clear + "\r")
+        parts.append(chunk)
+        out.write(chunk)
+        pacer.update(len(parts))
+    out.write("\n")
+    out.flush()
+    return "".join(parts)
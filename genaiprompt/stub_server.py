@@ -0,0 +1,170 @@
+"""
+Minimal local stand-in for the Ollama HTTP API, for benchmarks and offline runs.
+
+Serves /api/tags, /api/pull and a streamed /api/generate that answers every
+prompt with a fixed number of NDJSON tokens (placeholders, or the words of a
+captured answer with --replay); a non-streamed empty prompt is treated as a
+warm-up and reports a simulated load_duration. Connections are HTTP/1.1
+keep-alive with chunked transfer encoding, like the real server.
+
+    python -m genaiprompt.stub_server --port 11434 --tokens 50
+    python -m genaiprompt.stub_server --replay prompt-for-cli-prompt-ollama-llama4.py.txt --token-rate 20
+"""
+
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Flush every token immediately; Nagle + delayed ACK would add ~40 ms to TTFT.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _send_chunk(self, payload):
+        data = json.dumps(payload).encode() + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": f"{m}:latest", "size": len(m) * 1_000_000_000} for m in sorted(self.server.models)]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        request = self._read_json()
+        if self.path == "/api/generate":
+            model = request.get("model", "")
+            if model.split(":")[0] not in self.server.models:
+                self.send_error(404, f"model '{model}' not found")
+                return
+            if request.get("keep_alive") == 0:
+                self.server.loaded.discard(model)
+                self._send_json({"model": model, "response": "", "done": True, "done_reason": "unload"})
+                return
+            if not request.get("stream", True):
+                load_ns = 0 if model in self.server.loaded else int(self.server.load_delay * 1e9)
+                time.sleep(load_ns / 1e9)
+                self.server.loaded.add(model)
+                self._send_json({"model": model, "response": "", "done": True, "load_duration": load_ns, "total_duration": load_ns})
+                return
+            self._start_stream()
+            start = time.perf_counter_ns()
+            for token in itertools.islice(self.server.replay, self.server.tokens):
+                if self.server.token_delay:
+                    time.sleep(self.server.token_delay)
+                self._send_chunk({"model": model, "response": token, "done": False})
+            elapsed = time.perf_counter_ns() - start
+            prompt_tokens = len(request.get("prompt", "").split()) or 1
+            self._send_chunk({
+                "model": model, "response": "", "done": True,
+                "prompt_eval_count": prompt_tokens, "prompt_eval_duration": prompt_tokens * 1_000_000,
+                "eval_count": self.server.tokens, "eval_duration": elapsed or 1,
+                "load_duration": 0, "total_duration": elapsed,
+            })
+            self._end_stream()
+        elif self.path == "/api/pull":
+            self._start_stream()
+            self._send_chunk({"status": "pulling manifest"})
+            for completed in range(0, 101, 20):
+                time.sleep(self.server.pull_delay / 6)
+                self._send_chunk({"status": "pulling blob", "digest": "sha256:stub", "total": 100, "completed": completed})
+            for status in ("verifying sha256 digest", "success"):
+                self._send_chunk({"status": status})
+            self.server.models.add(request.get("name", "").split(":")[0])
+            self._end_stream()
+        else:
+            self.send_error(404)
+
+
+def load_replay(path):
+    """Split a captured answer into Ollama-sized tokens (a word with its leading whitespace)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return re.findall(r"\s*\S+", f.read())
+
+
+class _Replay:
+    """Token source for every response: the replay tokens (repeated as needed) or tok0, tok1, ..."""
+
+    def __init__(self, tokens=None):
+        self.tokens = tokens
+
+    def __iter__(self):
+        if self.tokens:
+            return itertools.cycle(self.tokens)
+        return (f"tok{i} " for i in itertools.count())
+
+
+def start_stub_server(host="127.0.0.1", port=0, tokens=50, token_delay=0.0, models=("llama4", "mistral"),
+                      load_delay=0.0, pull_delay=0.0, replay=None):
+    """Start the stub server on a background thread and return it.
+
+    `replay` is a list of token strings to stream instead of placeholders
+    (see load_replay). The bound address is server.server_address; call
+    server.shutdown() to stop.
+    """
+    server = ThreadingHTTPServer((host, port), StubOllamaHandler)
+    server.daemon_threads = True
+    server.tokens = tokens
+    server.token_delay = token_delay
+    server.models = set(models)
+    server.loaded = set()
+    server.load_delay = load_delay
+    server.pull_delay = pull_delay
+    server.replay = _Replay(replay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stub Ollama server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--tokens", type=int, default=50, help="tokens streamed per response")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between tokens")
+    parser.add_argument("--token-rate", type=float, help="tokens per second (overrides --token-delay)")
+    parser.add_argument("--replay", help="text file whose words are streamed as the response tokens")
+    parser.add_argument("--models", default="llama4,mistral", help="comma-separated models reported as present")
+    parser.add_argument("--load-delay", type=float, default=0.0, help="simulated model load seconds on warm-up")
+    parser.add_argument("--pull-delay", type=float, default=0.0, help="simulated seconds per /api/pull")
+    args = parser.parse_args()
+    models = [m for m in args.models.split(",") if m]
+    token_delay = 1 / args.token_rate if args.token_rate else args.token_delay
+    replay = load_replay(args.replay) if args.replay else None
+    server = start_stub_server(args.host, args.port, args.tokens, token_delay, models, args.load_delay, args.pull_delay,
+                               replay)
+    print(f"Stub Ollama server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
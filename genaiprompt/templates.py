@@ -0,0 +1,125 @@
+"""
+Prompt templates and the context budget for the transformers backend.
+
+A PromptTemplate turns a user prompt into input ids, either through a
+format string such as DEFAULT_TEMPLATE ("Question: {prompt}\\nAnswer:") or,
+with template="chat", through the model's own chat template
+(tokenizer.apply_chat_template with an optional system prompt), which is
+what Instruct/chat models are trained on.
+
+The text around the prompt is the same for every request, so it is
+tokenized once per system prompt and cached; a request only tokenizes the
+user's text and splices it between the cached prefix and suffix ids.
+Whether splicing reproduces tokenizing the whole text is checked once on a
+few probe prompts; with tokenizers where it does not (e.g. SentencePiece
+adding a word-start marker to the spliced text) every request tokenizes the
+full text instead.
+
+fit() enforces the context budget before dispatch: a prompt that leaves no
+room in the context window raises PromptTooLong, and max_new_tokens is
+clamped to what is left. Answers are decoded from the new token slice only
+(see TransformersBackend), never by splitting the decoded text.
+"""
+
+from collections import OrderedDict
+
+CHAT = "chat"
+DEFAULT_TEMPLATE = "Question: {prompt}\nAnswer:"
+SENTINEL = "@@GENAIPROMPT_PROMPT@@"
+PROBES = ("Why is the sky blue?", "Hi", "Answer: 42\nQuestion: and then?", " leading and trailing spaces ",
+          "naïve café, 東京")
+MAX_CACHED_PREFIXES = 32
+
+
+class PromptTooLong(ValueError):
+    pass
+
+
+def fit_context(prompt_tokens, max_new_tokens, n_ctx):
+    """max_new_tokens clamped so prompt and answer fit in n_ctx; raises PromptTooLong if nothing fits."""
+    if not n_ctx:
+        return max_new_tokens
+    room = n_ctx - prompt_tokens
+    if room <= 0:
+        raise PromptTooLong(f"Prompt is {prompt_tokens} tokens; the context window is {n_ctx}")
+    if max_new_tokens is None:
+        return None
+    return min(max_new_tokens, room)
+
+
+class PromptTemplate:
+    """Tokenize prompts for one model with cached template prefixes."""
+
+    def __init__(self, tokenizer, template=DEFAULT_TEMPLATE, system_prompt=None, n_ctx=None):
+        if template == CHAT and not getattr(tokenizer, "chat_template", None):
+            raise ValueError("template='chat' but the tokenizer has no chat template")
+        if template != CHAT and "{prompt}" not in template:
+            raise ValueError("A format-string template needs a {prompt} placeholder")
+        self.tokenizer = tokenizer
+        self.template = template
+        self.system_prompt = system_prompt
+        self.n_ctx = n_ctx
+        # system prompt -> (prefix ids, whitespace before the prompt, strip prompt?, suffix ids),
+        # or None when splicing is inexact
+        self._parts = OrderedDict()
+
+    @property
+    def chat(self):
+        return self.template == CHAT
+
+    def render(self, prompt, system_prompt=None):
+        """The full prompt text sent to the model."""
+        if not self.chat:
+            return self.template.replace("{prompt}", prompt)
+        system_prompt = system_prompt if system_prompt is not None else self.system_prompt
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        messages.append({"role": "user", "content": prompt})
+        return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def _tokenize(self, text, special):
+        return self.tokenizer(text, add_special_tokens=special)["input_ids"]
+
+    def _full(self, prompt, system_prompt):
+        # Chat templates already contain BOS and friends.
+        return self._tokenize(self.render(prompt, system_prompt), special=not self.chat)
+
+    def _spliced(self, parts, prompt):
+        prefix, lead, strip, suffix = parts
+        return prefix + self._tokenize(lead + (prompt.strip() if strip else prompt), special=False) + suffix
+
+    def _split(self, system_prompt):
+        text = self.render(SENTINEL, system_prompt)
+        if text.count(SENTINEL) != 1:
+            return None
+        prefix, suffix = text.split(SENTINEL)
+        # Whitespace before the prompt merges into its first token with most BPE vocabularies
+        # ("Question: Why" is "Question", ":", " Why"), so it is tokenized with the prompt.
+        lead = prefix[len(prefix.rstrip()):]
+        prefix = prefix[:len(prefix) - len(lead)]
+        # Chat templates often trim the message content.
+        strip = SENTINEL in text and f" {SENTINEL} " not in self.render(f" {SENTINEL} ", system_prompt)
+        parts = (self._tokenize(prefix, special=not self.chat), lead, strip, self._tokenize(suffix, special=False))
+        if any(self._spliced(parts, probe) != self._full(probe, system_prompt) for probe in PROBES):
+            return None
+        return parts
+
+    def cached_parts(self, system_prompt=None):
+        """Cached template tokens for a system prompt, or None when prompts must be tokenized whole."""
+        key = system_prompt if system_prompt is not None else self.system_prompt
+        if key in self._parts:
+            self._parts.move_to_end(key)
+        else:
+            self._parts[key] = self._split(key)
+            if len(self._parts) > MAX_CACHED_PREFIXES:
+                self._parts.popitem(last=False)
+        return self._parts[key]
+
+    def encode(self, prompt, system_prompt=None):
+        """Input ids for a prompt, reusing the cached template ids when splicing is exact."""
+        parts = self.cached_parts(system_prompt)
+        if parts is None:
+            return self._full(prompt, system_prompt)
+        return self._spliced(parts, prompt)
+
+    def fit(self, prompt_tokens, max_new_tokens):
+        return fit_context(prompt_tokens, max_new_tokens, self.n_ctx)
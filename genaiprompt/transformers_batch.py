@@ -0,0 +1,275 @@
+"""
+Batched generation for the transformers backends.
+
+Prompts are read from a file or stdin (plain lines, or JSONL with a "prompt"
+field), grouped by token length so each padded batch wastes little padding,
+left-padded with attention masks and run through one model.generate() call
+per batch. Results are written as JSONL in input order.
+
+The batch size starts from an estimate of how many sequences' KV cache fit
+in free memory and halves whenever a batch runs out of memory.
+
+    python -m genaiprompt.transformers_batch --model MODEL [--input prompts.txt] [--batch-size 16]
+    python -m genaiprompt.transformers_batch --model MODEL --input prompts.txt --sweep 8
+
+The pytorch-*.py scripts expose the same mode with `--batch [FILE]`.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from genaiprompt.metrics import GenerationMetrics
+from genaiprompt.templates import CHAT, DEFAULT_TEMPLATE, PromptTemplate, PromptTooLong
+
+BUCKET_WINDOW = 256  # prompts read ahead and sorted by length at a time
+
+
+def read_prompts(path="-"):
+    """Yield prompts from a text/JSONL file or stdin, one per non-empty line."""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            if line.lstrip().startswith("{"):
+                try:
+                    yield json.loads(line)["prompt"]
+                    continue
+                except (ValueError, KeyError):
+                    pass
+            yield line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def prepare_tokenizer(tokenizer):
+    """Left padding keeps every prompt flush against its generated tokens."""
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+
+def free_memory_bytes(device):
+    """Free memory on the model's device, or None if it cannot be determined."""
+    import torch
+
+    if device.type == "cuda":
+        free, _ = torch.cuda.mem_get_info(device)
+        return free
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        return None
+
+
+def estimate_batch_size(model, seq_len, max_batch_size, fraction=0.5):
+    """Largest batch whose KV cache fits in `fraction` of free memory, capped at max_batch_size."""
+    free = free_memory_bytes(model.device)
+    config = model.config
+    layers = getattr(config, "num_hidden_layers", None)
+    heads = getattr(config, "num_key_value_heads", None) or getattr(config, "num_attention_heads", None)
+    hidden = getattr(config, "hidden_size", None)
+    if not (free and layers and heads and hidden):
+        return max_batch_size
+    head_dim = getattr(config, "head_dim", None) or hidden // config.num_attention_heads
+    per_sequence = 2 * layers * heads * head_dim * seq_len * model.dtype.itemsize
+    return max(1, min(max_batch_size, int(free * fraction // per_sequence)))
+
+
+def bucketed(prompts, template, window=BUCKET_WINDOW):
+    """Yield lists of (index, prompt, input_ids) sorted by length, one window at a time."""
+    pending = []
+    for index, prompt in enumerate(prompts):
+        pending.append((index, prompt, template.encode(prompt)))
+        if len(pending) >= window:
+            yield sorted(pending, key=lambda item: len(item[2]))
+            pending = []
+    if pending:
+        yield sorted(pending, key=lambda item: len(item[2]))
+
+
+def _is_oom(error):
+    return "out of memory" in str(error).lower() or type(error).__name__ == "OutOfMemoryError"
+
+
+def generate_batch(model, tokenizer, input_ids, **generate_kwargs):
+    """Run one padded generate() call on lists of token ids; return (texts, new_token_counts)."""
+    import torch
+
+    # Left padding, as prepare_tokenizer() sets up.
+    width = max(len(ids) for ids in input_ids)
+    inputs = {
+        "input_ids": torch.tensor([[tokenizer.pad_token_id] * (width - len(ids)) + ids for ids in input_ids]),
+        "attention_mask": torch.tensor([[0] * (width - len(ids)) + [1] * len(ids) for ids in input_ids]),
+    }
+    inputs = {k: v.to(model.device) for k, v in inputs.items()}
+    with torch.inference_mode():
+        output_ids = model.generate(**inputs, **generate_kwargs, pad_token_id=tokenizer.pad_token_id)
+    new_ids = output_ids[:, inputs["input_ids"].shape[1]:]
+    texts = tokenizer.batch_decode(new_ids, skip_special_tokens=True)
+    counts = (new_ids != tokenizer.pad_token_id).sum(dim=1).tolist()
+    return [t.strip() for t in texts], counts
+
+
+class BatchRunner:
+    def __init__(self, model, tokenizer, model_name, max_batch_size=16, template=DEFAULT_TEMPLATE,
+                 recorder=None, **generate_kwargs):
+        self.model = model
+        self.tokenizer = prepare_tokenizer(tokenizer)
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.template = template if isinstance(template, PromptTemplate) else PromptTemplate(tokenizer, template)
+        self.recorder = recorder
+        self.generate_kwargs = generate_kwargs
+        self.batch_size = None
+
+    def _run(self, items):
+        """Generate for items, splitting the batch on OOM. Yields (index, prompt, text, tokens)."""
+        start = time.perf_counter()
+        try:
+            texts, counts = generate_batch(self.model, self.tokenizer, [ids for _, _, ids in items],
+                                           **self.generate_kwargs)
+        except Exception as e:
+            if not _is_oom(e) or len(items) == 1:
+                raise
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            self.batch_size = max(1, len(items) // 2)
+            print(f"Out of memory at batch size {len(items)}; retrying with {self.batch_size}.", file=sys.stderr)
+            for i in range(0, len(items), self.batch_size):
+                yield from self._run(items[i:i + self.batch_size])
+            return
+        elapsed = time.perf_counter() - start
+        if self.recorder:
+            self.recorder.record(GenerationMetrics(
+                backend="transformers", model=self.model_name, prompt_tokens=sum(len(ids) for _, _, ids in items),
+                eval_tokens=sum(counts), generated_tokens=sum(counts), eval_seconds=elapsed, total_seconds=elapsed,
+            ))
+        for (index, prompt, _), text, count in zip(items, texts, counts):
+            yield index, prompt, text, count
+
+    def _rejected(self, window):
+        """Drop prompts that leave no room for max_new_tokens in the context window; yields their errors."""
+        max_new = self.generate_kwargs.get("max_new_tokens") or 1
+        n_ctx = self.template.n_ctx
+        for item in [item for item in window if n_ctx and len(item[2]) + max_new > n_ctx]:
+            window.remove(item)
+            error = PromptTooLong(f"Prompt is {len(item[2])} tokens; with max_new_tokens={max_new} it does not fit "
+                                  f"the context window of {n_ctx}")
+            yield item[0], item[1], error, 0
+
+    def run(self, prompts):
+        """Yield (index, prompt, response, new_tokens) in input order.
+
+        For prompts that do not fit the context budget the response is a PromptTooLong.
+        """
+        done = {}
+        next_index = 0
+        max_new = self.generate_kwargs.get("max_new_tokens", 128)
+        for window in bucketed(prompts, self.template):
+            for index, prompt, error, count in self._rejected(window):
+                done[index] = (prompt, error, count)
+            i = 0
+            while i < len(window):
+                if self.batch_size is None:
+                    self.batch_size = estimate_batch_size(self.model, len(window[-1][2]) + max_new,
+                                                          self.max_batch_size)
+                batch = window[i:i + self.batch_size]
+                i += len(batch)
+                for index, prompt, text, count in self._run(batch):
+                    done[index] = (prompt, text, count)
+                while next_index in done:
+                    prompt, text, count = done.pop(next_index)
+                    yield next_index, prompt, text, count
+                    next_index += 1
+            while next_index in done:
+                prompt, text, count = done.pop(next_index)
+                yield next_index, prompt, text, count
+                next_index += 1
+
+    def write_jsonl(self, prompts, out):
+        """Write one JSON object per prompt to `out`, in input order; returns the count."""
+        count = 0
+        for index, prompt, text, tokens in self.run(prompts):
+            if isinstance(text, PromptTooLong):
+                out.write(json.dumps({"index": index, "prompt": prompt, "error": str(text)}) + "\n")
+            else:
+                out.write(json.dumps({"index": index, "prompt": prompt, "response": text, "tokens": tokens}) + "\n")
+            out.flush()
+            count += 1
+        return count
+
+    def sweep(self, prompts, max_batch_size):
+        """Print generated tokens/sec for batch sizes 1, 2, 4, ... up to max_batch_size."""
+        prompts = list(prompts)
+        size = 1
+        results = []
+        while True:
+            self.batch_size = size
+            start = time.perf_counter()
+            tokens = sum(count for _, _, _, count in self.run(prompts))
+            elapsed = time.perf_counter() - start
+            results.append((size, tokens / elapsed if elapsed else 0.0))
+            print(f"batch size {size:>3}: {tokens:>6} tokens in {elapsed:7.2f}s = {results[-1][1]:8.1f} tok/s")
+            if size >= max_batch_size:
+                break
+            size = min(size * 2, max_batch_size)
+        return results
+
+
+def run_batch_mode(model, tokenizer, model_name, source, generate_kwargs, out=None, recorder=None,
+                   max_batch_size=16, template=DEFAULT_TEMPLATE):
+    """Write JSONL responses for the prompts in `source` (a file or "-"); used by this module's command line.
+
+    The pytorch-*.py scripts go through genaiprompt.cli, whose --batch runs the
+    same BatchRunner via TransformersBackend.batch().
+    """
+    runner = BatchRunner(model, tokenizer, model_name, max_batch_size=max_batch_size, template=template,
+                         recorder=recorder, **generate_kwargs)
+    start = time.perf_counter()
+    count = runner.write_jsonl(read_prompts(source), out or sys.stdout)
+    print(f"Generated {count} responses in {time.perf_counter() - start:.1f}s "
+          f"(final batch size {runner.batch_size}).", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched transformers generation to JSONL.")
+    parser.add_argument("--model", required=True, help="HF repo id or local model directory")
+    parser.add_argument("--input", default="-", help="prompts file (text or JSONL), '-' for stdin")
+    parser.add_argument("--output", default="-", help="JSONL output file, '-' for stdout")
+    parser.add_argument("--batch-size", type=int, default=16, help="upper bound on the adaptive batch size")
+    parser.add_argument("--max-new-tokens", type=int, default=150)
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE, help=f"format string with {{prompt}}, or '{CHAT}'")
+    parser.add_argument("--n-ctx", type=int, help="context window (default: the model's)")
+    parser.add_argument("--sample", action="store_true", help="sample instead of greedy decoding")
+    parser.add_argument("--sweep", type=int, metavar="N", help="report tokens/sec for batch sizes 1..N and exit")
+    parser.add_argument("--device", default=None, help="cpu, cuda, ... (default: cuda if available)")
+    args = parser.parse_args()
+
+    import torch
+
+    from genaiprompt.fast_load import load_causal_lm
+
+    device = args.device or ("cuda" if torch.cuda.is_available() else "cpu")
+    model, tokenizer, _ = load_causal_lm(args.model, "auto", device)
+    generate_kwargs = {"max_new_tokens": args.max_new_tokens, "do_sample": args.sample}
+    template = PromptTemplate(tokenizer, args.template,
+                              n_ctx=args.n_ctx or getattr(model.config, "max_position_embeddings", None))
+    if args.sweep:
+        runner = BatchRunner(model, tokenizer, args.model, template=template, **generate_kwargs)
+        runner.sweep(read_prompts(args.input), args.sweep)
+    else:
+        out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+        try:
+            run_batch_mode(model, tokenizer, args.model, args.input, generate_kwargs, out=out,
+                           max_batch_size=args.batch_size, template=template)
+        finally:
+            if out is not sys.stdout:
+                out.close()
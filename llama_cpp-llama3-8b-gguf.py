@@ -2,30 +2,11 @@
 
 #pip install llama-cpp-python
 
-from llama_cpp import Llama
 import sys
-import time
 
-llm = Llama(
-    model_path="./meta-llama-3-8b.Q4_K_M.gguf",  # Update to your downloaded file
-    n_ctx=4096,
-    n_gpu_layers=-1,  # Full GPU offload
-    verbose=False,
-)
+from genaiprompt.cli import main
 
-while True:
-    prompt = input("\nEnter your prompt (or type 'exit' to quit):\n> ")
-    if prompt.strip().lower() == "exit":
-        break
-
-    print("Calculating response...", end="", flush=True)
-    start = time.time()
-    output = llm(
-        prompt,
-        max_tokens=256,
-        temperature=0.7,
-        top_p=0.95,
-    )
-    elapsed = time.time() - start
-    print(f"\rResponse ready in {elapsed:.1f} seconds.\n")
-    print(output["choices"][0]["text"].strip())
\ No newline at end of file
+# Same as: python -m genaiprompt --model llama3-8b-gguf (see --help for the options)
+# Threads, batch sizes and mmap/mlock come from the profile saved by: python -m genaiprompt.llama_cpp_tune --model llama3-8b-gguf
+if __name__ == "__main__":
+    sys.exit(main(["--model", "llama3-8b-gguf"] + sys.argv[1:]))
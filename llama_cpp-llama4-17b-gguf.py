@@ -19,29 +19,11 @@ or
 pip install llama-cpp-python --force-reinstall --no-cache-dir --prefer-binary --extra-index-url https://jllllll.github.io/llama-cpp-python-cuBLAS-wheels/AVX2
 """
 
-from llama_cpp import Llama
-import time
-
-llm = Llama(
-    model_path="./Llama-4-Scout-17B-6E-Instruct.i1-Q4_K_S.gguf",  # Update path!
-    n_ctx=4096,
-    n_gpu_layers=-1,  # Enable full GPU offload 
-    verbose=False
-)
-
-while True:
-    prompt = input("\nEnter your prompt (or type 'exit' to quit):\n> ")
-    if prompt.strip().lower() == "exit":
-        break
-
-    print("Calculating response...", end="", flush=True)
-    start = time.time()
-    output = llm(
-        prompt,
-        max_tokens=256,
-        temperature=0.7,
-        top_p=0.95,
-    )
-    elapsed = time.time() - start
-    print(f"\rResponse ready in {elapsed:.1f} seconds.\n")
-    print(output["choices"][0]["text"].strip())
\ No newline at end of file
+import sys
+
+from genaiprompt.cli import main
+
+# Same as: python -m genaiprompt --model llama4-17b-gguf (see --help for the options)
+# Threads, batch sizes and mmap/mlock come from the profile saved by: python -m genaiprompt.llama_cpp_tune --model llama4-17b-gguf
+if __name__ == "__main__":
+    sys.exit(main(["--model", "llama4-17b-gguf"] + sys.argv[1:]))
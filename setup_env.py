@@ -1,12 +1,45 @@
+import argparse
+import ast
+import hashlib
+import json
 import os
 import sys
 import subprocess
+import sysconfig
 import platform
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from genaiprompt.paths import cache_path
+
+STDLIB_MODULES = set(getattr(sys, "stdlib_module_names", ()))
+# Import names whose PyPI distribution is called something else.
+IMPORT_TO_DISTRIBUTION = {
+    "llama_cpp": "llama-cpp-python",
+    "huggingface_hub": "huggingface-hub",
+    "yaml": "PyYAML",
+    "PIL": "Pillow",
+    "sklearn": "scikit-learn",
+    "cv2": "opencv-python",
+    "bs4": "beautifulsoup4",
+    "dateutil": "python-dateutil",
+    "dotenv": "python-dotenv",
+}
+SKIP_DIRS = {"__pycache__", "venv", "myenv", "node_modules", "build", "dist"}
+CACHE_VERSION = 1
+_PACKAGES_DISTRIBUTIONS = None
+
+def get_python_executable(venv_dir):
+    """Path of the virtual environment's interpreter."""
+    if platform.system() == "Windows":
+        return os.path.join(venv_dir, "Scripts", "python.exe")
+    return os.path.join(venv_dir, "bin", "python")
 
 def create_virtual_environment(venv_dir):
     """Create a virtual environment if it doesn't already exist."""
-    if not os.path.exists(venv_dir):
+    # A directory without an interpreter (e.g. left over from an aborted run) is not a venv yet.
+    if not os.path.exists(get_python_executable(venv_dir)):
         print(f"Creating virtual environment in: {venv_dir}")
         try:
             subprocess.check_call([sys.executable, "-m", "venv", venv_dir])
@@ -51,31 +84,191 @@ def install_build_tools(pip_executable):
         print(f"Error: Failed to install build tools. {e}")
         sys.exit(1)
 
-def extract_dependencies_from_files(folder_path):
-    """Extract dependencies from all Python files in the folder."""
-    dependencies = set()
+def _local_modules(folder_path):
+    """Top-level names importable from the project folder itself (scripts and packages)."""
+    names = set()
+    for entry in os.listdir(folder_path):
+        path = os.path.join(folder_path, entry)
+        if entry.endswith(".py"):
+            names.add(entry[:-3])
+        elif os.path.isfile(os.path.join(path, "__init__.py")):
+            names.add(entry)
+    return names
+
+def _is_stdlib(module):
+    if module in STDLIB_MODULES or module in sys.builtin_module_names:
+        return True
+    if STDLIB_MODULES:
+        return False
+    # Python < 3.10 has no sys.stdlib_module_names: look in the standard library directory.
+    stdlib = sysconfig.get_paths()["stdlib"]
+    return os.path.exists(os.path.join(stdlib, module)) or os.path.exists(os.path.join(stdlib, module + ".py"))
+
+def scan_imports(source):
+    """Top-level names of the absolute imports in one file's source, including imports inside functions."""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        # Not parseable by this interpreter; fall back to matching import lines.
+        return {m.split(".")[0] for m in re.findall(r"^\s*(?:import|from)\s+([\w\.]+)", source, re.M) if m[0] != "."}
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules.add(node.module.split(".")[0])
+    return modules
+
+def _load_cache(cache_file):
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if cache.get("version") != CACHE_VERSION:
+        cache = {"version": CACHE_VERSION}
+    cache.setdefault("files", {})
+    cache.setdefault("valid", {})
+    return cache
+
+def _save_cache(cache, cache_file):
+    tmp = cache_file + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, cache_file)
+
+def extract_dependencies_from_files(folder_path, cache=None):
+    """Extract third-party imports from all Python files in the folder.
+
+    Standard library and project-local modules are left out. With a cache
+    dict, files whose mtime and size are unchanged are not read again, and
+    files that were touched but not changed (same SHA-1) are not parsed again.
+    Returns (modules, stats).
+    """
+    files_cache = cache["files"] if cache is not None else {}
+    seen = set()
+    modules = set()
+    stats = {"files": 0, "parsed": 0}
+    for root, dirs, files in os.walk(folder_path):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d not in SKIP_DIRS]
+        for file in files:
+            if not file.endswith(".py"):
+                continue
+            file_path = os.path.join(root, file)
+            key = os.path.relpath(file_path, folder_path)
+            seen.add(key)
+            stats["files"] += 1
+            st = os.stat(file_path)
+            entry = files_cache.get(key)
+            if not entry or entry["mtime_ns"] != st.st_mtime_ns or entry["size"] != st.st_size:
+                with open(file_path, "rb") as f:
+                    data = f.read()
+                digest = hashlib.sha1(data).hexdigest()
+                if not entry or entry["sha1"] != digest:
+                    stats["parsed"] += 1
+                    found = scan_imports(data.decode("utf-8", errors="replace"))
+                    entry = {"sha1": digest, "modules": sorted(found)}
+                entry.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+                files_cache[key] = entry
+            modules.update(entry["modules"])
+    for key in set(files_cache) - seen:
+        del files_cache[key]
+    local = _local_modules(folder_path)
+    return {m for m in modules if m not in local and not _is_stdlib(m)}, stats
+
+def distribution_name(module):
+    """PyPI distribution that provides an import name (llama_cpp -> llama-cpp-python)."""
+    if module in IMPORT_TO_DISTRIBUTION:
+        return IMPORT_TO_DISTRIBUTION[module]
+    installed = _installed_distributions().get(module)
+    if installed:
+        return installed[0]
+    return module.replace("_", "-")
+
+def _installed_distributions():
+    global _PACKAGES_DISTRIBUTIONS
+    if _PACKAGES_DISTRIBUTIONS is None:
+        try:
+            from importlib.metadata import packages_distributions
+            _PACKAGES_DISTRIBUTIONS = packages_distributions()
+        except ImportError:  # Python < 3.10
+            _PACKAGES_DISTRIBUTIONS = {}
+    return _PACKAGES_DISTRIBUTIONS
+
+def _check_distribution(dependency):
+    result = subprocess.run(
+        [sys.executable, "-m", "pip", "install", dependency, "--dry-run", "--no-deps", "--quiet",
+         "--disable-pip-version-check"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return result.returncode == 0
+
+def validate_dependencies(dependencies, cache=None, max_workers=8):
+    """Validate if the dependencies are available on PyPI, several at a time.
+
+    Dependencies already validated in an earlier run (recorded in `cache`)
+    are not checked again.
+    """
+    valid_cache = cache["valid"] if cache is not None else {}
+    valid_dependencies = {d for d in dependencies if valid_cache.get(d)}
+    pending = sorted(set(dependencies) - valid_dependencies)
+    if pending:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for dependency, ok in zip(pending, pool.map(_check_distribution, pending)):
+                if ok:
+                    valid_dependencies.add(dependency)
+                    valid_cache[dependency] = True
+                else:
+                    print(f"Warning: {dependency} is not available on PyPI or cannot be installed.")
+    return valid_dependencies
+
+def discover_dependencies(folder_path, cache_file=None, max_workers=8):
+    """Scan, map and validate the project's dependencies, printing how long each step took."""
+    cache = _load_cache(cache_file) if cache_file else None
+    start = time.perf_counter()
+    modules, stats = extract_dependencies_from_files(folder_path, cache)
+    scanned = time.perf_counter()
+    print(f"Scanned {stats['files']} files in {scanned - start:.2f}s "
+          f"({stats['parsed']} parsed, {stats['files'] - stats['parsed']} from cache): {', '.join(sorted(modules))}")
+    dependencies = {distribution_name(m) for m in modules}
+    valid_dependencies = validate_dependencies(dependencies, cache, max_workers)
+    print(f"Validated {len(dependencies)} distributions in {time.perf_counter() - scanned:.2f}s")
+    if cache is not None:
+        _save_cache(cache, cache_file)
+    return valid_dependencies
+
+def benchmark_discovery(folder_path, cache_file, max_workers=8):
+    """Time the old serial discovery against the new one (cold and with a warm cache)."""
+    print("Old: regex scan of every file, serial pip --dry-run for every import name")
+    start = time.perf_counter()
+    modules = set()
     for root, _, files in os.walk(folder_path):
         for file in files:
             if file.endswith(".py"):
-                file_path = os.path.join(root, file)
-                with open(file_path, "r", encoding="utf-8") as f:
+                with open(os.path.join(root, file), "r", encoding="utf-8") as f:
                     for line in f:
                         match = re.match(r"^\s*(?:import|from)\s+([\w\.]+)", line)
                         if match:
-                            module = match.group(1).split('.')[0]  # Get the top-level module
-                            dependencies.add(module)
-    return dependencies
-
-def validate_dependencies(dependencies):
-    """Validate if the dependencies are available on PyPI."""
-    valid_dependencies = set()
-    for dependency in dependencies:
-        try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", dependency, "--dry-run"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            valid_dependencies.add(dependency)
-        except subprocess.CalledProcessError:
-            print(f"Warning: {dependency} is not available on PyPI or cannot be installed.")
-    return valid_dependencies
+                            modules.add(match.group(1).split(".")[0])
+    for module in sorted(modules):
+        # The original command: resolves dependencies too, unlike _check_distribution().
+        subprocess.run([sys.executable, "-m", "pip", "install", module, "--dry-run"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    old = time.perf_counter() - start
+    print(f"  {len(modules)} names checked in {old:.2f}s")
+    timings = []
+    for label in ("cold cache", "warm cache"):
+        if label == "cold cache" and os.path.exists(cache_file):
+            os.remove(cache_file)
+        print(f"New ({label}):")
+        start = time.perf_counter()
+        discover_dependencies(folder_path, cache_file, max_workers)
+        timings.append(time.perf_counter() - start)
+        print(f"  total {timings[-1]:.2f}s")
+    print(f"Speedup: {old / timings[0]:.1f}x cold, {old / timings[1]:.1f}x warm")
+
+def _canonical(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
 
 def update_requirements_file(dependencies, requirements_file="requirements.txt"):
     """Update the requirements.txt file with the extracted dependencies."""
@@ -85,11 +278,12 @@ def update_requirements_file(dependencies, requirements_file="requirements.txt")
         with open(requirements_file, "r", encoding="utf-8") as f:
             existing_dependencies = set(line.strip() for line in f if line.strip())
 
-    # Combine existing and new dependencies
-    all_dependencies = existing_dependencies.union(dependencies)
+    # Combine existing and new dependencies; an existing line may pin a version.
+    existing_names = {_canonical(re.split(r"[\s<>=!~;\[]", line, 1)[0]) for line in existing_dependencies}
+    all_dependencies = existing_dependencies.union(d for d in dependencies if _canonical(d) not in existing_names)
 
     with open(requirements_file, "w", encoding="utf-8") as f:
-        for dependency in sorted(all_dependencies):
+        for dependency in sorted(all_dependencies, key=str.lower):
             f.write(f"{dependency}\n")
     print(f"{requirements_file} has been updated successfully!")
 
@@ -118,8 +312,22 @@ def print_activation_instructions(venv_dir):
     print("Note: You must activate the virtual environment before running any Python scripts that depend on it.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the virtual environment and install the project's dependencies.")
+    parser.add_argument("--venv", default="../myenv", help="virtual environment directory")
+    parser.add_argument("--jobs", type=int, default=8, help="dependencies validated at once")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="only time the old and new dependency discovery, without installing anything")
+    args = parser.parse_args()
+
     # Define the virtual environment directory
-    venv_dir = os.path.abspath("../myenv")  # Use an absolute path for reliability
+    venv_dir = os.path.abspath(args.venv)  # Use an absolute path for reliability
+    project_folder = os.path.abspath(".")  # Current folder
+    # Scan and validation results are kept outside the venv, so caching never creates the venv directory.
+    cache_file = cache_path("setup_env_cache.json")
+
+    if args.benchmark:
+        benchmark_discovery(project_folder, cache_file, args.jobs)
+        sys.exit(0)
 
     # Step 1: Create virtual environment
     create_virtual_environment(venv_dir)
@@ -133,12 +341,8 @@ if __name__ == "__main__":
     # Step 4: Ensure build tools (setuptools and wheel) are installed
     install_build_tools(pip_executable)
 
-    # Step 5: Extract dependencies from Python files
-    project_folder = os.path.abspath(".")  # Current folder
-    dependencies = extract_dependencies_from_files(project_folder)
-
-    # Step 6: Validate dependencies
-    valid_dependencies = validate_dependencies(dependencies)
+    # Step 5 and 6: Extract dependencies from Python files and validate them
+    valid_dependencies = discover_dependencies(project_folder, cache_file, args.jobs)
 
     # Step 7: Update requirements.txt
     update_requirements_file(valid_dependencies)
@@ -149,4 +353,4 @@ if __name__ == "__main__":
     # Step 9: Print activation instructions
     print_activation_instructions(venv_dir)
 
-    print("Environment setup completed successfully!")
\ No newline at end of file
+    print("Environment setup completed successfully!")
@@ -0,0 +1,12 @@
+"""Shared fixtures: the tiny random models of genaiprompt.bench_backends, built once per session."""
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def tiny_model(tmp_path_factory):
+    pytest.importorskip("transformers")
+    from genaiprompt.bench_backends import build_tiny_model
+
+    return build_tiny_model(str(tmp_path_factory.mktemp("models") / "tiny-llama"))
+
@@ -0,0 +1,48 @@
+import pytest
+
+from genaiprompt.offload_profile import faster_by_tier, profile
+from genaiprompt.router import parse_budget
+
+LAYERS = [f"model.layers.{i}" for i in range(4)]
+
+
+@pytest.fixture(scope="module")
+def tiny_model_8l(tmp_path_factory):
+    """Eight layers, enough to split over a simulated GPU, the CPU and disk."""
+    pytest.importorskip("accelerate")
+    from genaiprompt.bench_backends import build_tiny_model
+
+    return build_tiny_model(str(tmp_path_factory.mktemp("models") / "tiny-llama-8l"), layers=8)
+
+
+def _profile(model, simulate, max_memory, tmp_path):
+    return profile(model, "auto", parse_budget(max_memory) if max_memory else None, simulate,
+                   offload_folder=str(tmp_path / "offload"), tokens=4, n_ctx=64, dtype="float32")
+
+
+def test_faster_by_tier():
+    gpu = {name: 0 for name in LAYERS}
+    split = {**gpu, "model.layers.2": "cpu", "model.layers.3": "disk"}
+    assert faster_by_tier(LAYERS, split, gpu) is True
+    assert faster_by_tier(LAYERS, gpu, split) is False
+    assert faster_by_tier(LAYERS, gpu, gpu) is False
+    swapped = {**gpu, "model.layers.0": "cpu", "model.layers.3": "disk"}
+    assert faster_by_tier(LAYERS, split, swapped) is None
+
+
+def test_tight_split_recommends_more_resident_layers(tiny_model_8l, tmp_path):
+    report = _profile(tiny_model_8l, "0=1MB,cpu=400KB", "0=400KB,cpu=200KB", tmp_path)
+    assert {"0", "disk"} <= set(report["device_map"].values())
+    before, after = report["proposal"]["resident_layers"]
+    assert after > before
+    # Nothing was measured on the tiers the layers move to, so the tier order decides.
+    assert report["proposal"]["step_ms"] is None
+    assert report["proposal"]["recommended"] is True
+
+
+def test_whole_model_on_gpu_is_kept(tiny_model_8l, tmp_path):
+    report = _profile(tiny_model_8l, "0=1500KB,cpu=400KB", None, tmp_path)
+    assert set(report["device_map"].values()) == {"0"}
+    before, after = report["proposal"]["resident_layers"]
+    assert before == 8 and after < before
+    assert report["proposal"]["recommended"] is False
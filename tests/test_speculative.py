@@ -0,0 +1,138 @@
+import pytest
+
+from genaiprompt.speculative import PROMPT_LOOKUP, build_tiny_draft, count_llama_cpp_passes
+
+REPEATED_PROMPT = "the capital of france is paris . the capital of france is paris . the capital of"
+
+
+class FakeLlama:
+    def eval(self, tokens):
+        return len(tokens)
+
+
+def test_count_llama_cpp_passes_restores_eval():
+    llm = FakeLlama()
+    with count_llama_cpp_passes(llm) as passes:
+        llm.eval([1])
+        llm.eval([1, 2, 3])
+        assert passes() == 2
+    assert "eval" not in vars(llm)
+    assert llm.eval([1, 2]) == 2
+
+
+@pytest.fixture(scope="module")
+def tiny_gguf(tmp_path_factory):
+    """A 2-layer random llama GGUF with a word-level SPM vocabulary, written with the gguf package."""
+    pytest.importorskip("llama_cpp")
+    gguf = pytest.importorskip("gguf")
+    import numpy as np
+
+    from genaiprompt.bench_backends import BENCH_PROMPTS
+
+    words = sorted({w.strip("?.,'").lower() for p in BENCH_PROMPTS + [REPEATED_PROMPT] for w in p.split()} - {""})
+    tokens = ["<unk>", "<s>", "</s>"] + [f"<0x{b:02X}>" for b in range(256)] + ["▁" + w for w in words] + ["▁", "."]
+    types = [2, 3, 3] + [6] * 256 + [1] * (len(tokens) - 259)
+    n_embd, n_ff, n_head, n_layer = 64, 128, 4, 2
+
+    path = str(tmp_path_factory.mktemp("gguf") / "tiny-llama.gguf")
+    writer = gguf.GGUFWriter(path, "llama")
+    writer.add_context_length(256)
+    writer.add_embedding_length(n_embd)
+    writer.add_block_count(n_layer)
+    writer.add_feed_forward_length(n_ff)
+    writer.add_head_count(n_head)
+    writer.add_head_count_kv(n_head)
+    writer.add_layer_norm_rms_eps(1e-5)
+    writer.add_rope_dimension_count(n_embd // n_head)
+    writer.add_file_type(0)  # all float32
+    writer.add_tokenizer_model("llama")
+    writer.add_token_list(tokens)
+    writer.add_token_scores([0.0] * 259 + [-float(i) for i in range(len(tokens) - 259)])
+    writer.add_token_types(types)
+    writer.add_unk_token_id(0)
+    writer.add_bos_token_id(1)
+    writer.add_eos_token_id(2)
+
+    rng = np.random.default_rng(0)
+
+    def tensor(name, *shape):
+        writer.add_tensor(name, (rng.standard_normal(shape) * 0.1).astype(np.float32))
+
+    tensor("token_embd.weight", len(tokens), n_embd)
+    for i in range(n_layer):
+        writer.add_tensor(f"blk.{i}.attn_norm.weight", np.ones(n_embd, dtype=np.float32))
+        writer.add_tensor(f"blk.{i}.ffn_norm.weight", np.ones(n_embd, dtype=np.float32))
+        for name in ("attn_q", "attn_k", "attn_v", "attn_output"):
+            tensor(f"blk.{i}.{name}.weight", n_embd, n_embd)
+        tensor(f"blk.{i}.ffn_gate.weight", n_ff, n_embd)
+        tensor(f"blk.{i}.ffn_up.weight", n_ff, n_embd)
+        tensor(f"blk.{i}.ffn_down.weight", n_embd, n_ff)
+    writer.add_tensor("output_norm.weight", np.ones(n_embd, dtype=np.float32))
+    tensor("output.weight", len(tokens), n_embd)
+    writer.write_header_to_file()
+    writer.write_kv_data_to_file()
+    writer.write_tensors_to_file()
+    writer.close()
+    return path
+
+
+def _llama_cpp_backend(model, draft):
+    from genaiprompt.backends import create_backend
+
+    backend = create_backend({"backend": "llama_cpp", "model": model, "n_ctx": 256, "verbose": False, "tuned": False,
+                              "draft_model": draft, "draft_tokens": 4,
+                              "params": {"max_tokens": 16, "temperature": 0.0}})
+    backend.load()
+    return backend
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_llama_cpp_prompt_lookup_counters(tiny_gguf, streamed):
+    backend = _llama_cpp_backend(tiny_gguf, PROMPT_LOOKUP)
+    try:
+        if streamed:
+            "".join(backend.stream(REPEATED_PROMPT))
+        else:
+            backend.generate(REPEATED_PROMPT)
+        acceptance = backend.last_metrics.draft_acceptance
+        assert backend.draft.proposed > 0
+        assert acceptance is not None and 0.0 <= acceptance <= 1.0
+        assert "Speculative:" in backend.last_note
+        assert "eval" not in vars(backend.llm)
+    finally:
+        backend.close()
+
+
+def test_llama_cpp_self_draft_is_mostly_accepted(tiny_gguf):
+    # The target drafting for itself proposes exactly what it generates.
+    backend = _llama_cpp_backend(tiny_gguf, tiny_gguf)
+    try:
+        backend.generate(REPEATED_PROMPT)
+        assert backend.last_metrics.draft_acceptance > 0.5
+    finally:
+        backend.close()
+
+
+@pytest.mark.parametrize("draft", ["tiny-draft", PROMPT_LOOKUP])
+def test_transformers_speculative_counters(tiny_model, draft):
+    from genaiprompt.backends import create_backend
+
+    preset = {"backend": "transformers", "model": tiny_model, "torch_dtype": "float32",
+              "params": {"max_new_tokens": 12, "min_new_tokens": 12, "do_sample": False}}
+    plain = create_backend(preset)
+    plain.load()
+    expected = plain.generate(REPEATED_PROMPT)
+    plain.close()
+
+    draft_model = build_tiny_draft(tiny_model) if draft == "tiny-draft" else draft
+    backend = create_backend({**preset, "draft_model": draft_model, "draft_tokens": 4})
+    backend.load()
+    try:
+        # Greedy speculative decoding gives the plain output.
+        assert backend.generate(REPEATED_PROMPT) == expected
+        acceptance = backend.last_metrics.draft_acceptance
+        assert acceptance is None or 0.0 <= acceptance <= 1.0
+        if draft == "tiny-draft":
+            assert acceptance is not None
+    finally:
+        backend.close()
@@ -0,0 +1,25 @@
+from genaiprompt.bench_backends import BENCH_PROMPTS
+from genaiprompt.transformers_batch import BatchRunner
+
+
+def _runner(tiny_model, max_batch_size):
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    model = AutoModelForCausalLM.from_pretrained(tiny_model)
+    tokenizer = AutoTokenizer.from_pretrained(tiny_model)
+    return BatchRunner(model, tokenizer, "tiny", max_batch_size=max_batch_size, max_new_tokens=6, do_sample=False)
+
+
+def test_padded_batches_keep_input_order(tiny_model):
+    prompts = BENCH_PROMPTS + ["Hi?", BENCH_PROMPTS[4] + " " + BENCH_PROMPTS[4]]
+    runner = _runner(tiny_model, 4)
+    batched = list(runner.run(prompts))
+    single = list(_runner(tiny_model, 1).run(prompts))
+
+    assert runner.batch_size == 4
+
+    assert [index for index, *_ in batched] == list(range(len(prompts)))
+    assert [prompt for _, prompt, *_ in batched] == prompts
+    # Left padding must not change what each prompt generates.
+    assert [text for _, _, text, _ in batched] == [text for _, _, text, _ in single]
+    assert all(0 < count <= 6 for *_, count in batched)